@@ -0,0 +1,170 @@
+"""
+/analytics_data の集計クエリ
+
+ORM オブジェクトは作らず、SQL 側で GROUP BY / SUM / LIMIT まで済ませて
+タプルだけを受け取る。往復回数は
+・週次推移 + 章別正答率 : UNION ALL の1回（集計テーブルを使う場合は analytics_rollup の2回）
+・模擬試験の推移と順位  : 種別ごとの直近10件と得点分布（score_histograms）を UNION ALL でまとめた1回
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, Integer, String, case, cast, func, literal, null, select, union_all
+
+from database import db
+from model import QuizAnswer, QuizResult, ScoreHistogram
+import analytics_rollup
+import score_histograms
+from analytics_rollup import SECTION_COUNT, SECTION_DAYS, WEEKS, section_number, week_start_of
+
+MOCK_EXAM_TYPES = ("random", "weakness")
+MOCK_TREND_LIMIT = 10
+
+
+def compute_analytics(user_id, today, use_rollups=True):
+    """
+    /analytics_data のレスポンス（dict）を作る
+    """
+    if use_rollups:
+        weekly_labels, weekly_data = analytics_rollup.weekly_trend(user_id, today)
+        section_labels, section_data = analytics_rollup.section_rates(user_id, today)
+    else:
+        (weekly_labels, weekly_data), (section_labels, section_data) = weekly_and_sections(user_id, today)
+
+    payload = {
+        'weekly': {'labels': weekly_labels, 'data': weekly_data},
+        'section': {'labels': section_labels, 'data': section_data},
+    }
+    payload.update(mock_trends(user_id))
+    return payload
+
+
+def weekly_and_sections(user_id, today):
+    """
+    quiz_results / quiz_answers から週次推移と章別正答率を1回のクエリで集計する
+    """
+    first_week = week_start_of(today) - timedelta(weeks=WEEKS - 1)
+    week_starts = [
+        datetime.combine(first_week + timedelta(weeks=i), datetime.min.time())
+        for i in range(WEEKS + 1)
+    ]
+    section_start = datetime.combine(today - timedelta(days=SECTION_DAYS), datetime.min.time())
+
+    # 週の境界で CASE 分けして、週番号ごとに合計する（DBに依存しない日付の丸め方）
+    week_bucket = case(
+        *[(QuizResult.timestamp < week_starts[i + 1], i) for i in range(WEEKS)],
+        else_=WEEKS,
+    )
+    weekly = (
+        select(
+            literal("w").label("kind"),
+            cast(week_bucket, String).label("key"),
+            func.sum(QuizResult.total_questions).label("total_q"),
+            func.sum(QuizResult.correct_answers).label("total_c"),
+        )
+        .where(QuizResult.user_id == user_id, QuizResult.timestamp >= week_starts[0])
+        .group_by(week_bucket)
+    )
+
+    sections = (
+        select(
+            literal("s").label("kind"),
+            QuizAnswer.category.label("key"),
+            func.count(QuizAnswer.id).label("total_q"),
+            func.sum(case((QuizAnswer.is_correct, 1), else_=0)).label("total_c"),
+        )
+        .where(QuizAnswer.user_id == user_id, QuizAnswer.timestamp >= section_start)
+        .group_by(QuizAnswer.category)
+    )
+
+    # 回答行のない古い章末テストの結果
+    has_answers = select(QuizAnswer.id).where(QuizAnswer.result_id == QuizResult.id).exists()
+    legacy_sections = (
+        select(
+            literal("s").label("kind"),
+            QuizResult.exam_type.label("key"),
+            func.sum(QuizResult.total_questions).label("total_q"),
+            func.sum(QuizResult.correct_answers).label("total_c"),
+        )
+        .where(
+            QuizResult.user_id == user_id,
+            QuizResult.timestamp >= section_start,
+            QuizResult.exam_type.like('section_%'),
+            QuizResult.exam_type != 'section_all',
+            ~has_answers,
+        )
+        .group_by(QuizResult.exam_type)
+    )
+
+    rows = db.session.execute(union_all(weekly, sections, legacy_sections)).all()
+
+    weekly_sums = [[0, 0] for _ in range(WEEKS)]
+    section_sums = [[0, 0] for _ in range(SECTION_COUNT)]
+    for kind, key, total_q, total_c in rows:
+        if kind == "w":
+            idx = int(key)
+            if idx < WEEKS:
+                weekly_sums[idx][0] += total_q or 0
+                weekly_sums[idx][1] += total_c or 0
+        else:
+            sec_num = section_number(key)
+            if sec_num is not None:
+                section_sums[sec_num - 1][0] += total_q or 0
+                section_sums[sec_num - 1][1] += total_c or 0
+
+    weekly_labels = [(first_week + timedelta(weeks=i)).strftime('%m/%d') for i in range(WEEKS)]
+    weekly_data = [_rate(q, c) for q, c in weekly_sums]
+    section_labels = [f"{i}章" for i in range(1, SECTION_COUNT + 1)]
+    section_data = [_rate(q, c) for q, c in section_sums]
+    return (weekly_labels, weekly_data), (section_labels, section_data)
+
+
+def mock_trends(user_id):
+    """
+    模擬試験（完全ランダム / 苦手克服）それぞれの直近10回の推移（古い順）と、
+    最新の回の全受験の中での位置（standing。score_histograms.standing_in の値か None）。
+    種別ごとに (user_id, exam_type, timestamp) の索引を逆順に10件だけ読み、
+    得点分布（主キー (exam_type, bucket) で最大 BUCKETS 行ずつ）と合わせて UNION ALL で1回にまとめる
+    """
+    recent = [
+        select(
+            literal("r").label("kind"), QuizResult.exam_type, QuizResult.timestamp,
+            QuizResult.correct_answers, QuizResult.total_questions,
+            cast(null(), Integer).label("bucket"), cast(null(), Integer).label("attempts"),
+        )
+        .where(QuizResult.user_id == user_id, QuizResult.exam_type == exam_type)
+        .order_by(QuizResult.timestamp.desc())
+        .limit(MOCK_TREND_LIMIT)
+        .subquery()
+        for exam_type in MOCK_EXAM_TYPES
+    ]
+    histograms = select(
+        literal("h"), ScoreHistogram.exam_type, cast(null(), DateTime),
+        ScoreHistogram.correct_answers, ScoreHistogram.total_questions,
+        ScoreHistogram.bucket, ScoreHistogram.attempts,
+    ).where(ScoreHistogram.exam_type.in_(MOCK_EXAM_TYPES))
+    rows = db.session.execute(union_all(*[select(sub) for sub in recent], histograms)).all()
+
+    trends = {exam_type: {'labels': [], 'scores': [], 'rates': [], 'standing': None} for exam_type in MOCK_EXAM_TYPES}
+    distribution = {exam_type: [] for exam_type in MOCK_EXAM_TYPES}
+    results = []
+    for kind, exam_type, timestamp, correct, total, bucket, attempts in rows:
+        if kind == "h":
+            distribution[exam_type].append((bucket, attempts, correct, total))
+        else:
+            results.append((exam_type, timestamp, correct, total))
+
+    latest = {}
+    # UNION ALL の結果の並びは保証されないので、古い順に並べ直す
+    for exam_type, timestamp, correct, total in sorted(results, key=lambda row: row[1]):
+        trend = trends[exam_type]
+        trend['labels'].append(timestamp.strftime('%m/%d %H:%M'))
+        trend['scores'].append(correct)
+        trend['rates'].append(_rate(total, correct))
+        latest[exam_type] = (total, correct)
+    for exam_type, (total, correct) in latest.items():
+        trends[exam_type]['standing'] = score_histograms.standing_in(distribution[exam_type], total, correct)
+    return trends
+
+
+def _rate(total_q, total_c):
+    return round((total_c / total_q) * 100, 1) if total_q else 0
@@ -0,0 +1,228 @@
+"""
+/analytics_data 用の集計テーブル（ロールアップ）
+
+・user_weekly_stats        : ユーザー × 週（月曜始まり）の回答数・正解数
+・user_section_daily_stats : ユーザー × 日 × 章の回答数・正解数
+
+結果の保存時（save_quiz_result）に同じトランザクションで加算しておき、
+/analytics_data は数行の主キー範囲検索だけで済ませる。
+過去データの取り込みや不整合の修復は rebuild_rollups()（rebuild_analytics.py）で行う。
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import case, delete, func, select
+
+from database import db, upsert_increment
+from model import QuizAnswer, QuizResult, UserSectionDailyStat, UserWeeklyStat
+
+WEEKS = 8          # 週次推移の表示週数（過去2ヶ月）
+SECTION_DAYS = 30  # 章別正答率の集計日数
+SECTION_COUNT = 16
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def week_start_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def section_number(category):
+    """
+    "section_3" → 3。章でなければ None
+    """
+    if not category or not category.startswith("section_"):
+        return None
+    try:
+        sec_num = int(category.split("_")[1])
+    except ValueError:
+        return None
+    if 1 <= sec_num <= SECTION_COUNT:
+        return sec_num
+    return None
+
+
+def record_result(user_id, timestamp, answers):
+    """
+    保存した結果1件分をロールアップに加算する。answers は (category, is_correct) の列。
+    呼び出し側のトランザクションで commit すること
+    """
+    day = timestamp.date()
+    total_q = 0
+    total_c = 0
+    sections = defaultdict(lambda: [0, 0])
+    for category, is_correct in answers:
+        total_q += 1
+        if is_correct:
+            total_c += 1
+        sec_num = section_number(category)
+        if sec_num is not None:
+            counts = sections[sec_num]
+            counts[0] += 1
+            if is_correct:
+                counts[1] += 1
+
+    if not total_q:
+        return
+
+    upsert_increment(
+        UserWeeklyStat.__table__,
+        [{
+            "user_id": user_id,
+            "week_start": week_start_of(day),
+            "total_questions": total_q,
+            "correct_answers": total_c,
+        }],
+        ["user_id", "week_start"],
+        ["total_questions", "correct_answers"],
+    )
+    upsert_increment(
+        UserSectionDailyStat.__table__,
+        [
+            {
+                "user_id": user_id,
+                "day": day,
+                "section": sec_num,
+                "total_questions": q,
+                "correct_answers": c,
+            }
+            for sec_num, (q, c) in sorted(sections.items())
+        ],
+        ["user_id", "day", "section"],
+        ["total_questions", "correct_answers"],
+    )
+
+
+def weekly_trend(user_id, today):
+    """
+    直近 WEEKS 週（今週を含む）の週ごとの正答率を返す
+    """
+    first_week = week_start_of(today) - timedelta(weeks=WEEKS - 1)
+    rows = db.session.execute(
+        select(UserWeeklyStat.week_start, UserWeeklyStat.total_questions, UserWeeklyStat.correct_answers)
+        .where(UserWeeklyStat.user_id == user_id, UserWeeklyStat.week_start >= first_week)
+    ).all()
+    by_week = {week: (q, c) for week, q, c in rows}
+
+    labels = []
+    data = []
+    for i in range(WEEKS):
+        week = first_week + timedelta(weeks=i)
+        labels.append(week.strftime('%m/%d'))
+        total_q, total_c = by_week.get(week, (0, 0))
+        data.append(round((total_c / total_q) * 100, 1) if total_q > 0 else 0)
+    return labels, data
+
+
+def section_rates(user_id, today):
+    """
+    過去 SECTION_DAYS 日の章ごとの正答率を返す
+    """
+    start_day = today - timedelta(days=SECTION_DAYS)
+    rows = db.session.execute(
+        select(
+            UserSectionDailyStat.section,
+            func.sum(UserSectionDailyStat.total_questions),
+            func.sum(UserSectionDailyStat.correct_answers),
+        )
+        .where(UserSectionDailyStat.user_id == user_id, UserSectionDailyStat.day >= start_day)
+        .group_by(UserSectionDailyStat.section)
+    ).all()
+
+    labels = [f"{i}章" for i in range(1, SECTION_COUNT + 1)]
+    data = [0] * SECTION_COUNT
+    for sec_num, total_q, total_c in rows:
+        if total_q:
+            data[sec_num - 1] = round((total_c / total_q) * 100, 1)
+    return labels, data
+
+
+def rebuild_rollups(user_id=None):
+    """
+    quiz_results / quiz_answers からロールアップを作り直す（user_id 指定時はそのユーザーのみ）。
+    呼び出し側で commit すること
+    """
+    weekly = defaultdict(lambda: [0, 0])
+    sections = defaultdict(lambda: [0, 0])
+
+    # 回答行のあるデータは quiz_answers から、日・章単位で集計する
+    answer_day = func.date(QuizAnswer.timestamp)
+    answer_query = (
+        select(
+            QuizAnswer.user_id, answer_day, QuizAnswer.category,
+            func.count(QuizAnswer.id),
+            func.sum(case((QuizAnswer.is_correct, 1), else_=0)),
+        )
+        .where(QuizAnswer.timestamp.isnot(None))
+        .group_by(QuizAnswer.user_id, answer_day, QuizAnswer.category)
+    )
+    if user_id is not None:
+        answer_query = answer_query.where(QuizAnswer.user_id == user_id)
+
+    for uid, day, category, total_q, total_c in db.session.execute(answer_query):
+        day = _as_date(day)
+        counts = weekly[(uid, week_start_of(day))]
+        counts[0] += total_q
+        counts[1] += total_c or 0
+        sec_num = section_number(category)
+        if sec_num is not None:
+            counts = sections[(uid, day, sec_num)]
+            counts[0] += total_q
+            counts[1] += total_c or 0
+
+    # 回答行のない古い結果は quiz_results の合計値だけを使う
+    has_answers = select(QuizAnswer.id).where(QuizAnswer.result_id == QuizResult.id).exists()
+    result_day = func.date(QuizResult.timestamp)
+    result_query = (
+        select(
+            QuizResult.user_id, result_day, QuizResult.exam_type,
+            func.sum(QuizResult.total_questions),
+            func.sum(QuizResult.correct_answers),
+        )
+        .where(QuizResult.timestamp.isnot(None), ~has_answers)
+        .group_by(QuizResult.user_id, result_day, QuizResult.exam_type)
+    )
+    if user_id is not None:
+        result_query = result_query.where(QuizResult.user_id == user_id)
+
+    for uid, day, exam_type, total_q, total_c in db.session.execute(result_query):
+        day = _as_date(day)
+        counts = weekly[(uid, week_start_of(day))]
+        counts[0] += total_q or 0
+        counts[1] += total_c or 0
+        # 章末テストの古い結果は章全体の成績として扱う
+        sec_num = section_number(exam_type) if exam_type != "section_all" else None
+        if sec_num is not None:
+            counts = sections[(uid, day, sec_num)]
+            counts[0] += total_q or 0
+            counts[1] += total_c or 0
+
+    weekly_delete = delete(UserWeeklyStat)
+    section_delete = delete(UserSectionDailyStat)
+    if user_id is not None:
+        weekly_delete = weekly_delete.where(UserWeeklyStat.user_id == user_id)
+        section_delete = section_delete.where(UserSectionDailyStat.user_id == user_id)
+    db.session.execute(weekly_delete)
+    db.session.execute(section_delete)
+
+    weekly_rows = [
+        {"user_id": uid, "week_start": week, "total_questions": q, "correct_answers": c}
+        for (uid, week), (q, c) in weekly.items()
+    ]
+    section_rows = [
+        {"user_id": uid, "day": day, "section": sec_num, "total_questions": q, "correct_answers": c}
+        for (uid, day, sec_num), (q, c) in sections.items()
+    ]
+    for start in range(0, len(weekly_rows), REBUILD_BATCH_SIZE):
+        db.session.execute(UserWeeklyStat.__table__.insert(), weekly_rows[start:start + REBUILD_BATCH_SIZE])
+    for start in range(0, len(section_rows), REBUILD_BATCH_SIZE):
+        db.session.execute(UserSectionDailyStat.__table__.insert(), section_rows[start:start + REBUILD_BATCH_SIZE])
+
+    return len(weekly_rows), len(section_rows)
+
+
+def _as_date(value):
+    # SQLite の date() は文字列、PostgreSQL は date 型で返る
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
@@ -0,0 +1,164 @@
+"""
+問題ごとの回答数・正解数（Question.total_count / correct_count）の集計バッファ
+
+採点結果を1問ずつ UPDATE するとDB書き込みが問題数ぶん発生するため、
+いったんプロセス内で問題IDごとに合算し、件数または経過時間のしきい値を超えたら
+UPDATE questions SET total_count = total_count + :n ... をまとめて（executemany で）発行する。
+加算は相対更新なので、複数ワーカーが同時に flush しても値は失われない。
+経過時間のしきい値は、回答が来なくても守られるよう、バッファを使うプロセスごとに
+デーモンスレッド（_run_timer）でも確かめる。
+"""
+import atexit
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from database import db
+
+DEFAULT_FLUSH_SIZE = 200       # バッファに溜まった回答数がこれを超えたら書き込む
+DEFAULT_FLUSH_INTERVAL = 30.0  # 前回の書き込みからこの秒数が経っていたら書き込む
+MIN_TIMER_SLEEP = 0.5          # タイマーが次に確かめるまでの最短の秒数
+
+_UPDATE_SQL = text(
+    "UPDATE questions "
+    "SET total_count = total_count + :total, correct_count = correct_count + :correct "
+    "WHERE id = :id"
+)
+
+
+class AnswerStatsBuffer:
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = {}  # {question_id: [total, correct]}
+        self._pending_answers = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._app = None         # タイマーから書き込むときに使うアプリ（init_answer_stats で設定）
+        self._timer_pid = None   # タイマーを起動したプロセス（fork した先では起動し直す）
+
+    def add_listener(self, callback):
+        """
+        書き込みが確定した差分 {question_id: (total, correct)} を受け取るコールバックを登録する
+        """
+        self._listeners.append(callback)
+
+    def record(self, answers):
+        """
+        採点結果をバッファに追加する。answers は (question_id, is_correct) の列
+        """
+        with self._lock:
+            for qid, is_correct in answers:
+                counts = self._pending.get(qid)
+                if counts is None:
+                    counts = self._pending[qid] = [0, 0]
+                counts[0] += 1
+                if is_correct:
+                    counts[1] += 1
+                self._pending_answers += 1
+
+        self._ensure_timer()
+        if self._should_flush():
+            # 採点結果の保存は済んでいるので、集計の失敗でリクエストは落とさない
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Answer stats flush error: {e}")
+
+    def _ensure_timer(self):
+        """
+        このプロセスでタイマーが動いていなければ起動する
+        """
+        pid = os.getpid()
+        if self._app is None or self._timer_pid == pid:
+            return
+        with self._lock:
+            if self._timer_pid == pid:
+                return
+            self._timer_pid = pid
+        threading.Thread(target=self._run_timer, name="answer-stats-flush", daemon=True).start()
+
+    def _run_timer(self):
+        """
+        回答が来ないワーカーでも、前回の書き込みから flush_interval 秒経ったら書き込む
+        """
+        while True:
+            wait = self._last_flush + self.flush_interval - time.monotonic()
+            time.sleep(max(wait, MIN_TIMER_SLEEP))
+            if self._should_flush():
+                with self._app.app_context():
+                    self._flush_quietly()
+
+    def _should_flush(self):
+        if not self._pending_answers:
+            return False
+        if self._pending_answers >= self.flush_size:
+            return True
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """
+        溜まっている差分をまとめてDBへ書き込む。書き込んだ問題数を返す
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._pending_answers = 0
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        params = [
+            {"id": qid, "total": total, "correct": correct}
+            for qid, (total, correct) in pending.items()
+        ]
+        try:
+            # リクエスト側のセッションとは別のトランザクションで書き込む
+            with db.engine.begin() as conn:
+                conn.execute(_UPDATE_SQL, params)
+        except Exception:
+            # 書き込めなかった分は次回に持ち越す
+            self._restore(pending)
+            raise
+
+        deltas = {qid: (total, correct) for qid, (total, correct) in pending.items()}
+        for callback in self._listeners:
+            callback(deltas)
+        return len(params)
+
+    def _restore(self, pending):
+        with self._lock:
+            for qid, (total, correct) in pending.items():
+                counts = self._pending.get(qid)
+                if counts is None:
+                    counts = self._pending[qid] = [0, 0]
+                counts[0] += total
+                counts[1] += correct
+                self._pending_answers += total
+
+
+answer_buffer = AnswerStatsBuffer()
+
+
+def init_answer_stats(app):
+    """
+    設定値を反映し、経過時間での書き込み（最初の回答で起動するタイマー）と
+    プロセス終了時の書き込みを有効にする
+    """
+    answer_buffer.flush_size = app.config.get("ANSWER_STATS_FLUSH_SIZE", DEFAULT_FLUSH_SIZE)
+    answer_buffer.flush_interval = app.config.get("ANSWER_STATS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)
+    answer_buffer._app = app
+
+    def flush_on_exit():
+        with app.app_context():
+            answer_buffer._flush_quietly()
+
+    atexit.register(flush_on_exit)
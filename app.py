@@ -1,43 +1,92 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, flash, stream_with_context
 from flask_migrate import Migrate
 from database import db
-from model import Question, User, QuizResult
+from model import Question, User, QuizResult, QuizAnswer
+from question_cache import question_bank, bump_version
+from answer_stats import answer_buffer, init_answer_stats
+from weakness_ranking import weakest_question_ids, init_weakness_ranking
+import analytics_rollup
+import analytics_queries
+import score_histograms
+import spaced_repetition
+import question_export
+import exam_api
+import question_listing
+import question_search
+import near_duplicates
+from exam_instances import issue_exam, load_exam, consume_exam
+from sampling import stratified_sample, recent_question_ids
+from http_cache import conditional, template_key, init_compression
+from assets import init_assets
+from template_cache import init_template_cache
+from db_profile import configure_engine_options, register_engine_events
+from mail_outbox import enqueue_email, mail_settings
+from auth import (
+    login_user, current_user, current_user_id, current_profile, invalidate_profile,
+    login_required, api_login_required, admin_required
+)
 import random
-import json
 import os
-import smtplib
 #load_dotenv関連をコメントアウト
 #from dotenv import load_dotenv
 
 #load_dotenv()
 
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadTimeSignature
-from datetime import datetime, timedelta
-from sqlalchemy import func, desc
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, desc, insert, select
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev_key_123')
 
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///quiz.db"
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get('DATABASE_URL', "sqlite:///quiz.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JSON_AS_ASCII"] = False
+# 回答数・正解数の集計バッファ（件数 or 秒数のしきい値でまとめて書き込む）
+app.config["ANSWER_STATS_FLUSH_SIZE"] = int(os.environ.get('ANSWER_STATS_FLUSH_SIZE', 200))
+app.config["ANSWER_STATS_FLUSH_INTERVAL"] = float(os.environ.get('ANSWER_STATS_FLUSH_INTERVAL', 30))
+# /analytics_data を集計テーブルから返すか（False なら生データを SQL で集計する）
+app.config["ANALYTICS_USE_ROLLUPS"] = os.environ.get('ANALYTICS_USE_ROLLUPS', '1') != '0'
+# DBエンジンの設定プロファイル（auto / sqlite / server / none）。詳細は db_profile.py
+app.config["DB_PROFILE"] = os.environ.get('DB_PROFILE', 'auto')
+# 表示用プロフィールのキャッシュ秒数（0 で無効）
+app.config["USER_PROFILE_CACHE_TTL"] = float(os.environ.get('USER_PROFILE_CACHE_TTL', 0))
+# 模擬試験（ランダム）の分野ごとの出題数。重み（{分野: 重み}）か固定の問題数（{分野: 問題数}）を指定する。
+# どちらも None なら各分野の問題数に比例させる
+app.config["MOCK_SECTION_WEIGHTS"] = None
+app.config["MOCK_SECTION_QUOTAS"] = None
+# 模擬試験（ランダム）で、直近の何回分の受験で出た問題を避けるか（0 なら避けない）
+app.config["MOCK_EXCLUDE_RECENT_ATTEMPTS"] = int(os.environ.get('MOCK_EXCLUDE_RECENT_ATTEMPTS', 3))
+# このバイト数以上の HTML / JSON を gzip（brotli が入っていれば brotli）で圧縮する
+app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# テンプレートのバイトコードキャッシュの保存先（未設定なら instance/jinja_cache、空文字なら使わない）
+app.config["JINJA_BYTECODE_CACHE_DIR"] = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+# 出題した試験（exam_instances）を提出できる期間（秒）
+app.config["EXAM_INSTANCE_TTL"] = int(os.environ.get('EXAM_INSTANCE_TTL', 6 * 3600))
+if os.environ.get('DB_POOL_SIZE'):
+    app.config["DB_POOL_SIZE"] = int(os.environ['DB_POOL_SIZE'])
+if os.environ.get('DB_MAX_OVERFLOW'):
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ['DB_MAX_OVERFLOW'])
+configure_engine_options(app)
 db.init_app(app)
+register_engine_events(app, db)
 migrate = Migrate(app, db)
+init_answer_stats(app)
+init_weakness_ranking(app, answer_buffer)
+init_compression(app)
+init_assets(app)
+init_template_cache(app)
 
 # トークン生成用のシリアライザ
 serializer = URLSafeTimedSerializer(app.secret_key)
 
 def send_verification_email(user_email, token_url):
     """
-    認証メールを送信する関数
+    認証メールを送信キュー（email_outbox）に登録する関数
+    実際の送信は email_worker.py が行う
     """
-    sender_email = os.environ.get('MAIL_ADDRESS')
-    password = os.environ.get('MAIL_PASSWORD')
-
-    if not sender_email or not password:
-        print("Error: 環境変数 MAIL_ADDRESS または MAIL_PASSWORD が設定されていません。")
+    if not mail_settings()["address"]:
+        print("Error: 環境変数 MAIL_ADDRESS が設定されていません。")
         return False
 
     subject = "【重要】登録確認メール"
@@ -49,32 +98,19 @@ def send_verification_email(user_email, token_url):
 リンクの有効期限は24時間です。
 """
 
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = user_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, password)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email send error: {e}")
-        return False
+    enqueue_email(user_email, subject, body)
+    db.session.commit()
+    return True
 
 def send_contact_email(name, user_email, category, message_body):
     """
-    お問い合わせメールを管理者に送信する関数
+    お問い合わせメールを管理者宛の送信キュー（email_outbox）に登録する関数
+    実際の送信は email_worker.py が行う
     """
-    receiver_email = os.environ.get('MAIL_ADDRESS')
-    password = os.environ.get('MAIL_PASSWORD')
+    receiver_email = mail_settings()["address"]
 
-    if not receiver_email or not password:
-        print("Error: 環境変数 MAIL_ADDRESS または MAIL_PASSWORD が設定されていません。")
+    if not receiver_email:
+        print("Error: 環境変数 MAIL_ADDRESS が設定されていません。")
         return False
 
     subject = f"【お問い合わせ】{category} ({name}様)"
@@ -89,23 +125,10 @@ def send_contact_email(name, user_email, category, message_body):
 {message_body}
 """
 
-    msg = MIMEMultipart()
-    msg['From'] = receiver_email
-    msg['To'] = receiver_email  # 管理者宛
-    msg['Reply-To'] = user_email # 返信先はユーザー
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(receiver_email, password)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Contact email send error: {e}")
-        return False
+    # 管理者宛、返信先はユーザー
+    enqueue_email(receiver_email, subject, body, reply_to=user_email)
+    db.session.commit()
+    return True
 
 @app.route("/support", methods=["GET", "POST"])
 def support():
@@ -130,6 +153,7 @@ def support():
     return render_template("support.html", email=email_initial)
 
 @app.route("/about")
+@conditional(lambda: template_key("about.html"), cache_control="public, max-age=300")
 def about():
     return render_template("about.html")
 
@@ -215,8 +239,7 @@ def try_login():
     if user and user.check_password(pw):
         if not user.is_active:
              return render_template("login.html", error="メール認証を完了してください")
-        session["user"] = user.email
-        session["is_admin"] = user.is_admin
+        login_user(user)
         return redirect(url_for("home"))
     else:
         return render_template("login.html", error="ログインに失敗しました")
@@ -227,28 +250,25 @@ def logout():
     return redirect("/")
 
 @app.route("/home")
+@login_required
 def home():
-    if "user" not in session:
-        return redirect("/")
-    user = User.query.filter_by(email=session["user"]).first()
+    user = current_profile()
     return render_template("home.html", user=user)
 
 @app.route("/mypage")
+@login_required
 def mypage():
-    if "user" not in session:
-        return redirect("/")
-    user = User.query.filter_by(email=session["user"]).first()
+    user = current_profile()
     return render_template("mypage.html", user=user)
 
 @app.route('/update_nickname', methods=['POST'])
+@login_required
 def update_nickname():
-    if "user" not in session:
-        return redirect("/")
-    
-    user = User.query.filter_by(email=session["user"]).first()
+    user = current_user()
     if user:
         user.nickname = request.form.get('nickname')
         db.session.commit()
+        invalidate_profile(user.id)
         flash('ニックネームが更新されました。', 'success')
     else:
         flash('ユーザーが見つかりませんでした。', 'error')
@@ -256,11 +276,9 @@ def update_nickname():
     return redirect(url_for('mypage'))
 
 @app.route('/update_password', methods=['POST'])
+@login_required
 def update_password():
-    if 'user' not in session:
-        return redirect('/')
-
-    user = User.query.filter_by(email=session['user']).first()
+    user = current_user()
     if not user:
         flash('ユーザーが見つかりませんでした。', 'danger')
         return redirect(url_for('mypage'))
@@ -283,16 +301,35 @@ def update_password():
     return redirect(url_for('mypage'))
 
 @app.route("/material")
+@login_required
+@conditional(lambda: template_key("material.html"), cache_control="private, max-age=300")
 def material():
-    if "user" not in session:
-        return redirect("/")
     return render_template("material.html")
 
+@app.route("/search")
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    result = question_search.search(q, page=page) if q else None
+    bank = question_bank.snapshot()
+    return render_template(
+        "search.html",
+        q=q,
+        result=result,
+        hits=[(bank.get(qid), snippet) for qid, snippet in result.hits if bank.get(qid)] if result else []
+    )
+
+def section_chooser_key():
+    # 章選択画面だけ ETag を付ける（問題の画面は毎回新しい試験を発行する）
+    if request.args.get('category'):
+        return None
+    return template_key("section_test.html")
+
 @app.route("/section_test", methods=["GET"])
+@login_required
+@conditional(section_chooser_key)
 def section_test():
-    if "user" not in session:
-        return redirect("/")
-
     category = request.args.get('category')
 
     if not category:
@@ -300,116 +337,204 @@ def section_test():
         chapters = list(range(1, 17))  # 1章から16章 test
         return render_template("section_test.html", chapters=chapters)
 
-    # 問題リスト表示
-    if category == 'all':
-        q_list = Question.query.filter(Question.category.like('section_%')).all()
-    else:
-        q_list = Question.query.filter_by(category=category).all()
+    # 問題リスト表示（キャッシュから取得）
+    bank = question_bank.snapshot()
+    q_list = bank.questions(bank.ids_for_category(category))
 
     if not q_list:
         return "その範囲の問題はDBにありません"  # or redirect with a message
 
+    exam_type = "section_all" if category == 'all' else f"section_{category}"
+    ids = [q.id for q in q_list]
+    exam_token = issue_exam(current_user_id(), exam_type, bank, ids)
+    db.session.commit()
+
     return render_template(
         "section_test.html",
-        questions=q_list,
+        exam=exam_config(bank, ids, exam_token, 'submit_section'),
         category=category,
         total=len(q_list)
     )
 
-@app.route('/submit_section', methods=['POST'])
-def submit_section():
-    if 'user' not in session:
-        return redirect('/')
-
-    category = request.form.get('category')
-    results = []
-    score = 0
-
-    if category == 'all':
-        q_list = Question.query.filter(Question.category.like('section_%')).all()
-    else:
-        q_list = Question.query.filter_by(category=category).all()
-
-    for q in q_list:
-        selected_choice_val = request.form.get(f'question_{q.id}')
-        
-        selected_choice_index = None # 1-based index
-        user_answer_text = "未回答" # Default for unanswered
-
-        if selected_choice_val is not None:
-            selected_choice_index = int(selected_choice_val)
-            choices = [q.choice1, q.choice2, q.choice3, q.choice4]
-            user_answer_text = choices[selected_choice_index - 1] # Convert 1-based to 0-based for list access
+def exam_config(bank, ids, exam_token, submit_endpoint):
+    # 試験の画面に埋め込む設定。最初のページ以外は画面から /api/exam/questions で読み込む
+    return {
+        'exam_token': exam_token,
+        'total': len(ids),
+        'page_size': exam_api.PAGE_SIZE,
+        'first_page': exam_api.question_page(bank, ids),
+        'questions_url': url_for('api_exam_questions'),
+        'submit_url': url_for(submit_endpoint),
+    }
+
+def save_quiz_result(user_obj, exam_type, graded):
+    """
+    採点結果を quiz_results に保存し、1問ごとの回答を quiz_answers にまとめて挿入する
+    """
+    # quiz_results.timestamp の既定値（DBの現在時刻 = UTC）と揃える
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    new_result = QuizResult(
+        user_id=user_obj.id,
+        exam_type=exam_type,
+        total_questions=graded.total,
+        correct_answers=graded.score,
+        timestamp=now
+    )
+    db.session.add(new_result)
+    db.session.flush() # result_id を確定させる
+
+    answer_rows = list(graded.saved_rows())
+    if answer_rows:
+        db.session.execute(insert(QuizAnswer), [
+            {
+                'result_id': new_result.id,
+                'user_id': user_obj.id,
+                'question_id': question_id,
+                'category': category,
+                'is_correct': is_correct,
+                'selected_choice': selected,
+                'correct_choice': correct,
+                'timestamp': now
+            }
+            for question_id, category, selected, correct, is_correct in answer_rows
+        ])
+
+    # /analytics_data 用の集計テーブルにも同じトランザクションで加算する
+    analytics_rollup.record_result(
+        user_obj.id, now,
+        ((category, is_correct) for _, category, _, _, is_correct in answer_rows)
+    )
+    # 結果画面のパーセンタイル順位用の得点分布にも加算する
+    score_histograms.record_result(exam_type, graded.total, graded.score)
+    # 出題した問題の復習の予定を更新する（出題した問題の行だけを読み書きする）
+    spaced_repetition.record_answers(
+        user_obj.id, now,
+        ((question_id, is_correct) for question_id, _, _, _, is_correct in answer_rows)
+    )
+    db.session.commit()
+    return new_result
 
-        is_correct = (selected_choice_index == q.correct)
+def submit_exam():
+    """
+    フォームのトークンが指す試験を、出題時の正解表で採点して保存する。
+    (試験の種類, 採点結果, 保存した QuizResult) を返す。トークンが不正・期限切れ・提出済みなら None
+    """
+    exam = load_exam(request.form.get('exam_token'), current_user_id())
+    if exam is None:
+        return None
+    instance, key = exam
+    graded = key.grade(request.form)
 
-        if is_correct:
-            score += 1
-        
-        results.append({
-            'question': q,
-            'user_answer': user_answer_text,
-            'selected_choice_index': selected_choice_index, # Add selected choice index
-            'correct_choice_index': q.correct, # Add correct choice index
-            'is_correct': is_correct
-        })
-    
-    total = len(q_list)
+    # 同時に2回提出されても、試験の行を消せた方だけが保存する
+    if not consume_exam(instance):
+        db.session.rollback()
+        return None
 
     # Save result to DB
-    user_obj = User.query.filter_by(email=session['user']).first()
-    if user_obj:
-        if category == 'all':
-            exam_type_val = "section_all"
-        else:
-            exam_type_val = f"section_{category}"
-        
-        # Create details JSON
-        details_list = []
-        for r in results:
-            q = r['question']
-            details_list.append({
-                'q_id': q.id,
-                'category': q.category,
-                'is_correct': r['is_correct']
-            })
-            
-        new_result = QuizResult(
-            user_id=user_obj.id,
-            exam_type=exam_type_val,
-            total_questions=total,
-            correct_answers=score,
-            details=json.dumps(details_list)
-        )
-        db.session.add(new_result)
-        db.session.commit()
+    user_obj = current_user()
+    result = save_quiz_result(user_obj, instance.exam_type, graded) if user_obj else None
+
+    # 問題ごとの回答数・正解数に反映（まとめて書き込む）
+    answer_buffer.record(graded.counter_rows())
+    return instance.exam_type, graded, result
+
+def render_result(test_type, graded, result):
+    # 最初のページだけ埋め込み、残りと解説は画面から /api/results/... で読み込む
+    bank = question_bank.snapshot()
+    review = {
+        'total': graded.total,
+        'page_size': exam_api.PAGE_SIZE,
+        'first_page': exam_api.first_review_page(bank, graded),
+        'answers_url': None,
+        'explanation_url': None,
+    }
+    if result is not None:
+        review['answers_url'] = url_for('api_result_answers', result_id=result.id)
+        # 画面側で末尾の 0 を問題IDに置き換える
+        review['explanation_url'] = url_for('api_result_explanation', result_id=result.id, question_id=0)
+    # 同じ種類の試験の全受験の中での位置（得点分布の区間の数だけ読む）
+    standing = score_histograms.standing(result.exam_type, graded.total, graded.score) if result else None
+    return render_template(
+        'result.html',
+        review=review,
+        standing=standing,
+        score=graded.score, total=graded.total, test_type=test_type
+    )
+
+EXAM_NOT_FOUND_MESSAGE = "この試験は有効期限が切れているか、すでに提出されています"
 
-    return render_template('result.html', results=results, score=score, total=total, test_type='section')
+@app.route('/submit_section', methods=['POST'])
+@login_required
+def submit_section():
+    submitted = submit_exam()
+    if submitted is None:
+        return EXAM_NOT_FOUND_MESSAGE, 400
+    _, graded, result = submitted
+    return render_result('section', graded, result)
+
+PRACTICE_OPTIONS = {
+    "5問": 5,
+    "10問": 10,
+    "20問": 20,
+    "30問": 30,
+    "40問": 40,
+    "50問": 50,
+    "100問": 100,
+    "すべて": "all"
+}
+REVIEW_OPTIONS = {
+    "10問": 10,
+    "20問": 20,
+    "40問": 40
+}
+
+def render_practice_options(notice=None):
+    """
+    特訓講座・模擬試験・復習の選択画面（復習する問題の数は DUE_COUNT_LIMIT までしか数えない）
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return render_template(
+        "practice_test.html",
+        question_options=PRACTICE_OPTIONS,
+        review_options=REVIEW_OPTIONS,
+        due_count=spaced_repetition.due_count(current_user_id(), now),
+        due_count_limit=spaced_repetition.DUE_COUNT_LIMIT,
+        notice=notice
+    )
 
 @app.route("/practice", methods=["GET"])
+@login_required
 def practice():
-    if "user" not in session:
-        return redirect("/")
-    
     num_questions_str = request.args.get('num_questions')
-    test_type = request.args.get('test_type') # Retrieve test_type
+    # 指定がなければ特訓講座として扱う（exam_instances.exam_type は NULL にできない）
+    test_type = request.args.get('test_type') or 'training'
 
     if not num_questions_str:
         # Display selection screen
-        options = {
-            "5問": 5,
-            "10問": 10,
-            "20問": 20,
-            "30問": 30,
-            "40問": 40,
-            "50問": 50,
-            "100問": 100,
-            "すべて": "all"
-        }
-        return render_template("practice_test.html", question_options=options)
-
-    all_questions = Question.query.all()
-    total_available = len(all_questions)
+        return render_practice_options()
+
+    if test_type == 'review':
+        # 復習（間隔反復）: 期限が来た問題を、期限の古い順に (user_id, next_due) の索引で読む
+        bank = question_bank.snapshot()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        limit = min(int(num_questions_str), max(REVIEW_OPTIONS.values()))
+        ids = spaced_repetition.due_question_ids(current_user_id(), now, limit, bank)
+        if not ids:
+            db.session.commit()
+            return render_practice_options(notice="いま復習する問題はありません")
+        random.shuffle(ids)
+        exam_token = issue_exam(current_user_id(), test_type, bank, ids)
+        db.session.commit()
+        return render_template(
+            "practice_test.html",
+            exam=exam_config(bank, ids, exam_token, 'submit_practice'),
+            total=len(ids),
+            test_type=test_type
+        )
+
+    bank = question_bank.snapshot()
+    total_available = len(bank.all_ids)
 
     if num_questions_str == 'all':
         num_to_sample = total_available
@@ -423,6 +548,7 @@ def practice():
         num_to_sample = int(num_questions_str)
 
     # Ensure we don't request more questions than available
+    requested = num_to_sample
     num_to_sample = min(num_to_sample, total_available)
     
     if num_to_sample == 0:
@@ -430,165 +556,185 @@ def practice():
 
 # Shuffle all questions if 'all' is selected, otherwise sample
     if num_questions_str == 'all':
-        q_list = all_questions
+        q_list = bank.questions(bank.all_ids)
         random.shuffle(q_list)
 
+    elif num_questions_str == '40_random_mock':
+        # 模擬試験（ランダム）: 分野ごとに割り振って抽出し、直近の受験で出た問題はできるだけ避ける
+        seed = request.args.get('seed', type=int) # 同じ seed なら同じ問題（デバッグ用）
+        exclude = recent_question_ids(current_user_id(), app.config["MOCK_EXCLUDE_RECENT_ATTEMPTS"])
+        # 分野ごとの出題数（MOCK_SECTION_QUOTAS）の合計は 40 問。問題が足りなければ出題できる数に抑えられる
+        q_list = bank.questions(stratified_sample(
+            bank, requested,
+            rng=random.Random(seed) if seed is not None else None,
+            weights=app.config["MOCK_SECTION_WEIGHTS"],
+            quotas=app.config["MOCK_SECTION_QUOTAS"],
+            exclude=exclude
+        ))
+
     elif num_questions_str == '40_weakness_mock':
         # 模擬試験（苦手克服）用のロジック
-        def get_rate(q):
-            if q.total_count == 0: return 0.0
-            return q.correct_count / q.total_count
-        
-        sorted_q = sorted(all_questions, key=get_rate)
-        q_list = sorted_q[:num_to_sample]
+        q_list = bank.questions(weakest_question_ids(bank, num_to_sample))
         random.shuffle(q_list) # 出題順はランダム
 
     else:
         # 【特訓講座（5問～100問）のロジック変更】
-        # 1. 正答率計算（未回答は0.0として最優先）
-        def get_rate(q):
-            if q.total_count == 0: return 0.0
-            return q.correct_count / q.total_count
-        
-        # 2. 正答率が低い順にソート
-        sorted_q = sorted(all_questions, key=get_rate)
-        
-        # 3. 指定された問題数だけ、苦手な上位からピックアップ
-        q_list = sorted_q[:num_to_sample]
+        # 1. 正答率が低い順に、指定された問題数だけピックアップ
+        #    （未回答は0.0として最優先。同じ正答率の中ではランダム）
+        q_list = bank.questions(weakest_question_ids(bank, num_to_sample))
         
-        # 4. ピックアップした問題の出題順序をランダムにする
+        # 2. ピックアップした問題の出題順序をランダムにする
         random.shuffle(q_list)
-        
+
+    ids = [q.id for q in q_list]
+    exam_token = issue_exam(current_user_id(), test_type, bank, ids)
+    db.session.commit()
+
     return render_template(
         "practice_test.html",
-        questions=q_list,
+        exam=exam_config(bank, ids, exam_token, 'submit_practice'),
         total=len(q_list),
         test_type=test_type # Pass test_type to the template
     )
 
 @app.route('/submit_practice', methods=['POST'])
+@login_required
 def submit_practice():
-    if 'user' not in session:
-        return redirect('/')
-
-    results = []
-    score = 0
-    test_type = request.form.get('test_type') # Retrieve test_type
-    
-    # Get all question IDs that were part of the test, preserving order
-    all_q_ids = request.form.get('all_q_ids').split(',')
-    
-    # Fetch the questions from the database
-    questions_from_db = Question.query.filter(Question.id.in_(all_q_ids)).all()
-    
-    # The database query does not guarantee order, so we reorder them.
-    # Create a mapping from ID to Question object
-    question_map = {str(q.id): q for q in questions_from_db}
-    
-    # Re-order the questions based on the original ID list
-    q_list = [question_map[qid] for qid in all_q_ids if qid in question_map]
-
-    for q in q_list:
-        selected_choice_val = request.form.get(f'question_{q.id}')
-        
-        selected_choice_index = None # 1-based index
-        user_answer_text = "未回答" # Default for unanswered
-
-        if selected_choice_val is not None:
-            selected_choice_index = int(selected_choice_val)
-            choices = [q.choice1, q.choice2, q.choice3, q.choice4]
-            user_answer_text = choices[selected_choice_index - 1]
-
-        is_correct = (selected_choice_index == q.correct)
-
-        if is_correct:
-            score += 1
-        
-        results.append({
-            'question': q,
-            'user_answer': user_answer_text,
-            'selected_choice_index': selected_choice_index,
-            'correct_choice_index': q.correct,
-            'is_correct': is_correct
-        })
-    
-    total = len(q_list)
+    submitted = submit_exam()
+    if submitted is None:
+        return EXAM_NOT_FOUND_MESSAGE, 400
+    test_type, graded, result = submitted
+    return render_result(test_type, graded, result)
+
+@app.route('/api/exam/questions')
+@api_login_required
+def api_exam_questions():
+    exam = load_exam(request.args.get('token'), current_user_id())
+    if exam is None:
+        return jsonify({'error': EXAM_NOT_FOUND_MESSAGE}), 404
+    _, key = exam
+    offset, limit = exam_api.page_args(request.args)
+    bank = question_bank.snapshot()
+    return jsonify({
+        'total': len(key),
+        'offset': offset,
+        'items': exam_api.question_page(bank, key.question_ids, offset, limit),
+    })
 
-    # Save result to DB
-    user_obj = User.query.filter_by(email=session['user']).first()
-    if user_obj:
-        # Create details JSON
-        details_list = []
-        for r in results:
-            q = r['question']
-            details_list.append({
-                'q_id': q.id,
-                'category': q.category,
-                'is_correct': r['is_correct']
-            })
-            
-        new_result = QuizResult(
-            user_id=user_obj.id,
-            exam_type=test_type,
-            total_questions=total,
-            correct_answers=score,
-            details=json.dumps(details_list)
-        )
-        db.session.add(new_result)
-        db.session.commit()
+@app.route('/api/results/<int:result_id>/answers')
+@api_login_required
+def api_result_answers(result_id):
+    result = exam_api.owned_result(result_id, current_user_id())
+    if result is None:
+        return jsonify({'error': 'not found'}), 404
+    offset, limit = exam_api.page_args(request.args)
+    bank = question_bank.snapshot()
+    return jsonify({
+        'total': result.total_questions,
+        'offset': offset,
+        'items': exam_api.answer_page(bank, result, offset, limit),
+    })
 
-    return render_template('result.html', results=results, score=score, total=total, test_type=test_type)
+@app.route('/api/results/<int:result_id>/explanations/<int:question_id>')
+@api_login_required
+def api_result_explanation(result_id, question_id):
+    result = exam_api.owned_result(result_id, current_user_id())
+    if result is None:
+        return jsonify({'error': 'not found'}), 404
+    item = exam_api.explanation(question_bank.snapshot(), result, question_id)
+    if item is None:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(item)
 
 @app.route("/admin")
+@admin_required
 def admin():
-    if not session.get("is_admin"):
-        return redirect("/")
     return render_template("admin.html")
 
 @app.route("/admin/questions")
+@admin_required
 def admin_questions():
-    if not session.get("is_admin"):
-        return redirect("/")
-
     page = request.args.get('page', 1, type=int)
     section = request.args.get('section', 'all')
-
-    query = Question.query.order_by(Question.id)
-
-    if section != 'all':
-        query = query.filter(Question.category == f"section_{section}")
-
-    pagination = query.paginate(page=page, per_page=20, error_out=False)
-    questions = pagination.items
-    total_questions = query.count() # Get total count after filtering
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
 
     sections = ["all"] + [str(i) for i in range(1, 17)]
 
+    # 件数とページ番号は問題バンクのキャッシュから求め、表示する行だけを主キーの範囲で読む
+    bank = question_bank.snapshot()
+    pagination = question_listing.list_page(bank, section, after=after, before=before, page=page)
+
     return render_template(
         "admin_questions.html",
-        questions=questions,
+        questions=pagination.items,
         pagination=pagination,
         sections=sections,
+        section_counts=question_listing.section_counts(bank, sections),
         selected_section=section,
-        total_questions=total_questions
+        total_questions=pagination.total
+    )
+
+@app.route("/admin/questions/search")
+@admin_required
+def admin_search_questions():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return redirect(url_for('admin_questions'))
+    page = request.args.get('page', 1, type=int)
+    result = question_search.search(q, page=page)
+    bank = question_bank.snapshot()
+    return render_template(
+        "admin_search.html",
+        q=q,
+        result=result,
+        hits=[(bank.get(qid), snippet) for qid, snippet in result.hits if bank.get(qid)]
+    )
+
+@app.route("/admin/duplicates")
+@admin_required
+def admin_duplicates():
+    page = max(request.args.get('page', 1, type=int), 1)
+    # 署名は問題の追加・編集・取り込みのときに作る（マイグレーション直後は python find_duplicates.py）
+    groups = near_duplicates.duplicate_groups.groups()
+    per_page = question_listing.PER_PAGE
+    shown = groups[(page - 1) * per_page:page * per_page]
+    ids = [qid for group in shown for qid in group.ids]
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(ids))} if ids else {}
+    return render_template(
+        "admin_duplicates.html",
+        groups=shown,
+        questions=questions,
+        total_groups=len(groups),
+        total_questions=sum(len(group) for group in groups),
+        page=page,
+        has_next=len(groups) > page * per_page,
+        threshold=near_duplicates.SIMILARITY_THRESHOLD
     )
 
+def flash_similar(question_id):
+    """
+    追加・編集した問題の署名を作り、ほぼ同じ問題があれば知らせる
+    """
+    near_duplicates.sync_signatures([question_id])
+    for group in near_duplicates.find_groups([question_id]):
+        others = ", ".join(str(qid) for qid in group.ids if qid != question_id)
+        flash(f'似ている問題があります（ID: {others}）。重複していないか確認してください。', 'warning')
+
 @app.route("/admin/question/delete/<int:id>", methods=["POST"])
+@admin_required
 def delete_question(id):
-    if not session.get("is_admin"):
-        return redirect("/")
-    
     question = Question.query.get_or_404(id)
     db.session.delete(question)
+    near_duplicates.forget([id])
+    bump_version()
     db.session.commit()
     flash('質問が削除されました。', 'success')
     return redirect(url_for("admin_questions"))
 
 @app.route("/admin/question/<int:id>", methods=["GET", "POST"])
+@admin_required
 def edit_question(id):
-    if not session.get("is_admin"):
-        return redirect("/")
-    
     question = Question.query.get_or_404(id)
 
     if request.method == "POST":
@@ -601,16 +747,18 @@ def edit_question(id):
         question.category = request.form["category"]
         question.rationale = request.form["rationale"]
         question.reference = request.form["reference"]
+        question.update_content_hash()
+        db.session.flush()
+        flash_similar(question.id)
+        bump_version()
         db.session.commit()
         return redirect(url_for("admin_questions"))
 
     return render_template("edit_question.html", question=question)
 
 @app.route("/admin/question/new", methods=["GET", "POST"])
+@admin_required
 def new_question():
-    if not session.get("is_admin"):
-        return redirect("/")
-
     if request.method == "POST":
         new_q = Question(
             question=request.form["question"],
@@ -623,50 +771,47 @@ def new_question():
             rationale=request.form["rationale"],
             reference=request.form["reference"]
         )
+        new_q.update_content_hash()
         db.session.add(new_q)
+        db.session.flush()
+        flash_similar(new_q.id)
+        bump_version()
         db.session.commit()
         return redirect(url_for("admin_questions"))
 
     return render_template("new_question.html")
 
 @app.route("/admin/export")
+@admin_required
 def export_questions():
-    if not session.get("is_admin"):
-        return redirect("/")
-
-    questions = Question.query.all()
-    
-    export_data = []
-    for q in questions:
-        export_data.append({
-            "question": q.question,
-            "choices": [q.choice1, q.choice2, q.choice3, q.choice4],
-            "correct": q.correct,
-            "category": q.category,
-            "rationale": q.rationale,
-            "reference": q.reference
-        })
-    
-    json_data = json.dumps(export_data, ensure_ascii=False, indent=4)
+    # ?format=json|ndjson|csv&gzip=1 。問題を少しずつ読みながらそのまま送る
+    fmt = request.args.get("format", "json")
+    if fmt not in question_export.FORMATS:
+        return "Unsupported format", 400
+    use_gzip = request.args.get("gzip") == "1"
+
+    mimetype, ext = question_export.FORMATS[fmt]
+    filename = f"questions_export.{ext}"
+    if use_gzip:
+        mimetype = "application/gzip"
+        filename += ".gz"
 
     return Response(
-        json_data,
-        mimetype='application/json',
-        headers={'Content-Disposition': 'attachment;filename=questions_export.json'}
+        stream_with_context(question_export.export_chunks(fmt, gzip=use_gzip)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment;filename={filename}'}
     )
 
 
 @app.route('/admin/users')
+@admin_required
 def admin_users():
-    if not session.get("is_admin"):
-        return redirect("/")
     users = User.query.filter_by(is_admin=False).all()
     return render_template('admin_users.html', users=users)
 
 @app.route('/admin/user/new', methods=['GET', 'POST'])
+@admin_required
 def new_user():
-    if not session.get("is_admin"):
-        return redirect("/")
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
@@ -684,9 +829,8 @@ def new_user():
     return render_template('new_user.html')
 
 @app.route('/admin/user/edit/<int:id>', methods=['GET', 'POST'])
+@admin_required
 def edit_user(id):
-    if not session.get("is_admin"):
-        return redirect("/")
     user = User.query.get_or_404(id)
     if request.method == 'POST':
         email = request.form.get('email')
@@ -700,31 +844,30 @@ def edit_user(id):
         if password:
             user.set_password(password)
         db.session.commit()
+        invalidate_profile(user.id)
         flash('ユーザー情報が更新されました。', 'success')
         return redirect(url_for('admin_users'))
     return render_template('edit_user.html', user=user)
 
 @app.route('/admin/user/delete/<int:id>', methods=['POST'])
+@admin_required
 def delete_user(id):
-    if not session.get("is_admin"):
-        return redirect("/")
     user = User.query.get_or_404(id)
     db.session.delete(user)
     db.session.commit()
+    invalidate_profile(id)
     flash('ユーザーが削除されました。', 'success')
     return redirect(url_for('admin_users'))
 
 @app.route('/admin/admins')
+@admin_required
 def admin_admins():
-    if not session.get("is_admin"):
-        return redirect("/")
     admins = User.query.filter_by(is_admin=True).all()
     return render_template('admin_admins.html', admins=admins)
 
 @app.route('/admin/admin/new', methods=['GET', 'POST'])
+@admin_required
 def new_admin():
-    if not session.get("is_admin"):
-        return redirect("/")
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
@@ -742,9 +885,8 @@ def new_admin():
     return render_template('new_admin.html')
 
 @app.route('/admin/admin/edit/<int:id>', methods=['GET', 'POST'])
+@admin_required
 def edit_admin(id):
-    if not session.get("is_admin"):
-        return redirect("/")
     admin = User.query.get_or_404(id)
     if request.method == 'POST':
         email = request.form.get('email')
@@ -758,14 +900,14 @@ def edit_admin(id):
         if password:
             admin.set_password(password)
         db.session.commit()
+        invalidate_profile(admin.id)
         flash('管理者情報が更新されました。', 'success')
         return redirect(url_for('admin_admins'))
     return render_template('edit_admin.html', user=admin)
 
 @app.route('/admin/admin/delete/<int:id>', methods=['POST'])
+@admin_required
 def delete_admin(id):
-    if not session.get("is_admin"):
-        return redirect("/")
     admin = User.query.get_or_404(id)
     # Prevent admin from deleting themselves
     if admin.email == session.get("user"):
@@ -774,134 +916,46 @@ def delete_admin(id):
 
     db.session.delete(admin)
     db.session.commit()
+    invalidate_profile(id)
     flash('管理者が削除されました。', 'success')
     return redirect(url_for('admin_admins'))
 
+def analytics_key():
+    # 受験結果が増えるか日付が変わるまで、/analytics_data の内容は変わらない
+    # （模擬試験の順位は他の人の受験でも変わるので、模擬試験の受験回数の合計もキーに含める。
+    #   順位は自分の受験結果があるときだけ出すので、合計は最新の結果と同じクエリで読む）
+    user_id = current_user_id()
+    latest = db.session.execute(
+        select(
+            QuizResult.id, QuizResult.timestamp,
+            score_histograms.total_attempts_column(analytics_queries.MOCK_EXAM_TYPES)
+        )
+        .where(QuizResult.user_id == user_id)
+        .order_by(QuizResult.timestamp.desc(), QuizResult.id.desc())
+        .limit(1)
+    ).first()
+    today = datetime.now(timezone.utc).date()
+    return f"{user_id}|{today}|{tuple(latest) if latest else None}|{app.config['ANALYTICS_USE_ROLLUPS']}"
+
 @app.route('/analytics_data')
+@api_login_required
+@conditional(analytics_key)
 def analytics_data():
-    if "user" not in session:
-        return jsonify({})
-    
-    user = User.query.filter_by(email=session["user"]).first()
+    user = current_user()
     if not user:
         return jsonify({})
     
-    now = datetime.now()
-    
-    # 1. Weekly Trend (Last 2 months = approx 8 weeks)
-    weekly_data = []
-    weekly_labels = []
-    
-    # Start from 8 weeks ago
-    start_date = now - timedelta(weeks=8)
-    
-    # Get all results for user in range to minimize DB hits? No, simple query is fine.
-    # Actually, iterate weeks
-    for i in range(8):
-        w_start = start_date + timedelta(weeks=i)
-        w_end = w_start + timedelta(weeks=1)
-        w_label = w_start.strftime('%m/%d')
-        weekly_labels.append(w_label)
-        
-        # Filter results in this week
-        results_week = QuizResult.query.filter(
-            QuizResult.user_id == user.id,
-            QuizResult.timestamp >= w_start,
-            QuizResult.timestamp < w_end
-        ).all()
-        
-        if results_week:
-            total_q = sum(r.total_questions for r in results_week)
-            total_c = sum(r.correct_answers for r in results_week)
-            rate = (total_c / total_q) * 100 if total_q > 0 else 0
-            weekly_data.append(round(rate, 1))
-        else:
-            weekly_data.append(0)
-            
-    # 2. Section Rate (Last 1 month)
-    section_labels = [f"{i}章" for i in range(1, 17)]
-    section_data = [0] * 16
-    
-    start_date_month = now - timedelta(days=30)
-    # Get ALL results in last month (including mocks)
-    results_month = QuizResult.query.filter(
-        QuizResult.user_id == user.id,
-        QuizResult.timestamp >= start_date_month
-    ).all()
-    
-    section_sums = {} # key: section_idx (0-15), val: {total_q, total_c}
-    
-    for r in results_month:
-        # If details exist, use details (more accurate for mixed exams)
-        if r.details:
-            try:
-                details = json.loads(r.details)
-                for d in details:
-                    cat = d.get('category') # e.g., "section_1"
-                    if cat and cat.startswith('section_'):
-                        try:
-                            sec_num = int(cat.split('_')[1])
-                            if 1 <= sec_num <= 16:
-                                idx = sec_num - 1
-                                if idx not in section_sums: section_sums[idx] = {'q': 0, 'c': 0}
-                                section_sums[idx]['q'] += 1
-                                if d.get('is_correct'):
-                                    section_sums[idx]['c'] += 1
-                        except: pass
-            except: pass
-        
-        # Fallback for old records (section tests only) without details
-        elif r.exam_type.startswith('section_') and r.exam_type != 'section_all':
-            try:
-                sec_num = int(r.exam_type.split('_')[1])
-                if 1 <= sec_num <= 16:
-                    idx = sec_num - 1
-                    if idx not in section_sums:
-                        section_sums[idx] = {'q': 0, 'c': 0}
-                    section_sums[idx]['q'] += r.total_questions
-                    section_sums[idx]['c'] += r.correct_answers
-            except:
-                continue
-            
-    for idx, vals in section_sums.items():
-        if vals['q'] > 0:
-            section_data[idx] = round((vals['c'] / vals['q']) * 100, 1)
-            
-    # 3. Random Mock Trend (Last 10)
-    mock_random = QuizResult.query.filter(
-        QuizResult.user_id == user.id,
-        QuizResult.exam_type == 'random'
-    ).order_by(QuizResult.timestamp.desc()).limit(10).all()
-    
-    mock_random.reverse() # Oldest to newest
-    random_labels = [r.timestamp.strftime('%m/%d %H:%M') for r in mock_random]
-    random_scores = [r.correct_answers for r in mock_random]
-    random_rates = [round((r.correct_answers/r.total_questions)*100, 1) if r.total_questions > 0 else 0 for r in mock_random]
-    
-    # 4. Weakness Mock Trend (Last 10)
-    mock_weakness = QuizResult.query.filter(
-        QuizResult.user_id == user.id,
-        QuizResult.exam_type == 'weakness'
-    ).order_by(QuizResult.timestamp.desc()).limit(10).all()
-    
-    mock_weakness.reverse()
-    weakness_labels = [r.timestamp.strftime('%m/%d %H:%M') for r in mock_weakness]
-    weakness_scores = [r.correct_answers for r in mock_weakness]
-    weakness_rates = [round((r.correct_answers/r.total_questions)*100, 1) if r.total_questions > 0 else 0 for r in mock_weakness]
-    
-    return jsonify({
-        'weekly': {'labels': weekly_labels, 'data': weekly_data},
-        'section': {'labels': section_labels, 'data': section_data},
-        'random': {'labels': random_labels, 'scores': random_scores, 'rates': random_rates},
-        'weakness': {'labels': weakness_labels, 'scores': weakness_scores, 'rates': weakness_rates}
-    })
+    # 集計テーブルの日付（UTC）に合わせる
+    today = datetime.now(timezone.utc).date()
+
+    return jsonify(analytics_queries.compute_analytics(
+        user.id, today, use_rollups=app.config["ANALYTICS_USE_ROLLUPS"]
+    ))
 
 @app.route('/analytics')
+@login_required
 def analytics():
-    if "user" not in session:
-        return redirect("/")
-    
-    user = User.query.filter_by(email=session["user"]).first()
+    user = current_profile()
     return render_template('analytics.html', user=user)
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+"""
+静的ファイル（Bootstrap・Chart.js など）の配信
+
+CDN を使わず static/ に置いたファイルを配信する。build_assets.py を実行すると、
+中身のハッシュを付けたファイル名のコピーと、圧縮済みの .gz / .br が static/dist/ にでき、
+対応表が static/dist/manifest.json に書かれる。
+
+・テンプレートでは {{ asset_url('vendor/bootstrap/bootstrap.min.css') }} のように static/ からの
+  パスで書く。manifest.json にあればハッシュ付きの URL（/assets/...）、なければ通常の /static/... を返す
+・/assets/... はファイル名が中身ごとに変わるので、1年間キャッシュさせる（immutable）。
+  ブラウザが対応していれば、圧縮済みの .br / .gz をそのまま返す
+"""
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Accept-Encoding と、圧縮済みファイルの拡張子（優先する順）
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+
+def load_manifest(app):
+    path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_assets(app):
+    manifest = load_manifest(app)
+    # ビルドし直すと URL が変わるので、画面の ETag（http_cache.template_key）にも含める
+    app.config["ASSET_VERSION"] = hashlib.sha1(
+        json.dumps(manifest, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:12]
+    dist_folder = os.path.join(app.static_folder, DIST_DIR)
+
+    def asset_url(name):
+        hashed = manifest.get(name)
+        if hashed is None:
+            # build_assets.py を実行していなければ、元のファイルを返す
+            return url_for("static", filename=name)
+        return url_for("asset", filename=hashed)
+
+    def asset(filename):
+        path = safe_join(dist_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        accept = request.accept_encodings
+        for encoding, ext in PRECOMPRESSED:
+            if accept[encoding] and os.path.isfile(path + ext):
+                response = send_file(path + ext, mimetype=mimetype)
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_file(path, mimetype=mimetype)
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    app.add_url_rule("/assets/<path:filename>", "asset", asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+    return manifest
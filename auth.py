@@ -0,0 +1,109 @@
+"""
+ログイン状態の取り扱い
+
+・ログイン時にセッションへユーザーIDを保存し、ユーザーは1リクエストにつき最大1回、
+  主キーで読み込んで g に置く（current_user()）
+・表示だけに使うプロフィール（メールアドレス・ニックネームなど）は、
+  USER_PROFILE_CACHE_TTL 秒だけプロセス内にキャッシュできる（current_profile()）
+・各ルートの「ログインしていなければ / へ」「管理者でなければ / へ」はデコレーターで行う
+"""
+import threading
+import time
+from collections import namedtuple
+from functools import wraps
+
+from flask import current_app, g, jsonify, redirect, session
+
+from database import db
+from model import User
+
+UserProfile = namedtuple("UserProfile", ["id", "email", "nickname", "is_admin", "is_active"])
+
+_profile_cache = {}  # {user_id: (有効期限, UserProfile)}
+_profile_lock = threading.Lock()
+
+
+def login_user(user):
+    session["user"] = user.email
+    session["user_id"] = user.id
+    session["is_admin"] = user.is_admin
+
+
+def current_user_id():
+    user_id = session.get("user_id")
+    if user_id is None and "user" in session:
+        # ユーザーIDを持たない古いセッションは、1回だけメールアドレスで引いて補う
+        user_id = db.session.query(User.id).filter_by(email=session["user"]).scalar()
+        if user_id is not None:
+            session["user_id"] = user_id
+    return user_id
+
+
+def current_user():
+    """
+    ログイン中のユーザー（ORM オブジェクト）。同じリクエスト内では2回目以降DBを読まない
+    """
+    if "current_user" not in g:
+        user_id = current_user_id()
+        g.current_user = db.session.get(User, user_id) if user_id is not None else None
+    return g.current_user
+
+
+def current_profile():
+    """
+    表示用のプロフィール。TTL が設定されていればプロセス内のキャッシュから返す
+    """
+    ttl = current_app.config.get("USER_PROFILE_CACHE_TTL", 0)
+    user_id = current_user_id()
+    if user_id is None:
+        return None
+
+    if ttl > 0:
+        with _profile_lock:
+            cached = _profile_cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+    user = current_user()
+    if user is None:
+        return None
+    profile = UserProfile(user.id, user.email, user.nickname, user.is_admin, user.is_active)
+    if ttl > 0:
+        with _profile_lock:
+            _profile_cache[user_id] = (time.monotonic() + ttl, profile)
+    return profile
+
+
+def invalidate_profile(user_id):
+    with _profile_lock:
+        _profile_cache.pop(user_id, None)
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if "user" not in session:
+            return redirect("/")
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def api_login_required(view):
+    """
+    JSON を返すルート用。未ログインなら空の JSON を返す
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if "user" not in session:
+            return jsonify({})
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not session.get("is_admin"):
+            return redirect("/")
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,107 @@
+"""
+/analytics_data の集計のベンチマーク
+
+受験回数（quiz_results の件数）が 10 ～ 100,000 件のユーザーを一時DBに作り、
+・集計テーブル（analytics_rollup）を使う場合
+・生データを SQL で集計する場合（analytics_queries.weekly_and_sections）
+それぞれの1リクエストあたりの集計時間（中央値）を表示する。
+
+    python bench_analytics.py [件数 ...]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+# app を読み込む前に、一時DBを向ける
+_tmp_dir = tempfile.mkdtemp(prefix="bench_analytics_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp_dir, "bench.db")
+
+from app import app
+from database import db
+from model import User, QuizResult, QuizAnswer
+from analytics_rollup import rebuild_rollups
+import analytics_queries
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+ATTEMPTS_PER_DAY = 20      # 1日あたりの受験回数（これより古い履歴ほど集計範囲の外に出る）
+ANSWERS_PER_ATTEMPT = 5
+EXAM_TYPES = ["random", "weakness", "training", "section_section_1"]
+REPEAT = 30
+INSERT_BATCH_SIZE = 5000
+
+
+def seed_user(n_attempts, rng):
+    user = User(email=f"bench{n_attempts}@example.com", is_active=True)
+    db.session.add(user)
+    db.session.flush()
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    step = timedelta(days=1) / ATTEMPTS_PER_DAY
+    next_id = (db.session.query(db.func.max(QuizResult.id)).scalar() or 0) + 1
+
+    results = []
+    answers = []
+    for i in range(n_attempts):
+        result_id = next_id + i
+        timestamp = now - step * i
+        correct = 0
+        for _ in range(ANSWERS_PER_ATTEMPT):
+            is_correct = rng.random() < 0.6
+            correct += is_correct
+            answers.append({
+                "result_id": result_id,
+                "user_id": user.id,
+                "question_id": rng.randint(1, 300),
+                "category": f"section_{rng.randint(1, 16)}",
+                "is_correct": is_correct,
+                "timestamp": timestamp,
+            })
+        results.append({
+            "id": result_id,
+            "user_id": user.id,
+            "exam_type": rng.choice(EXAM_TYPES),
+            "total_questions": ANSWERS_PER_ATTEMPT,
+            "correct_answers": correct,
+            "timestamp": timestamp,
+        })
+
+    for start in range(0, len(results), INSERT_BATCH_SIZE):
+        db.session.execute(QuizResult.__table__.insert(), results[start:start + INSERT_BATCH_SIZE])
+    for start in range(0, len(answers), INSERT_BATCH_SIZE):
+        db.session.execute(QuizAnswer.__table__.insert(), answers[start:start + INSERT_BATCH_SIZE])
+    rebuild_rollups(user.id)
+    db.session.commit()
+    return user.id
+
+
+def measure(func):
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+        # 毎回DBから読ませるため、セッションの状態を捨てる
+        db.session.rollback()
+    return statistics.median(samples)
+
+
+def main(sizes):
+    rng = random.Random(0)
+    today = datetime.now(timezone.utc).date()
+    with app.app_context():
+        db.create_all()
+
+        print(f"{'attempts':>10} {'rollup (ms)':>12} {'raw SQL (ms)':>13}")
+        for n_attempts in sizes:
+            user_id = seed_user(n_attempts, rng)
+            rollup_ms = measure(lambda: analytics_queries.compute_analytics(user_id, today, use_rollups=True))
+            raw_ms = measure(lambda: analytics_queries.compute_analytics(user_id, today, use_rollups=False))
+            print(f"{n_attempts:>10} {rollup_ms:>12.2f} {raw_ms:>13.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,128 @@
+"""
+DB エンジン設定プロファイル（db_profile.py）の同時実行ベンチマーク
+
+一時DBに問題とユーザーを用意し、書き込み側（/submit_practice）と読み込み側（/analytics_data）の
+ワーカープロセスを同時に動かして、プロファイルごとの処理件数・レイテンシ・エラー件数
+（"database is locked" などでエラーになったリクエスト。出題に失敗して提出できなかった分も含む）を表示する。
+
+    python bench_concurrency.py [秒数] [書き込みワーカー数] [読み込みワーカー数]
+"""
+import multiprocessing
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+PROFILES = ["none", "sqlite"]
+QUESTIONS_PER_SUBMIT = 20
+_EXAM_TOKEN_RE = re.compile(r'name="exam_token" value="([^"]+)"')
+# 問題は画面に埋め込んだ JSON（exam_pages.html）にある。QUESTIONS_PER_SUBMIT 問なら最初のページに収まる
+_QUESTION_RE = re.compile(r'"id": (\d+)')
+
+
+def _setup_env(db_path, profile):
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    os.environ["DB_PROFILE"] = profile
+    # 集計バッファは毎回書き込ませて、書き込みの競合を増やす
+    os.environ["ANSWER_STATS_FLUSH_SIZE"] = "1"
+
+
+def seed(db_path, profile, n_users):
+    _setup_env(db_path, profile)
+    from app import app
+    from database import db
+    from model import User
+    import import_questions
+
+    with app.app_context():
+        db.create_all()
+    import_questions.import_json("questions.json")
+    with app.app_context():
+        for i in range(n_users):
+            user = User(email=f"bench{i}@example.com", is_active=True)
+            user.set_password("bench")
+            db.session.add(user)
+        db.session.commit()
+
+
+def worker(db_path, profile, role, index, duration, queue):
+    _setup_env(db_path, profile)
+    import logging
+    from app import app
+
+    # 失敗は件数として数えるので、スタックトレースは出さない
+    app.logger.disabled = True
+    logging.getLogger("werkzeug").disabled = True
+
+    client = app.test_client()
+    client.post("/try_login", data={"email": f"bench{index}@example.com", "password": "bench"})
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        if role == "write":
+            # 出題（exam_instances への書き込み）も競合に含めるが、計測は提出だけにする
+            html = client.get(f"/practice?num_questions={QUESTIONS_PER_SUBMIT}&test_type=training").get_data(as_text=True)
+            token = _EXAM_TOKEN_RE.search(html)
+            form = {f"question_{qid}": str(int(qid) % 4 + 1) for qid in _QUESTION_RE.findall(html)}
+            form["exam_token"] = token.group(1) if token else ""
+        started = time.perf_counter()
+        if role == "write":
+            response = client.post("/submit_practice", data=form)
+        else:
+            response = client.get("/analytics_data")
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+    queue.put((role, latencies, errors))
+
+
+def run_profile(profile, duration, writers, readers):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    db_path = os.path.join(tmp_dir, "bench.db")
+
+    ctx = multiprocessing.get_context("spawn")
+    seeder = ctx.Process(target=seed, args=(db_path, profile, writers + readers))
+    seeder.start()
+    seeder.join()
+
+    queue = ctx.Queue()
+    processes = []
+    for i in range(writers + readers):
+        role = "write" if i < writers else "read"
+        processes.append(ctx.Process(target=worker, args=(db_path, profile, role, i, duration, queue)))
+    for p in processes:
+        p.start()
+    outcomes = [queue.get() for _ in processes]
+    for p in processes:
+        p.join()
+
+    for role in ("write", "read"):
+        latencies = [ms for r, samples, _ in outcomes if r == role for ms in samples]
+        errors = sum(e for r, _, e in outcomes if r == role)
+        if not latencies:
+            continue
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(
+            f"{profile:>8} {role:>6} {len(latencies) / duration:>9.1f} "
+            f"{statistics.median(latencies):>9.1f} {p95:>9.1f} {errors:>7}"
+        )
+
+
+def main(duration, writers, readers):
+    print(f"{'profile':>8} {'role':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for profile in PROFILES:
+        run_profile(profile, duration, writers, readers)
+
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]]
+    main(
+        args[0] if len(args) > 0 else 10,
+        int(args[1]) if len(args) > 1 else 4,
+        int(args[2]) if len(args) > 2 else 4,
+    )
@@ -0,0 +1,110 @@
+"""
+似ている問題の検出（near_duplicates.py）のベンチマーク
+
+questions.json の問題文・選択肢を組み合わせて N 問（既定 100,000 問）の問題バンクを一時DBに作る。
+そのうち 1/10 は、前に作った問題の語尾を変えただけの「ほぼ同じ問題」にしておき、
+・最初の取り込み（全問の署名を作る）と、100 問を追加した取り込み（追加分だけ署名を作る）の時間
+・全体のグループ分け（/admin/duplicates と同じ）の時間
+・ほぼ同じ問題として作った問題のうち、元の問題と同じグループに入ったものの割合
+を表示する。
+
+    python bench_duplicates.py [問題数]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# app を読み込む前に、一時DBを向ける
+_tmp_dir = tempfile.mkdtemp(prefix="bench_duplicates_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp_dir, "bench.db")
+
+from sqlalchemy import select
+
+from app import app
+from database import db
+from model import Question
+import import_questions
+import near_duplicates
+
+DEFAULT_SIZE = 100000
+NEAR_COPY_EVERY = 10
+INCREMENT = 100
+SUFFIXES = ["", "？", "（改）", "か。", " "]
+
+
+def make_items(size, seed=1):
+    """
+    (問題, ほぼ同じ問題として作ったときの元の問題の番号 or None) を size 件
+    """
+    with open("questions.json", "r", encoding="utf-8") as f:
+        base = json.load(f)
+    rnd = random.Random(seed)
+    fragments = [part for item in base for part in item["question"].split("、") if part]
+    items = []
+    for i in range(size):
+        if i and i % NEAR_COPY_EVERY == 0:
+            source = rnd.randrange(i)
+            item = dict(items[source][0])
+            item["question"] = item["question"].rstrip("？") + rnd.choice(SUFFIXES)
+            items.append((item, source))
+            continue
+        item = dict(rnd.choice(base))
+        item["question"] = f"{rnd.choice(fragments)}（{i}）、{rnd.choice(fragments)}"
+        item["choices"] = [rnd.choice(base)["choices"][k] for k in range(4)]
+        items.append((item, None))
+    return items
+
+
+def write_source(path, items):
+    with open(path, "w", encoding="utf-8") as out:
+        for item, _ in items:
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def recall(items):
+    """
+    ほぼ同じ問題として作った問題のうち、元の問題と同じグループに入った割合
+    """
+    ids = dict(db.session.execute(select(Question.content_hash, Question.id)).all())
+    id_of = [ids.get(import_questions.to_row(item)["content_hash"]) for item, _ in items]
+    group_of = {}
+    for n, group in enumerate(near_duplicates.find_groups()):
+        for qid in group.ids:
+            group_of[qid] = n
+    planted = [(id_of[i], id_of[source]) for i, (_, source) in enumerate(items) if source is not None]
+    # 元と全く同じ内容になったもの（ファイル内の重複として取り込まれないもの）は数えない
+    planted = [(a, b) for a, b in planted if a is not None and a != b]
+    found = sum(1 for a, b in planted if a in group_of and group_of.get(a) == group_of.get(b))
+    return found, len(planted)
+
+
+def main(size):
+    items = make_items(size + INCREMENT)
+    source = os.path.join(_tmp_dir, "questions.ndjson")
+    write_source(source, items[:size])
+    with app.app_context():
+        db.create_all()
+
+    started = time.perf_counter()
+    import_questions.import_file(source, delete_missing=False)
+    print(f"取り込み {size} 問: {time.perf_counter() - started:.1f} 秒（全問の署名を作る）")
+
+    write_source(source, items)
+    started = time.perf_counter()
+    import_questions.import_file(source, delete_missing=False)
+    print(f"{INCREMENT} 問を追加: {time.perf_counter() - started:.1f} 秒（追加分だけ署名を作る）")
+
+    with app.app_context():
+        started = time.perf_counter()
+        groups = near_duplicates.find_groups()
+        print(f"グループ分け: {time.perf_counter() - started:.2f} 秒 "
+              f"（{len(groups)} グループ / {sum(len(group) for group in groups)} 問）")
+        found, planted = recall(items)
+        print(f"ほぼ同じ問題の検出率: {found} / {planted} ({found / max(planted, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
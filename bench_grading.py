@@ -0,0 +1,100 @@
+"""
+採点エンジン（grading.py）のマイクロベンチマーク
+
+questions.json から問題バンクのスナップショットを作り（DB は使わない）、
+5問・100問・全問の試験について、1回の提出あたりの採点時間（中央値）を
+・以前の採点ループ（1問ずつ choices を作って比較）
+・正解表（AnswerKey）を使った採点（正解表の作成を含む / 出題時に作成済み）
+で比べて表示する。
+
+    python bench_grading.py [問題数 ...]   # 問題数に all も指定できる
+"""
+import json
+import random
+import statistics
+import sys
+import time
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from grading import compile_answer_key
+from question_cache import BankSnapshot, QuestionRecord
+
+DEFAULT_SIZES = ["5", "100", "all"]
+REPEAT = 2000
+
+
+def load_bank(path="questions.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    records = {}
+    for qid, item in enumerate(data, start=1):
+        records[qid] = QuestionRecord(
+            qid, item["question"], *item["choices"], item["correct"],
+            item.get("category", "none"), item.get("rationale"), item.get("reference"),
+        )
+    return BankSnapshot(1, records)
+
+
+def legacy_grade(bank, ids, form):
+    # 以前の submit_practice / submit_section の採点ループ
+    results = []
+    score = 0
+    for q in bank.questions(ids):
+        selected_choice_val = form.get(f'question_{q.id}')
+        selected_choice_index = None
+        user_answer_text = "未回答"
+        if selected_choice_val is not None:
+            selected_choice_index = int(selected_choice_val)
+            choices = [q.choice1, q.choice2, q.choice3, q.choice4]
+            user_answer_text = choices[selected_choice_index - 1]
+        is_correct = (selected_choice_index == q.correct)
+        if is_correct:
+            score += 1
+        results.append({
+            'question': q,
+            'user_answer': user_answer_text,
+            'selected_choice_index': selected_choice_index,
+            'correct_choice_index': q.correct,
+            'is_correct': is_correct
+        })
+    rows = [(r['question'].id, r['question'].category, r['is_correct']) for r in results]
+    return score, rows
+
+
+def engine_grade(bank, ids, form):
+    graded = compile_answer_key(bank, ids).grade(form)
+    return graded.score, list(graded.answer_rows())
+
+
+def measure(fn):
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return statistics.median(samples)
+
+
+def main(sizes):
+    rng = random.Random(0)
+    bank = load_bank()
+
+    print(f"{'questions':>10} {'legacy (us)':>12} {'engine (us)':>12} {'grade only (us)':>16}")
+    for size in sizes:
+        ids = list(bank.all_ids) if size == "all" else rng.sample(bank.all_ids, int(size))
+        # 8割回答し、残りは未回答
+        form = ImmutableMultiDict(
+            (f"question_{qid}", str(rng.randint(1, 4))) for qid in ids if rng.random() < 0.8
+        )
+        assert legacy_grade(bank, ids, form) == engine_grade(bank, ids, form)
+
+        key = compile_answer_key(bank, ids)
+        legacy_us = measure(lambda: legacy_grade(bank, ids, form))
+        engine_us = measure(lambda: engine_grade(bank, ids, form))
+        grade_us = measure(lambda: key.grade(form))
+        print(f"{len(ids):>10} {legacy_us:>12.1f} {engine_us:>12.1f} {grade_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_SIZES)
@@ -0,0 +1,469 @@
+"""
+試験日を想定した負荷テスト
+
+一時DB（--db で指定したファイル）にユーザー・問題・過去の受験履歴（quiz_results / quiz_answers）を作り、
+ローカルにサーバーを起動して、仮想ユーザー（1人 = 1プロセス）に次の流れを同時に繰り返させる。
+・特訓講座: /practice で出題 → 残りの問題を /api/exam/questions で読む → /submit_practice → /analytics_data
+・章別テスト: /section_test で出題 → 残りの問題を /api/exam/questions で読む → /submit_section
+最初に /try_login でログインする。ルートごとの件数・スループット（req/s）・
+p50 / p95 / p99 レイテンシ・エラー件数（ステータス 400 以上と接続エラー）を表示する。
+
+--save-baseline で結果を JSON に保存し、--baseline で保存した結果と比べる。
+p95 / p99 が TOLERANCE より遅くなった・スループットが TOLERANCE より下がったルートがあれば終了コード 1 で終わる。
+
+    python bench_load.py --save-baseline baseline.json         # 基準を測って保存する
+    python bench_load.py --baseline baseline.json              # 変更後に測って比べる
+    python bench_load.py --users 200 --questions 10000 --results 100000 --concurrency 16 --duration 60
+
+起動済みのサーバーに対して測るときは、先にデータだけ作ってから --url で指定する。
+
+    python bench_load.py --db load.db --seed-only
+    DATABASE_URL=sqlite:///$PWD/load.db python app.py   # など
+    python bench_load.py --db load.db --url http://127.0.0.1:5000
+
+DB_PROFILE などの環境変数は、そのままサーバーに渡る。
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_USERS = 50
+DEFAULT_QUESTIONS = 2000
+DEFAULT_RESULTS = 20000
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DURATION = 30
+DEFAULT_WARMUP = 5
+TOLERANCE = 0.2  # 基準との差をどこまで許すか（0.2 = 20%）
+
+PASSWORD = "bench"
+HISTORY_DAYS = 90
+ANSWERS_PER_RESULT = 10
+HISTORY_EXAM_TYPES = ["training", "random", "weakness", "section_section_1", "section_section_2"]
+SECTIONS = 16
+PRACTICE_QUESTIONS = 20
+# 流れの選ばれやすさ
+SCENARIOS = {"practice": 3, "section": 1}
+INSERT_BATCH_SIZE = 5000
+SERVER_START_TIMEOUT = 60
+REQUEST_TIMEOUT = 60
+
+_EXAM_CONFIG_RE = re.compile(r'<script type="application/json" id="exam-config">(.*?)</script>', re.S)
+
+
+# ---------------------------------------------------------------- データ作成
+
+def make_questions(n_questions, rng):
+    """
+    questions.json の問題を元に、問題文に番号を付けて n_questions 問を作る（章は元の問題と同じ）
+    """
+    with open("questions.json", "r", encoding="utf-8") as f:
+        base = json.load(f)
+    items = []
+    for i in range(n_questions):
+        item = dict(rng.choice(base))
+        item["question"] = f"{item['question']}（{i + 1}）"
+        items.append(item)
+    return items
+
+
+def seed(db_path, n_users, n_questions, n_results, seed_value=0):
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    from app import app
+    from database import db
+    from model import Question, QuizAnswer, QuizResult, User
+    from analytics_rollup import rebuild_rollups
+    from score_histograms import rebuild_histograms
+    from spaced_repetition import rebuild_learning_states
+    from sqlalchemy import bindparam, func, select
+    import import_questions
+
+    rng = random.Random(seed_value)
+    source = os.path.join(os.path.dirname(db_path), "questions.ndjson")
+    with open(source, "w", encoding="utf-8") as out:
+        for item in make_questions(n_questions, rng):
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    import_questions.import_file(source, delete_missing=False)
+
+    with app.app_context():
+        db.create_all()
+        # パスワードのハッシュは遅いので、1回だけ計算して全員に使う
+        template = User(email="template@example.com")
+        template.set_password(PASSWORD)
+        db.session.execute(User.__table__.insert(), [
+            {"email": f"load{i}@example.com", "password_hash": template.password_hash, "is_active": True}
+            for i in range(n_users)
+        ])
+        user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+        questions = db.session.execute(select(Question.id, Question.category)).all()
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        span = timedelta(days=HISTORY_DAYS).total_seconds()
+        next_id = (db.session.scalar(select(func.max(QuizResult.id))) or 0) + 1
+        counters = {}
+        results = []
+        answers = []
+
+        def write():
+            db.session.execute(QuizResult.__table__.insert(), results)
+            db.session.execute(QuizAnswer.__table__.insert(), answers)
+            results.clear()
+            answers.clear()
+
+        for i in range(n_results):
+            user_id = rng.choice(user_ids)
+            timestamp = now - timedelta(seconds=rng.random() * span)
+            correct = 0
+            for qid, category in rng.sample(questions, min(ANSWERS_PER_RESULT, len(questions))):
+                correct_choice = rng.randint(1, 4)
+                selected = correct_choice if rng.random() < 0.6 else rng.randint(1, 4)
+                is_correct = selected == correct_choice
+                correct += is_correct
+                total, right = counters.get(qid, (0, 0))
+                counters[qid] = (total + 1, right + is_correct)
+                answers.append({
+                    "result_id": next_id + i,
+                    "user_id": user_id,
+                    "question_id": qid,
+                    "category": category,
+                    "is_correct": is_correct,
+                    "selected_choice": selected,
+                    "correct_choice": correct_choice,
+                    "timestamp": timestamp,
+                })
+            results.append({
+                "id": next_id + i,
+                "user_id": user_id,
+                "exam_type": rng.choice(HISTORY_EXAM_TYPES),
+                "total_questions": ANSWERS_PER_RESULT,
+                "correct_answers": correct,
+                "timestamp": timestamp,
+            })
+            if len(answers) >= INSERT_BATCH_SIZE:
+                write()
+        if results:
+            write()
+
+        # 問題ごとの回答数・正解数（苦手克服・特訓講座の出題に使う）も履歴と合わせる
+        q = Question.__table__
+        db.session.execute(
+            q.update().where(q.c.id == bindparam("b_id")).values(
+                total_count=bindparam("b_total"), correct_count=bindparam("b_correct")
+            ),
+            [{"b_id": qid, "b_total": total, "b_correct": right} for qid, (total, right) in counters.items()],
+        )
+        # 集計テーブルは rebuild_analytics.py と同じように作り直す
+        rebuild_rollups()
+        rebuild_histograms()
+        rebuild_learning_states()
+        db.session.commit()
+
+
+# ---------------------------------------------------------------- サーバー
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(db_path, port):
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger("werkzeug").disabled = True
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def wait_for_server(base_url):
+    deadline = time.perf_counter() + SERVER_START_TIMEOUT
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).read()
+            return
+        except urllib.error.HTTPError:
+            return  # 応答があれば起動している
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"サーバーが起動しません: {base_url}")
+
+
+# ---------------------------------------------------------------- 仮想ユーザー
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # リダイレクト先は別のリクエストとして数えないよう、たどらない
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    """
+    1人分のブラウザ（Cookie を持ち、リクエストごとに (ルート, 開始時刻, ミリ秒, 成否) を記録する）
+    """
+
+    def __init__(self, base_url, started):
+        self.base_url = base_url
+        self.started = started
+        self.samples = []
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, label, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=REQUEST_TIMEOUT) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            status, body = None, b""
+        elapsed = (time.perf_counter() - started) * 1000
+        ok = status is not None and status < 400
+        self.samples.append((label, started - self.started, elapsed, ok))
+        return body.decode("utf-8", "replace") if ok else None
+
+    def login(self, email):
+        self.request("POST /try_login", "/try_login", {"email": email, "password": PASSWORD})
+
+    def take_exam(self, label, path, rng):
+        """
+        出題 → 残りのページの読み込み。提出するフォームを返す（出題に失敗したら None）
+        """
+        html = self.request(label, path)
+        match = _EXAM_CONFIG_RE.search(html or "")
+        if not match:
+            return None
+        exam = json.loads(match.group(1))
+        items = list(exam["first_page"])
+        while len(items) < exam["total"]:
+            query = urllib.parse.urlencode({"token": exam["exam_token"], "offset": len(items)})
+            page = self.request("GET /api/exam/questions", f"{exam['questions_url']}?{query}")
+            if page is None or not json.loads(page)["items"]:
+                break
+            items.extend(json.loads(page)["items"])
+        form = {f"question_{item['id']}": str(rng.randint(1, 4)) for item in items}
+        form["exam_token"] = exam["exam_token"]
+        return form
+
+    def practice(self, rng):
+        form = self.take_exam(
+            "GET /practice", f"/practice?num_questions={PRACTICE_QUESTIONS}&test_type=training", rng
+        )
+        if form is None:
+            return
+        form["test_type"] = "training"
+        self.request("POST /submit_practice", "/submit_practice", form)
+        self.request("GET /analytics_data", "/analytics_data")
+
+    def section(self, rng):
+        form = self.take_exam(
+            "GET /section_test", f"/section_test?category=section_{rng.randint(1, SECTIONS)}", rng
+        )
+        if form is None:
+            return
+        self.request("POST /submit_section", "/submit_section", form)
+
+
+def worker(base_url, index, n_users, duration, think, queue):
+    rng = random.Random(index)
+    started = time.perf_counter()
+    user = VirtualUser(base_url, started)
+    user.login(f"load{index % n_users}@example.com")
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name] for name in names]
+    while time.perf_counter() - started < duration:
+        getattr(user, rng.choices(names, weights)[0])(rng)
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+    queue.put(user.samples)
+
+
+# ---------------------------------------------------------------- 集計
+
+def percentile(sorted_values, p):
+    """
+    最近傍順位法のパーセンタイル（sorted_values は昇順）
+    """
+    return sorted_values[max(math.ceil(len(sorted_values) * p / 100) - 1, 0)]
+
+
+def summarize(samples, measured_seconds):
+    """
+    {ルート: {count, rps, p50, p95, p99, errors}}。"全体" にすべてのリクエストをまとめる
+    """
+    by_route = {}
+    for label, _, elapsed, ok in samples:
+        by_route.setdefault(label, []).append((elapsed, ok))
+        by_route.setdefault("全体", []).append((elapsed, ok))
+    summary = {}
+    for label, rows in by_route.items():
+        latencies = sorted(elapsed for elapsed, _ in rows)
+        summary[label] = {
+            "count": len(rows),
+            "rps": len(rows) / measured_seconds,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "errors": sum(1 for _, ok in rows if not ok),
+        }
+    return summary
+
+
+def _route_order(summary):
+    return sorted(summary, key=lambda label: (label == "全体", label))
+
+
+def print_summary(summary):
+    print(f"{'route':<26} {'count':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for label in _route_order(summary):
+        s = summary[label]
+        print(
+            f"{label:<26} {s['count']:>7} {s['rps']:>8.1f} "
+            f"{s['p50']:>9.1f} {s['p95']:>9.1f} {s['p99']:>9.1f} {s['errors']:>7}"
+        )
+
+
+def compare(summary, baseline, tolerance):
+    """
+    基準との比（今回 / 基準）を表示し、悪化したルートの名前を返す
+    """
+    print()
+    print(f"基準との比較（今回 / 基準、{tolerance:.0%} を超える悪化に * を付ける）")
+    print(f"{'route':<26} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>13}")
+    regressions = []
+    for label in _route_order(summary):
+        current = summary[label]
+        base = baseline["routes"].get(label)
+        if base is None:
+            print(f"{label:<26} （基準なし）")
+            continue
+        cells = []
+        worse = False
+        for key in ("rps", "p50", "p95", "p99"):
+            ratio = current[key] / base[key] if base[key] else float("inf")
+            # スループットは下がったら、レイテンシは p95 / p99 が上がったら悪化とする
+            bad = ratio < 1 - tolerance if key == "rps" else (key != "p50" and ratio > 1 + tolerance)
+            worse = worse or bad
+            cells.append(f"{ratio:>7.2f}{'*' if bad else ' '}")
+        bad_errors = current["errors"] > base["errors"]
+        worse = worse or bad_errors
+        errors = f"{base['errors']}->{current['errors']}{'*' if bad_errors else ' '}"
+        print(f"{label:<26} {' '.join(cells)} {errors:>13}")
+        if worse:
+            regressions.append(label)
+    return regressions
+
+
+# ---------------------------------------------------------------- 実行
+
+def run(args):
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(prefix="bench_load_"), "load.db")
+    config = {
+        "users": args.users, "questions": args.questions, "results": args.results,
+        "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+        "think": args.think, "scenarios": SCENARIOS,
+    }
+    ctx = multiprocessing.get_context("spawn")
+
+    if not os.path.exists(db_path):
+        started = time.perf_counter()
+        seeder = ctx.Process(target=seed, args=(db_path, args.users, args.questions, args.results))
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode != 0:
+            raise SystemExit("データの作成に失敗しました")
+        print(f"データ作成: ユーザー {args.users} 人, 問題 {args.questions} 問, 受験履歴 {args.results} 件 "
+              f"({time.perf_counter() - started:.1f} 秒) -> {db_path}")
+    else:
+        print(f"既存のDBを使う: {db_path}（--users などのデータ量は作成時のもの）")
+    if args.seed_only:
+        return 0
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = ctx.Process(target=serve, args=(db_path, port), daemon=True)
+        server.start()
+    try:
+        wait_for_server(base_url)
+        print(f"{base_url} に {args.concurrency} 人で {args.duration} 秒（最初の {args.warmup} 秒は集計しない）")
+        queue = ctx.Queue()
+        workers = [
+            ctx.Process(target=worker, args=(base_url, i, args.users, args.duration, args.think, queue))
+            for i in range(args.concurrency)
+        ]
+        for p in workers:
+            p.start()
+        samples = [sample for _ in workers for sample in queue.get()]
+        for p in workers:
+            p.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+    measured = [sample for sample in samples if sample[1] >= args.warmup]
+    if not measured:
+        raise SystemExit("集計するリクエストがありません（--duration を --warmup より長くしてください）")
+    summary = summarize(measured, args.duration - args.warmup)
+    print()
+    print_summary(summary)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["config"] != config:
+            print()
+            print(f"注意: 基準と条件が違います（基準: {baseline['config']}）")
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print(f"悪化: {', '.join(regressions)}")
+            status = 1
+        else:
+            print("悪化なし")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "routes": summary}, f, ensure_ascii=False, indent=2)
+        print(f"基準を保存: {args.save_baseline}")
+    return status
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="試験日を想定した負荷テスト")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS, help="作成するユーザー数")
+    parser.add_argument("--questions", type=int, default=DEFAULT_QUESTIONS, help="作成する問題数")
+    parser.add_argument("--results", type=int, default=DEFAULT_RESULTS, help="作成する過去の受験回数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時に動かす仮想ユーザー数")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="負荷をかける秒数")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP, help="集計に入れない最初の秒数")
+    parser.add_argument("--think", type=float, default=0, help="リクエストの間に待つ平均秒数")
+    parser.add_argument("--db", help="DBファイル（なければ作る。省略時は一時ディレクトリ）")
+    parser.add_argument("--seed-only", action="store_true", help="データを作るだけで終わる")
+    parser.add_argument("--url", help="起動済みのサーバー（省略時はローカルに起動する）")
+    parser.add_argument("--baseline", help="比べる基準の JSON")
+    parser.add_argument("--save-baseline", help="結果を基準として保存する JSON")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="悪化とみなす差の割合")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args(sys.argv[1:])))
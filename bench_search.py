@@ -0,0 +1,78 @@
+"""
+問題の全文検索（question_search.py）のベンチマーク
+
+questions.json の問題を番号付きで複製して N 問（既定 100,000 問）の問題バンクを一時DBに作り、
+検索語の種類ごとに1ページ目・深いページの検索時間（中央値と最大）を表示する。
+取り込み（import_questions.import_file）の時間には、トリガーによる索引の更新も含まれる。
+
+    python bench_search.py [問題数]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# app を読み込む前に、一時DBを向ける
+_tmp_dir = tempfile.mkdtemp(prefix="bench_search_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp_dir, "bench.db")
+
+from app import app
+from database import db
+import import_questions
+import question_search
+
+DEFAULT_SIZE = 100000
+REPEAT = 30
+QUERIES = [
+    ("よく出る語", "Python"),
+    ("よく出る語（深いページ）", "Python", 50),
+    ("日本語の語", "オブジェクト指向"),
+    ("複数の語", "リスト 要素"),
+    ("まれな語", "第12345版"),
+    ("一致なし", "存在しない語句です"),
+    ("2文字の語のみ", "変数"),
+    ("2文字の語のみ・一致なし", "鶏卵"),  # trigram の索引を使えず、全件を見る
+    ("3文字以上 + 2文字", "インスタンス 変数"),
+]
+
+
+def write_source(path, size):
+    with open("questions.json", "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(path, "w", encoding="utf-8") as out:
+        for i in range(size):
+            item = dict(base[i % len(base)])
+            item["question"] = f"{item['question']}（第{i}版）"
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def measure(q, page):
+    times = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = question_search.search(q, page=page)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), max(times), len(result.hits)
+
+
+def main(size):
+    source = os.path.join(_tmp_dir, "questions.ndjson")
+    write_source(source, size)
+    with app.app_context():
+        db.create_all()
+    started = time.perf_counter()
+    import_questions.import_file(source)
+    print(f"取り込み {size} 問: {time.perf_counter() - started:.1f} 秒（索引の更新を含む）")
+
+    with app.app_context():
+        print(f"{'検索語':<26} {'ページ':>4} {'件数':>4} {'中央値 ms':>9} {'最大 ms':>8}")
+        for label, q, *rest in QUERIES:
+            page = rest[0] if rest else 1
+            median, worst, hits = measure(q, page)
+            print(f"{label + '（' + q + '）':<26} {page:>4} {hits:>4} {median:>9.2f} {worst:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
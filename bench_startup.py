@@ -0,0 +1,115 @@
+"""
+ワーカー起動直後のレスポンス時間のベンチマーク
+
+一時DBにユーザーと問題を用意し、ルートごとに新しいプロセスを起動して
+「起動して最初の1回」と「2回目以降（メモリ上にテンプレートがある状態）」の時間を測る。
+最初の1回は次の2通りで比べる。
+・cold : バイトコードキャッシュなし（テンプレートをコンパイルする）
+・cache: precompile_templates で作ったバイトコードキャッシュあり
+
+    python bench_startup.py [繰り返し回数]
+"""
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROUTES = [
+    ("/", None),
+    ("/about", None),
+    ("/home", "user"),
+    ("/mypage", "user"),
+    ("/material", "user"),
+    ("/support", "user"),
+    ("/analytics", "user"),
+    ("/practice", "user"),
+    ("/section_test", "user"),
+    ("/admin", "admin"),
+    ("/admin/questions", "admin"),
+]
+
+
+def _setup_env(db_path, cache_dir):
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path
+    os.environ["JINJA_BYTECODE_CACHE_DIR"] = cache_dir
+
+
+def seed(db_path, cache_dir):
+    _setup_env(db_path, cache_dir)
+    from app import app
+    from database import db
+    from model import User
+    from template_cache import precompile_templates
+    import import_questions
+
+    with app.app_context():
+        db.create_all()
+    import_questions.import_json("questions.json")
+    with app.app_context():
+        for email, is_admin in (("user@example.com", False), ("admin@example.com", True)):
+            user = User(email=email, is_active=True, is_admin=is_admin)
+            user.set_password("bench")
+            db.session.add(user)
+        db.session.commit()
+    if cache_dir:
+        precompile_templates(app)
+
+
+def measure_route(db_path, cache_dir, path, login, queue):
+    _setup_env(db_path, cache_dir)
+    started = time.perf_counter()
+    from app import app
+    import_ms = (time.perf_counter() - started) * 1000
+
+    client = app.test_client()
+    if login:
+        client.post("/try_login", data={"email": f"{login}@example.com", "password": "bench"})
+
+    started = time.perf_counter()
+    first = client.get(path)
+    first_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    client.get(path)
+    warm_ms = (time.perf_counter() - started) * 1000
+    queue.put((import_ms, first_ms, warm_ms, first.status_code))
+
+
+def run(ctx, db_path, cache_dir, path, login):
+    queue = ctx.Queue()
+    p = ctx.Process(target=measure_route, args=(db_path, cache_dir, path, login, queue))
+    p.start()
+    outcome = queue.get()
+    p.join()
+    return outcome
+
+
+def main(repeat):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    db_path = os.path.join(tmp_dir, "bench.db")
+    cache_dir = os.path.join(tmp_dir, "jinja_cache")
+
+    ctx = multiprocessing.get_context("spawn")
+    seeder = ctx.Process(target=seed, args=(db_path, cache_dir))
+    seeder.start()
+    seeder.join()
+
+    print(f"{'route':<18} {'status':>6} {'cold ms':>9} {'cache ms':>9} {'warm ms':>9}")
+    imports = []
+    for path, login in ROUTES:
+        cold = [run(ctx, db_path, "", path, login) for _ in range(repeat)]
+        cached = [run(ctx, db_path, cache_dir, path, login) for _ in range(repeat)]
+        imports.extend(outcome[0] for outcome in cold + cached)
+        print(
+            f"{path:<18} {cold[0][3]:>6} "
+            f"{statistics.median(o[1] for o in cold):>9.1f} "
+            f"{statistics.median(o[1] for o in cached):>9.1f} "
+            f"{statistics.median(o[2] for o in cold + cached):>9.1f}"
+        )
+    print(f"（参考）app の import: 中央値 {statistics.median(imports):.0f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
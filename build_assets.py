@@ -0,0 +1,105 @@
+"""
+静的ファイルのビルド（デプロイ時に実行する）
+
+static/ の CSS / JS などを、中身のハッシュ付きのファイル名で static/dist/ にコピーし、
+それぞれ圧縮済みの .gz（と、brotli パッケージがあれば .br）を作る。
+元のパスとハッシュ付きのパスの対応を static/dist/manifest.json に書く（assets.py が読む）。
+前回のビルドで作った古いファイルは削除する。
+
+同梱しているライブラリ:
+・Bootstrap 5.3.0（static/vendor/bootstrap/、Popper 2.11.8 を含む）
+・Chart.js 4.4.0（static/vendor/chartjs/）
+
+    python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from assets import DIST_DIR, MANIFEST_NAME
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+EXTENSIONS = {".css", ".js", ".svg", ".json", ".woff", ".woff2", ".png", ".ico"}
+COMPRESS_EXTENSIONS = {".css", ".js", ".svg", ".json"}  # 画像やフォントは圧縮済みなので除く
+HASH_LENGTH = 12
+
+
+def iter_sources(static_dir):
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        if os.path.relpath(dirpath, static_dir) == ".":
+            dirnames[:] = [d for d in dirnames if d != DIST_DIR]
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] in EXTENSIONS:
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return f"{stem}.{digest}{ext}"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build(static_dir=STATIC_DIR):
+    started = time.perf_counter()
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    manifest = {}
+    written = set()
+
+    for name, path in iter_sources(static_dir):
+        with open(path, "rb") as f:
+            data = f.read()
+        target = hashed_name(name, data)
+        manifest[name] = target
+
+        out = os.path.join(dist_dir, target)
+        outputs = [(out, data)]
+        if os.path.splitext(name)[1] in COMPRESS_EXTENSIONS:
+            outputs.append((out + ".gz", gzip.compress(data, compresslevel=9, mtime=0)))
+            if brotli is not None:
+                outputs.append((out + ".br", brotli.compress(data, quality=11)))
+
+        for out_path, out_data in outputs:
+            written.add(os.path.normpath(out_path))
+            # 中身が同じなら書き直さない（ファイル名に中身のハッシュが入っている）
+            if not os.path.exists(out_path):
+                _write(out_path, out_data)
+
+        sizes = " / ".join(f"{len(d):,}" for _, d in outputs)
+        print(f"{name} -> {DIST_DIR}/{target} ({sizes} bytes)")
+
+    manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+    _write(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    written.add(os.path.normpath(manifest_path))
+
+    removed = 0
+    for dirpath, _, filenames in os.walk(dist_dir):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(dirpath, filename))
+            if path not in written:
+                os.remove(path)
+                removed += 1
+
+    elapsed = time.perf_counter() - started
+    print(f"{len(manifest)} ファイル, 古いファイルの削除 {removed} 件 ({elapsed:.2f} 秒)")
+    if brotli is None:
+        print("brotli パッケージがないため、.br は作成していません")
+    return manifest
+
+
+if __name__ == "__main__":
+    build()
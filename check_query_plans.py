@@ -0,0 +1,175 @@
+"""
+app.py のルートが実際に発行する SELECT 文を EXPLAIN QUERY PLAN にかけ、
+索引を使わない全件走査（SCAN <table>）があれば一覧を出して終了コード 1 で終わる。
+
+一時DBに questions.json とテスト用ユーザーを入れ、テストクライアントで主要な画面を
+一通りたどりながら、SQLAlchemy の before_cursor_execute で SQL を記録する。
+たどった画面がサーバーエラー（500）を返したときも、一覧を出して終了コード 1 で終わる。
+
+    python check_query_plans.py [-v]
+"""
+import os
+import re
+import sys
+import tempfile
+
+# app を読み込む前に、一時DBを向ける
+_tmp_dir = tempfile.mkdtemp(prefix="check_query_plans_")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp_dir, "plans.db")
+
+from sqlalchemy import event, inspect
+
+from app import app
+from database import db
+from model import User
+import import_questions
+
+# 意図して全件を読むクエリ（理由つき）。
+# 空白を詰めた SQL 文が pattern に一致し、table を SCAN するものは許可する
+ALLOWED_FULL_SCANS = [
+    ("questions", r"FROM questions$", "問題バンクのキャッシュ・苦手ランキング・エクスポートの全件読み込み"),
+    ("questions", r"FROM questions ORDER BY questions\.id$", "問題のエクスポート（主キー順に少しずつ読む）"),
+    ("questions", r"FROM questions ORDER BY questions\.id LIMIT", "管理画面の問題一覧の先頭ページ（主キー順に LIMIT で読む）"),
+    ("users", r"WHERE users\.is_admin = ", "管理画面のユーザー・管理者一覧"),
+    ("questions_fts", r"^SELECT rowid, NULL FROM questions_fts WHERE \(question LIKE",
+     "よく使われる2文字の語などを LIKE で絞り込む検索（ページが埋まるまで先頭から読む）"),
+]
+
+PAGES = [
+    "/home", "/mypage", "/material", "/about", "/analytics", "/analytics_data",
+    "/practice", "/practice?num_questions=5&test_type=training", "/practice?num_questions=5",
+    "/practice?num_questions=all&test_type=training",
+    "/practice?num_questions=40_random_mock&test_type=mock_exam",
+    "/practice?num_questions=40_weakness_mock&test_type=mock_exam",
+    "/practice?num_questions=20&test_type=review",
+    "/section_test", "/section_test?category=section_1", "/section_test?category=all",
+    "/search?q=リスト", "/search?q=Python&page=2", "/search?q=変数", "/search?q=インスタンス 変数",
+]
+ADMIN_PAGES = [
+    "/admin", "/admin/questions", "/admin/questions?section=3&page=2",
+    "/admin/questions?after=100", "/admin/questions?before=100", "/admin/questions?section=3&after=60",
+    "/admin/questions/search?q=オブジェクト", "/admin/duplicates",
+    "/admin/users", "/admin/admins", "/admin/export",
+]
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(.*)$")
+# 仮想テーブル（FTS5 など）は、索引を使う場合も "SCAN ... VIRTUAL TABLE INDEX <番号>:<文字列>" と表示される。
+# 番号が 0 で文字列も空なら、条件を使わずに全件を読んでいる
+_VIRTUAL_INDEX_RE = re.compile(r"VIRTUAL TABLE INDEX (?!0:$)\d+:")
+_EXAM_TOKEN_RE = re.compile(r'name="exam_token" value="([^"]+)"')
+
+
+def _exam_token(html):
+    return _EXAM_TOKEN_RE.search(html).group(1)
+
+
+def capture_queries():
+    captured = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.setdefault(statement, parameters)
+
+    with app.app_context():
+        db.create_all()
+    import_questions.import_json("questions.json")
+
+    with app.app_context():
+        user = User(email="plan@example.com", is_active=True)
+        user.set_password("plan")
+        admin = User(email="plan-admin@example.com", is_active=True, is_admin=True)
+        admin.set_password("plan")
+        db.session.add_all([user, admin])
+        db.session.commit()
+
+        engine = db.engine
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+
+    # 画面が 500 を返すと、その先のクエリを確認できないので数えておく
+    server_errors = []
+    client = app.test_client()
+    client.post("/try_login", data={"email": "plan@example.com", "password": "plan"})
+    for path in PAGES:
+        if client.get(path).status_code >= 500:
+            server_errors.append(path)
+    # 提出には出題時のトークンが要るので、出題してから提出する
+    html = client.get("/practice?num_questions=40&test_type=training").get_data(as_text=True)
+    token = _exam_token(html)
+    client.get(f"/api/exam/questions?token={token}&offset=20")
+    client.post("/submit_practice", data={"exam_token": token, "question_1": "1"})
+    html = client.get("/section_test?category=section_1").get_data(as_text=True)
+    client.post("/submit_section", data={"exam_token": _exam_token(html), "question_1": "1"})
+    # 結果画面の続きと解説（最初の受験結果の id は 1）
+    client.get("/api/results/1/answers?offset=20")
+    client.get("/api/results/1/explanations/1")
+    # 集計テーブルを使わない場合のクエリも確認する
+    app.config["ANALYTICS_USE_ROLLUPS"] = False
+    client.get("/analytics_data")
+    app.config["ANALYTICS_USE_ROLLUPS"] = True
+
+    admin_client = app.test_client()
+    admin_client.post("/try_login", data={"email": "plan-admin@example.com", "password": "plan"})
+    for path in ADMIN_PAGES:
+        if admin_client.get(path).status_code >= 500:
+            server_errors.append(path)
+    admin_client.get("/admin/question/1")
+    admin_client.get("/admin/user/edit/1")
+
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return engine, captured, server_errors
+
+
+def full_scans(conn, statement, parameters, table_names):
+    """
+    EXPLAIN QUERY PLAN の結果から、索引を使わずに走査しているテーブル名を返す
+    （サブクエリの別名 anon_1 などの走査は除く）
+    """
+    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    tables = []
+    for row in plan:
+        detail = row[-1]
+        match = _SCAN_RE.match(detail)
+        if (
+            match and match.group(1) in table_names
+            and "USING" not in match.group(2) and not _VIRTUAL_INDEX_RE.search(match.group(2))
+        ):
+            tables.append(match.group(1))
+    return plan, tables
+
+
+def is_allowed(table, statement):
+    normalized = " ".join(statement.split())
+    return any(
+        table == allowed_table and re.search(pattern, normalized)
+        for allowed_table, pattern, _ in ALLOWED_FULL_SCANS
+    )
+
+
+def main(verbose=False):
+    engine, captured, server_errors = capture_queries()
+    failures = []
+    with engine.connect() as conn:
+        table_names = set(inspect(conn).get_table_names())
+        for statement, parameters in captured.items():
+            plan, tables = full_scans(conn, statement, parameters, table_names)
+            offending = [table for table in tables if not is_allowed(table, statement)]
+            if verbose or offending:
+                print("-" * 60)
+                print(statement.strip())
+                for row in plan:
+                    print("    " + row[-1])
+            if offending:
+                failures.append((statement, offending))
+
+    print("=" * 60)
+    print(f"SELECT 文: {len(captured)} 種類, 全件走査: {len(failures)} 件, サーバーエラー: {len(server_errors)} 件")
+    for statement, offending in failures:
+        first_line = " ".join(statement.split())[:100]
+        print(f"  SCAN {', '.join(offending)}: {first_line}")
+    for path in server_errors:
+        print(f"  500: {path}")
+    return 1 if failures or server_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(verbose="-v" in sys.argv[1:]))
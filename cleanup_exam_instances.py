@@ -0,0 +1,23 @@
+import sys
+import time
+
+from app import app
+from database import db
+from exam_instances import purge_expired
+
+def cleanup(interval=None):
+    with app.app_context():
+
+        db.create_all()
+        while True:
+            deleted = purge_expired()
+            db.session.commit()
+            print(f"期限切れの試験を削除: {deleted} 件")
+            if interval is None:
+                return
+            time.sleep(interval)
+
+if __name__ == "__main__":
+    # python cleanup_exam_instances.py [繰り返す間隔（秒）]
+    # 間隔を指定しなければ1回だけ実行する（cron などから呼ぶ場合）
+    cleanup(float(sys.argv[1]) if len(sys.argv) > 1 else None)
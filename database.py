@@ -1,3 +1,48 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy()
+
+
+def _upsert(table, rows, key_columns, set_values):
+    """
+    rows を挿入し、主キー（key_columns）が重複した行は set_values(挿入しようとした行) の値で更新する。
+    sqlite / PostgreSQL は ON CONFLICT DO UPDATE、MySQL は ON DUPLICATE KEY UPDATE を executemany で発行する
+    """
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_values(stmt.excluded))
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_values(stmt.excluded))
+    elif dialect == "mysql":
+        # 重複の判定は主キー（と一意索引）で行われる
+        stmt = mysql.insert(table)
+        stmt = stmt.on_duplicate_key_update(set_values(stmt.inserted))
+    else:
+        raise ValueError(f"upsert に対応していないDBです: {dialect}")
+    db.session.execute(stmt, rows)
+
+
+def upsert_increment(table, rows, key_columns, counter_columns):
+    """
+    rows を挿入し、主キー（key_columns）が重複した行は counter_columns を加算する（col = col + 新しい値）
+    """
+    _upsert(
+        table, rows, key_columns,
+        lambda new: {col: table.c[col] + new[col] for col in counter_columns},
+    )
+
+
+def upsert_replace(table, rows, key_columns, value_columns):
+    """
+    rows を挿入し、主キー（key_columns）が重複した行は value_columns を新しい値で置き換える
+    """
+    _upsert(
+        table, rows, key_columns,
+        lambda new: {col: new[col] for col in value_columns},
+    )
@@ -0,0 +1,93 @@
+"""
+DB エンジンの設定プロファイル
+
+・sqlite : WAL、synchronous=NORMAL、busy_timeout などの PRAGMA を接続ごとに設定し、
+           同時に提出が来ても "database is locked" になりにくくする
+・server : PostgreSQL / MySQL などのサーバー型DB向けに、コネクションプールの大きさを設定する
+・none   : 何も設定しない（SQLAlchemy の既定値。ベンチマークの比較用）
+
+DB_PROFILE を指定しなければ SQLALCHEMY_DATABASE_URI から自動で選ぶ。
+db.init_app(app) より前に configure_engine_options(app) を、
+後に register_engine_events(app) を呼ぶこと。
+"""
+from sqlalchemy import event
+
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",        # 読み込みが書き込みを待たない
+    "synchronous": "NORMAL",      # WAL ではこれで十分（電源断時に直近のコミットを失う可能性のみ）
+    "busy_timeout": 5000,         # ロック待ちでエラーにせず、最大5秒待つ（ミリ秒）
+    "mmap_size": 268435456,       # 256MB までメモリマップで読む
+    "cache_size": -65536,         # ページキャッシュ 64MB（負の値は KB 指定）
+    "temp_store": "MEMORY",
+}
+
+DEFAULT_SQLITE_POOL_SIZE = 10
+DEFAULT_SERVER_POOL_SIZE = 10
+DEFAULT_SERVER_MAX_OVERFLOW = 20
+DEFAULT_POOL_RECYCLE = 1800
+
+
+def resolve_profile(app):
+    profile = app.config.get("DB_PROFILE", "auto")
+    if profile != "auto":
+        return profile
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return "sqlite"
+    return "server"
+
+
+def configure_engine_options(app):
+    """
+    プロファイルに応じて SQLALCHEMY_ENGINE_OPTIONS を組み立てる
+    （個別に SQLALCHEMY_ENGINE_OPTIONS が設定されていればそちらを優先する）
+    """
+    profile = resolve_profile(app)
+    options = {}
+
+    if profile == "sqlite":
+        pragmas = sqlite_pragmas(app)
+        if not _is_memory_database(app):
+            # インメモリDBは専用のプールになるので、プールの大きさは指定しない
+            options["pool_size"] = app.config.get("DB_POOL_SIZE", DEFAULT_SQLITE_POOL_SIZE)
+            options["max_overflow"] = app.config.get("DB_MAX_OVERFLOW", 0)
+        # sqlite3 モジュール側のロック待ちも busy_timeout に揃える（秒）
+        options["connect_args"] = {"timeout": pragmas["busy_timeout"] / 1000}
+    elif profile == "server":
+        options["pool_size"] = app.config.get("DB_POOL_SIZE", DEFAULT_SERVER_POOL_SIZE)
+        options["max_overflow"] = app.config.get("DB_MAX_OVERFLOW", DEFAULT_SERVER_MAX_OVERFLOW)
+        options["pool_recycle"] = app.config.get("DB_POOL_RECYCLE", DEFAULT_POOL_RECYCLE)
+        options["pool_pre_ping"] = True
+
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    return profile
+
+
+def _is_memory_database(app):
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    return uri in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in uri
+
+
+def sqlite_pragmas(app):
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    pragmas.update(app.config.get("SQLITE_PRAGMAS", {}))
+    return pragmas
+
+
+def register_engine_events(app, db):
+    """
+    sqlite プロファイルのとき、新しい接続ごとに PRAGMA を設定する
+    """
+    if resolve_profile(app) != "sqlite":
+        return
+
+    pragmas = sqlite_pragmas(app)
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, "connect", set_sqlite_pragmas)
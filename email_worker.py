@@ -0,0 +1,16 @@
+import sys
+
+from app import app
+from database import db
+from mail_outbox import run_worker
+
+def main(once=False):
+    print("メール配信ワーカー起動")
+    with app.app_context():
+
+        db.create_all()
+        run_worker(once=once)
+
+if __name__ == "__main__":
+    # python email_worker.py [--once]
+    main(once="--once" in sys.argv[1:])
@@ -0,0 +1,125 @@
+"""
+試験と結果確認の JSON API 用のデータ
+
+試験の画面・結果の画面には最初のページだけを埋め込み、残りは画面（static/js/exam.js）が
+ページ単位で API から読み込む。問題数が多くても最初に送る HTML の大きさは変わらない。
+
+・出題: 問題文と選択肢だけを返す（正解・解説は返さない）。回答は提出するまでブラウザ側で持つ
+・結果: quiz_answers に保存した「選んだ番号・正解の番号・正誤」と問題文・選択肢を返す。
+  解説と参照URLは、問題ごとに「解説を表示」を押したときに別に読み込む
+"""
+from itertools import islice
+
+from sqlalchemy import select
+
+from database import db
+from model import QuizAnswer, QuizResult
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def page_args(args):
+    """
+    クエリ文字列の offset / limit を、範囲内に丸めて返す
+    """
+    offset = max(args.get("offset", 0, type=int), 0)
+    limit = args.get("limit", PAGE_SIZE, type=int)
+    return offset, min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def _choices(q):
+    return [q.choice1, q.choice2, q.choice3, q.choice4]
+
+
+def question_page(bank, ids, offset=0, limit=PAGE_SIZE):
+    """
+    出題順の問題IDのうち offset から limit 問分を、画面用の dict にして返す
+    """
+    items = []
+    for number, qid in enumerate(ids[offset:offset + limit], start=offset + 1):
+        q = bank.get(qid)
+        items.append({
+            "number": number,
+            "id": qid,
+            "question": q.question if q else "（この問題は削除されました）",
+            "choices": _choices(q) if q else [],
+        })
+    return items
+
+
+def review_page(bank, rows, offset=0):
+    """
+    (問題ID, 選んだ番号, 正解の番号, 正誤) の行を、結果画面用の dict にして返す
+    """
+    items = []
+    for number, (qid, selected, correct, is_correct) in enumerate(rows, start=offset + 1):
+        q = bank.get(qid)
+        items.append({
+            "number": number,
+            "id": qid,
+            "question": q.question if q else "（この問題は削除されました）",
+            "choices": _choices(q) if q else [],
+            "selected": selected,
+            "correct": correct,
+            "is_correct": is_correct,
+            "has_explanation": bool(q and (q.rationale or q.reference)),
+        })
+    return items
+
+
+def first_review_page(bank, graded, limit=PAGE_SIZE):
+    """
+    採点した直後の結果画面に埋め込む最初のページ（DB を読み直さずに採点結果から作る）
+    """
+    rows = (
+        (qid, selected, correct, is_correct)
+        for qid, _, selected, correct, is_correct in islice(graded.saved_rows(), limit)
+    )
+    return review_page(bank, rows)
+
+
+def owned_result(result_id, user_id):
+    """
+    ログイン中のユーザーの受験結果なら QuizResult を、そうでなければ None を返す
+    """
+    result = db.session.get(QuizResult, result_id)
+    if result is None or result.user_id != user_id:
+        return None
+    return result
+
+
+def answer_page(bank, result, offset=0, limit=PAGE_SIZE):
+    """
+    保存済みの受験結果の offset から limit 問分（出題順）
+    """
+    rows = db.session.execute(
+        select(
+            QuizAnswer.question_id, QuizAnswer.selected_choice,
+            QuizAnswer.correct_choice, QuizAnswer.is_correct,
+        )
+        .where(QuizAnswer.result_id == result.id)
+        .order_by(QuizAnswer.id)
+        .offset(offset)
+        .limit(limit)
+    ).all()
+    return review_page(bank, rows, offset)
+
+
+def explanation(bank, result, question_id):
+    """
+    受験結果に含まれる問題の解説と参照URL。含まれない問題なら None
+    """
+    answered = db.session.execute(
+        select(QuizAnswer.id)
+        .where(QuizAnswer.result_id == result.id, QuizAnswer.question_id == question_id)
+        .limit(1)
+    ).scalar()
+    if answered is None:
+        return None
+    q = bank.get(question_id)
+    return {
+        "id": question_id,
+        "rationale": q.rationale if q else None,
+        "reference": q.reference if q else None,
+    }
@@ -0,0 +1,108 @@
+"""
+出題した試験（exam_instances）の発行と受け取り
+
+/practice や /section_test で問題を出すときに、問題の並びと出題時点の正解表を
+exam_instances に1行で保存し、その ID を署名したトークンをフォームに埋め込む。
+提出時はトークンの行だけを主キーで読み、その正解表で採点する
+（フォームの問題IDを信用せず、出題後に問題が編集されても出題した内容で採点できる）。
+
+提出された行はその場で削除する（同じ試験の二重提出は受け付けない）。
+提出されずに有効期限（EXAM_INSTANCE_TTL 秒）を過ぎた行は
+cleanup_exam_instances.py で削除する。
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import delete
+
+from database import db
+from grading import AnswerKey, compile_answer_key
+from model import ExamInstance
+
+TOKEN_SALT = "exam-instance"
+DEFAULT_TTL_SECONDS = 6 * 3600
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _ttl_seconds():
+    return current_app.config.get("EXAM_INSTANCE_TTL", DEFAULT_TTL_SECONDS)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt=TOKEN_SALT)
+
+
+def issue_exam(user_id, exam_type, bank, ids):
+    """
+    出題した問題（出題順）の正解表を保存し、フォームに埋め込むトークンを返す
+    （呼び出し側で commit すること）
+    """
+    key = compile_answer_key(bank, ids)
+    now = _now()
+    instance = ExamInstance(
+        user_id=user_id,
+        exam_type=exam_type,
+        bank_version=bank.version,
+        question_ids=",".join(map(str, key.question_ids)),
+        answer_key=key.correct,
+        categories=json.dumps(key.categories, ensure_ascii=False),
+        created_at=now,
+        expires_at=now + timedelta(seconds=_ttl_seconds()),
+    )
+    db.session.add(instance)
+    db.session.flush() # ID を確定させる
+    return _serializer().dumps([instance.id, user_id])
+
+
+def load_exam(token, user_id):
+    """
+    トークンの試験と正解表を返す。署名が不正・期限切れ・別ユーザーの試験・提出済みなら None
+    """
+    if not token:
+        return None
+    try:
+        instance_id, token_user_id = _serializer().loads(token, max_age=_ttl_seconds())
+    except (BadSignature, ValueError, TypeError):
+        # 期限切れ（SignatureExpired）も BadSignature に含まれる
+        return None
+    if token_user_id != user_id:
+        return None
+
+    instance = db.session.get(ExamInstance, instance_id)
+    if instance is None or instance.user_id != user_id:
+        return None
+    return instance, answer_key_of(instance)
+
+
+def answer_key_of(instance):
+    question_ids = [int(qid) for qid in instance.question_ids.split(",") if qid]
+    return AnswerKey(
+        question_ids,
+        (f"question_{qid}" for qid in question_ids),
+        instance.answer_key,
+        json.loads(instance.categories),
+    )
+
+
+def consume_exam(instance):
+    """
+    提出された試験の行を削除する。すでに他のリクエストが削除していれば False
+    （採点結果の保存と同じトランザクションで呼ぶこと）
+    """
+    result = db.session.execute(delete(ExamInstance).where(ExamInstance.id == instance.id))
+    return result.rowcount == 1
+
+
+def purge_expired(now=None):
+    """
+    有効期限を過ぎた試験を削除し、件数を返す（呼び出し側で commit すること）
+    """
+    result = db.session.execute(
+        delete(ExamInstance).where(ExamInstance.expires_at < (now or _now()))
+    )
+    return result.rowcount
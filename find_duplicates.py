@@ -0,0 +1,48 @@
+"""
+似ている問題の一覧（near_duplicates.py）
+
+署名のない問題・内容が変わった問題の署名を作り、似ている問題のグループを表示する。
+管理画面の /admin/duplicates と同じ内容。
+
+    python find_duplicates.py [表示するグループ数]
+"""
+import sys
+import time
+
+from sqlalchemy import select
+
+from app import app
+from database import db
+from model import Question
+from question_cache import bump_version
+import near_duplicates
+
+DEFAULT_LIMIT = 20
+
+
+def main(limit):
+    with app.app_context():
+        db.create_all()
+
+        started = time.perf_counter()
+        updated = near_duplicates.sync_signatures()
+        if updated:
+            # 管理画面の似ている問題の一覧（問題バンクのバージョンごとに作る）を作り直させる
+            bump_version()
+        db.session.commit()
+        print(f"署名を更新: {len(updated)} 問 ({time.perf_counter() - started:.2f} 秒)")
+
+        started = time.perf_counter()
+        groups = near_duplicates.find_groups()
+        print(f"似ている問題: {len(groups)} グループ ({time.perf_counter() - started:.2f} 秒)")
+        for group in groups[:limit]:
+            texts = dict(db.session.execute(
+                select(Question.id, Question.question).where(Question.id.in_(group.ids))
+            ).all())
+            for qid, score in group.members:
+                print(f"  {qid:>7}  {score:.2f}  {texts.get(qid, '')[:60]}")
+            print()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LIMIT)
@@ -0,0 +1,100 @@
+"""
+採点エンジン
+
+試験に出した問題の正解を、問題IDの並び・正解番号（bytes）・分野の配列にまとめた
+「正解表」（AnswerKey）にしておき、提出されたフォームを1回の走査で bytes にして
+正解表とまとめて突き合わせる。
+
+採点結果からは、quiz_answers などに書き込む行（問題ID・分野・正誤）を
+問題バンクを引き直さずに作れる。結果画面の表示に使うときだけレコードを参照する。
+"""
+import operator
+from array import array
+from itertools import repeat
+
+NO_ANSWER_KEY = 255  # 正解が未設定の問題（どの回答とも一致しない）
+UNANSWERED = 0       # 未回答、または 1〜4 以外の値が送られてきた
+
+_CHOICE_VALUES = {"1": 1, "2": 2, "3": 3, "4": 4}
+
+
+class AnswerKey:
+    """
+    1回分の試験の正解表（出題時の内容。採点はこちらに合わせる）
+    """
+    __slots__ = ("question_ids", "field_names", "correct", "categories")
+
+    def __init__(self, question_ids, field_names, correct, categories):
+        self.question_ids = array("q", question_ids)
+        self.field_names = tuple(field_names)  # フォームの入力名（question_<id>）
+        self.correct = bytes(correct)
+        self.categories = tuple(categories)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def parse(self, form):
+        """
+        フォームの回答を、正解表と同じ並びの bytes（1〜4、未回答は 0）にする
+        """
+        # MultiDict.get を1問ずつ呼ぶより、先に普通の dict にしてから map で引く方が速い
+        answers = form.to_dict()
+        return bytes(map(_CHOICE_VALUES.get, map(answers.get, self.field_names), repeat(UNANSWERED)))
+
+    def grade(self, form):
+        selected = self.parse(form)
+        is_correct = list(map(operator.eq, selected, self.correct))
+        return GradedExam(self, selected, is_correct)
+
+
+class GradedExam:
+    """
+    採点結果。score と、保存・集計に使う行を持つ
+    """
+
+    def __init__(self, key, selected, is_correct):
+        self.key = key
+        self.selected = selected
+        self.is_correct = is_correct
+        self.score = is_correct.count(True)
+
+    @property
+    def total(self):
+        return len(self.key)
+
+    def answer_rows(self):
+        """
+        (問題ID, 分野, 正誤) を出題順に返す
+        """
+        return zip(self.key.question_ids, self.key.categories, self.is_correct)
+
+    def counter_rows(self):
+        """
+        問題ごとの回答数・正解数の集計用に (問題ID, 正誤) を返す
+        """
+        return zip(self.key.question_ids, self.is_correct)
+
+    def saved_rows(self):
+        """
+        quiz_answers に保存する (問題ID, 分野, 選んだ番号, 正解の番号, 正誤) を出題順に返す。
+        未回答の選んだ番号・未設定の正解の番号は None
+        """
+        return zip(
+            self.key.question_ids, self.key.categories,
+            (selected or None for selected in self.selected),
+            (correct if correct != NO_ANSWER_KEY else None for correct in self.key.correct),
+            self.is_correct,
+        )
+
+
+def compile_answer_key(bank, ids):
+    """
+    問題バンクのスナップショットから、出題した問題（ID の並び順どおり）の正解表を作る。
+    バンクにない ID は除く
+    """
+    entries = bank.answer_entries
+    ids = [qid for qid in ids if qid in entries]
+    if not ids:
+        return AnswerKey((), (), (), ())
+    field_names, correct, categories = zip(*map(entries.__getitem__, ids))
+    return AnswerKey(ids, field_names, correct, categories)
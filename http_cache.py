@@ -0,0 +1,129 @@
+"""
+HTTP の条件付き GET（ETag）とレスポンスの圧縮
+
+・@conditional(key, cache_control) を付けたルートは、key(...) が返す文字列（テンプレートの
+  更新時刻や、データのバージョンなど）から ETag を作る。ブラウザの If-None-Match が一致すれば、
+  ビュー関数を呼ばずに（テンプレートを描画せずに）304 を返す。key が None を返したら何もしない
+・init_compression(app) で、COMPRESS_MIN_SIZE バイト以上の HTML / JSON などを
+  Accept-Encoding に応じて brotli か gzip で圧縮する。brotli は brotli パッケージが
+  入っているときだけ使う
+"""
+import gzip
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 動的なレスポンス向けに、圧縮率より速さを優先する
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html", "text/plain", "text/css", "text/csv",
+    "text/javascript", "application/javascript", "application/json",
+}
+
+# 圧縮したレスポンスの ETag には、元の ETag に付けて区別する
+_ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def make_etag(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def template_key(*names):
+    """
+    テンプレートファイルの更新時刻から作るキー（中身が変わらない画面用）。
+    静的ファイルのビルド（assets.py）が変わったときも変わる
+    """
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    parts = [current_app.config.get("ASSET_VERSION", "")]
+    for name in names:
+        parts.append(f"{name}:{os.stat(os.path.join(folder, name)).st_mtime_ns}")
+    return "|".join(parts)
+
+
+def _if_none_match(etag):
+    # 圧縮した方の ETag（"...-gzip" など）で問い合わせてきた場合も一致とみなす
+    tags = request.if_none_match
+    if not tags:
+        return False
+    if tags.star_tag:
+        return True
+    return any(tags.contains_weak(etag + suffix) for suffix in ("", *_ENCODING_SUFFIXES.values()))
+
+
+def conditional(key, cache_control="private, no-cache"):
+    """
+    ルートに ETag と Cache-Control を付けるデコレーター（login_required などより内側に付ける）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = key(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(f"{request.path}|{version}")
+            if _if_none_match(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + _ENCODING_SUFFIXES[encoding], weak)
+    return response
+
+
+def init_compression(app):
+    app.config.setdefault("COMPRESS_MIN_SIZE", DEFAULT_MIN_SIZE)
+    app.after_request(compress_response)
@@ -1,37 +1,321 @@
+"""
+問題データのインポート（差分更新）
+
+入力ファイルを少しずつ読みながら、既存の問題と content_hash（問題文＋選択肢のハッシュ）で
+突き合わせ、追加・更新・削除をまとめて実行する。すべて1トランザクションで行う。
+
+・一致した問題は ID と回答数（total_count / correct_count）をそのまま残し、
+  正解・分野・解説・出典が変わったときだけ更新する
+・ファイルにない問題は削除する（--keep-missing を付けると残す）
+・--dry-run を付けると、DB は変えずに差分だけ表示する
+・追加・更新した問題の署名を作り（near_duplicates.py）、既存の問題とほぼ同じものがあれば表示する
+
+入力は JSON 配列・NDJSON・CSV（/admin/export の出力形式）に対応する。
+
+    python import_questions.py [ファイル] [--dry-run] [--keep-missing]
+"""
+import csv
 import json
-from model import Question
+import sys
+import time
+
+from sqlalchemy import delete, insert, select, update
+
+from model import Question, question_content_hash
 from app import app
 from database import db
+from question_cache import bump_version
+import near_duplicates
+import question_search
 
-def import_json(json_file):
-    print(f"JSON 読み込み中: {json_file}")
-    with app.app_context():
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+SAMPLE_SIZE = 5  # 差分レポートに表示する例の数
+
+# 突き合わせた後、値が違えば更新する列
+UPDATE_FIELDS = ["correct", "category", "rationale", "reference"]
+
+# 書き換える行がこの件数（と既存の問題数の 1/3）を超えたら、全文検索の索引を1行ずつ更新せず、
+# 最後にまとめて作り直す（question_search.suspend_sync / resume_sync）
+BULK_INDEX_MIN_ROWS = 1000
+
+
+def iter_items(path):
+    """
+    ファイルの形式を見分けて、問題を1件ずつ返す
+    """
+    if path.endswith(".csv"):
+        yield from _iter_csv(path)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(READ_SIZE)
+        if head.lstrip().startswith("["):
+            yield from _iter_json_array(f, head)
+        else:
+            yield from _iter_ndjson(f, head)
+
+
+def _iter_json_array(f, buf):
+    # 配列全体を json.load せず、要素を1つずつ raw_decode する
+    decoder = json.JSONDecoder()
+    pos = buf.index("[") + 1
+    eof = False
+    while True:
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos, eof = _read_more(f, buf, pos)
+        if pos >= len(buf):
+            raise ValueError("JSON の配列が閉じていません")
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            buf, pos, eof = _read_more(f, buf, pos)
+            continue
+        yield item
+        pos = end
+
+
+def _read_more(f, buf, pos):
+    chunk = f.read(READ_SIZE)
+    return buf[pos:] + chunk, 0, not chunk
+
+
+def _iter_ndjson(f, head):
+    # 先頭で読んだ分の最後の行は途中で切れていることがあるので、その行の残りを読み足す。
+    # splitlines() は \x85 や \u2028 でも区切ってしまう（ensure_ascii=False の JSON にはそのまま入る）ので、
+    # ファイルを1行ずつ読むときと同じく \n だけで区切る
+    lines = (head + f.readline()).split("\n")
+    for line in _chain_lines(lines, f):
+        if line.strip():
+            yield json.loads(line)
+
+
+def _chain_lines(lines, f):
+    yield from lines
+    yield from f
+
+
+def _iter_csv(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            yield {
+                "question": row["question"],
+                "choices": [row["choice1"], row["choice2"], row["choice3"], row["choice4"]],
+                "correct": int(row["correct"]),
+                "category": row["category"],
+                "rationale": row["rationale"] or None,
+                "reference": row["reference"] or None,
+            }
+
+
+def to_row(item):
+    choices = item["choices"]
+    return {
+        "question": item["question"],
+        "choice1": choices[0],
+        "choice2": choices[1],
+        "choice3": choices[2],
+        "choice4": choices[3],
+        "correct": item["correct"],
+        "category": item.get("category", "none"),
+        "rationale": item.get("rationale"),
+        "reference": item.get("reference"),
+        "content_hash": question_content_hash(item["question"], choices),
+    }
 
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.similar_groups = None  # 追加・更新した問題を含む、似ている問題のグループ（dry-run では調べない）
+        self.samples = {"追加": [], "更新": [], "削除": [], "類似": []}
+        self.timings = []
+
+    def sample(self, kind, text):
+        if len(self.samples[kind]) < SAMPLE_SIZE:
+            self.samples[kind].append(text[:60])
+
+    def print(self, dry_run):
+        print(("差分（dry-run のため DB は変更していません）" if dry_run else "インポート結果") + ":")
+        print(f"  追加 {self.inserted} 件 / 更新 {self.updated} 件 / 削除 {self.deleted} 件 / "
+              f"変更なし {self.unchanged} 件 / ファイル内の重複 {self.duplicates} 件")
+        if self.similar_groups is not None:
+            print(f"  似ている問題: {len(self.similar_groups)} グループ（python find_duplicates.py か /admin/duplicates で確認）")
+        for kind, texts in self.samples.items():
+            for text in texts:
+                print(f"  [{kind}] {text}")
+        print("  所要時間: " + ", ".join(f"{name} {seconds:.2f}秒" for name, seconds in self.timings))
+
+
+def _load_existing():
+    """
+    既存の問題を {content_hash: (id, 更新対象の列の値)} にする。
+    content_hash が空の行（移行前の行）はここで計算し、埋める必要がある行の ID も返す
+    """
+    existing = {}
+    missing_hash = {}
+    extra_ids = []  # DB の中で内容が重複している行（2件目以降）
+    rows = db.session.execute(
+        select(
+            Question.id, Question.content_hash,
+            Question.question, Question.choice1, Question.choice2, Question.choice3, Question.choice4,
+            *[getattr(Question, name) for name in UPDATE_FIELDS],
+        ).execution_options(yield_per=BATCH_SIZE)
+    )
+    for row in rows:
+        content_hash = row.content_hash
+        if content_hash is None:
+            content_hash = question_content_hash(row.question, [row.choice1, row.choice2, row.choice3, row.choice4])
+            missing_hash[row.id] = content_hash
+        if content_hash in existing:
+            extra_ids.append((row.id, row.question))
+            continue
+        existing[content_hash] = (row.id, row.question, tuple(getattr(row, name) for name in UPDATE_FIELDS))
+    return existing, missing_hash, extra_ids
+
+
+def import_file(path, dry_run=False, delete_missing=True):
+    report = ImportReport()
+    with app.app_context():
         # テーブルが存在しない場合に備えて create_all を呼び出す
         db.create_all()
-        # usersテーブルは維持し、questionsテーブルのデータのみを削除
-        db.session.query(Question).delete()
-
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        for item in data:
-            q = Question(
-                question=item["question"],
-                choice1=item["choices"][0],
-                choice2=item["choices"][1],
-                choice3=item["choices"][2],
-                choice4=item["choices"][3],
-                correct=item["correct"],
-                category=item.get("category","none"),
-                rationale=item.get("rationale"),
-                reference=item.get("reference")
-            )
-            db.session.add(q)
-
-        db.session.commit()
-
-        print("インポート完了！")
+
+        started = time.perf_counter()
+        existing, missing_hash, extra_ids = _load_existing()
+        report.timings.append(("既存の読み込み", time.perf_counter() - started))
+
+        inserts = []
+        updates = []
+        seen = set()
+        changed = 0
+        bulk_threshold = max(BULK_INDEX_MIN_ROWS, len(existing) // 3)
+        suspended = False
+        fts = not dry_run and question_search.fts_available()
+
+        def suspend_index(pending):
+            nonlocal suspended
+            if fts and not suspended and pending > bulk_threshold:
+                question_search.suspend_sync()
+                suspended = True
+
+        def flush(force=False):
+            nonlocal changed
+            if dry_run:
+                inserts.clear()
+                updates.clear()
+                return
+            if inserts and (force or len(inserts) >= BATCH_SIZE):
+                suspend_index(changed + len(inserts) + len(updates))
+                db.session.execute(insert(Question), inserts)
+                changed += len(inserts)
+                inserts.clear()
+            if updates and (force or len(updates) >= BATCH_SIZE):
+                suspend_index(changed + len(updates))
+                db.session.execute(update(Question), updates)
+                changed += len(updates)
+                updates.clear()
+
+        try:
+            started = time.perf_counter()
+            for item in iter_items(path):
+                row = to_row(item)
+                content_hash = row["content_hash"]
+                if content_hash in seen:
+                    report.duplicates += 1
+                    continue
+                seen.add(content_hash)
+
+                match = existing.get(content_hash)
+                if match is None:
+                    inserts.append(row)
+                    report.inserted += 1
+                    report.sample("追加", row["question"])
+                else:
+                    question_id, text, values = match
+                    new_values = tuple(row[name] for name in UPDATE_FIELDS)
+                    if new_values != values or question_id in missing_hash:
+                        updates.append({"id": question_id, "content_hash": content_hash,
+                                        **dict(zip(UPDATE_FIELDS, new_values))})
+                    if new_values != values:
+                        report.updated += 1
+                        report.sample("更新", text)
+                    else:
+                        report.unchanged += 1
+                flush()
+            flush(force=True)
+            report.timings.append(("追加・更新", time.perf_counter() - started))
+
+            started = time.perf_counter()
+            stale = [(qid, text) for content_hash, (qid, text, _) in existing.items() if content_hash not in seen]
+            stale += extra_ids
+            if delete_missing:
+                for qid, text in stale:
+                    report.sample("削除", text)
+                report.deleted = len(stale)
+                if not dry_run:
+                    suspend_index(changed + len(stale))
+                    ids = [qid for qid, _ in stale]
+                    for i in range(0, len(ids), BATCH_SIZE):
+                        db.session.execute(delete(Question).where(Question.id.in_(ids[i:i + BATCH_SIZE])))
+            elif not dry_run:
+                # 残す行も、content_hash が空なら埋めておく
+                backfill = [{"id": qid, "content_hash": missing_hash[qid]} for qid, _ in stale if qid in missing_hash]
+                for i in range(0, len(backfill), BATCH_SIZE):
+                    db.session.execute(update(Question), backfill[i:i + BATCH_SIZE])
+            report.timings.append(("削除", time.perf_counter() - started))
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                started = time.perf_counter()
+                synced = near_duplicates.sync_signatures()
+                report.similar_groups = near_duplicates.find_groups(synced) if synced else []
+                _sample_similar(report)
+                report.timings.append(("類似問題の検出", time.perf_counter() - started))
+                if suspended:
+                    started = time.perf_counter()
+                    question_search.resume_sync()
+                    report.timings.append(("検索索引の作り直し", time.perf_counter() - started))
+                started = time.perf_counter()
+                # 署名を作り直したとき（マイグレーション直後など）も、似ている問題の一覧を作り直させる
+                if report.inserted or report.updated or report.deleted or synced:
+                    bump_version()
+                db.session.commit()
+                report.timings.append(("コミット", time.perf_counter() - started))
+        except Exception:
+            db.session.rollback()
+            raise
+
+    report.print(dry_run)
+    return report
+
+
+def _sample_similar(report):
+    for group in report.similar_groups[:SAMPLE_SIZE]:
+        text = db.session.scalar(select(Question.question).where(Question.id == group.ids[0]))
+        ids = ", ".join(map(str, group.ids[:3])) + (f" ほか{len(group) - 3}問" if len(group) > 3 else "")
+        report.sample("類似", f"ID {ids}: {text}")
+
+
+def import_json(json_file):
+    print(f"JSON 読み込み中: {json_file}")
+    import_file(json_file)
+    print("インポート完了！")
+
 
 if __name__ == "__main__":
-    import_json("questions.json")
\ No newline at end of file
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    path = args[0] if args else "questions.json"
+    print(f"読み込み中: {path}")
+    import_file(path, dry_run="--dry-run" in sys.argv, delete_missing="--keep-missing" not in sys.argv)
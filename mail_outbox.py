@@ -0,0 +1,222 @@
+"""
+メール送信のアウトボックス
+
+リクエスト処理中は email_outbox テーブルに1行追加するだけにし、
+実際の送信は別プロセスの配信ワーカー（email_worker.py）がまとめて行う。
+
+・SMTP 接続（STARTTLS + ログイン）は1回張ったら使い回す
+・送信に失敗した行は指数バックオフで再送し、MAX_ATTEMPTS 回失敗したら dead にする
+・複数のワーカーが動いても同じ行を二重に送らないよう、claimed_by で行を確保してから送る
+
+SMTP サーバーは環境変数 MAIL_SERVER / MAIL_PORT / MAIL_USE_TLS で切り替えられるので、
+ローカルの検証用 SMTP サーバー（例: python -m aiosmtpd -n -l localhost:1025）にも向けられる。
+"""
+import os
+import smtplib
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlalchemy import select, update
+
+from database import db
+from model import EmailOutbox
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30       # 30秒, 60秒, 120秒 ... と間隔を空けて再送する
+BACKOFF_MAX_SECONDS = 3600
+CLAIM_TIMEOUT = timedelta(minutes=10)  # 送信中のままワーカーが落ちた行を pending に戻すまでの時間
+POLL_INTERVAL = 5.0
+IDLE_DISCONNECT_SECONDS = 60.0  # これだけ送る物がなければ SMTP 接続を閉じる
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def mail_settings():
+    return {
+        "server": os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+        "port": int(os.environ.get('MAIL_PORT', 587)),
+        "use_tls": os.environ.get('MAIL_USE_TLS', '1') != '0',
+        "address": os.environ.get('MAIL_ADDRESS'),
+        "password": os.environ.get('MAIL_PASSWORD'),
+    }
+
+
+def enqueue_email(to_address, subject, body, reply_to=None):
+    """
+    送信するメールをアウトボックスに追加する（呼び出し側で commit すること）
+    """
+    now = _now()
+    message = EmailOutbox(
+        to_address=to_address,
+        reply_to=reply_to,
+        subject=subject,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    )
+    db.session.add(message)
+    return message
+
+
+def build_message(sender, row):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = row.to_address
+    if row.reply_to:
+        msg['Reply-To'] = row.reply_to
+    msg['Subject'] = row.subject
+    msg.attach(MIMEText(row.body, 'plain'))
+    return msg
+
+
+class SmtpConnection:
+    """
+    認証済みの SMTP 接続を使い回す。切断されていたら1回だけ張り直して送る
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings or mail_settings()
+        self._server = None
+        self._last_used = None
+
+    def send(self, msg):
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connection().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self, idle_seconds=IDLE_DISCONNECT_SECONDS):
+        if self._server is not None and time.monotonic() - self._last_used >= idle_seconds:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except OSError:
+                # SMTPException も含む。閉じるだけなので失敗は無視する
+                pass
+            self._server = None
+
+    def _connection(self):
+        if self._server is None:
+            s = self.settings
+            server = smtplib.SMTP(s["server"], s["port"], timeout=30)
+            if s["use_tls"]:
+                server.starttls()
+            if s["password"]:
+                server.login(s["address"], s["password"])
+            self._server = server
+            self._last_used = time.monotonic()
+        return self._server
+
+
+def claim_batch(worker_id, batch_size=BATCH_SIZE):
+    """
+    送信期限の来た pending 行を最大 batch_size 件確保して返す
+    """
+    now = _now()
+
+    # 送信中のまま放置された行（ワーカーが落ちた等）は pending に戻す
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == "sending", EmailOutbox.claimed_at < now - CLAIM_TIMEOUT)
+        .values(status="pending", claimed_by=None, claimed_at=None)
+    )
+
+    ids = db.session.execute(
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if ids:
+        # 他のワーカーが先に確保した行は status が変わっているので更新されない
+        db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids), EmailOutbox.status == "pending")
+            .values(status="sending", claimed_by=worker_id, claimed_at=now)
+        )
+    db.session.commit()
+
+    if not ids:
+        return []
+    return db.session.execute(
+        select(EmailOutbox)
+        .where(EmailOutbox.claimed_by == worker_id, EmailOutbox.status == "sending")
+        .order_by(EmailOutbox.id)
+    ).scalars().all()
+
+
+def backoff_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def deliver_batch(connection, worker_id, batch_size=BATCH_SIZE):
+    """
+    1バッチ分を同じ SMTP 接続で送る。(送信数, 再送予定数, dead 数) を返す
+    """
+    rows = claim_batch(worker_id, batch_size)
+    sent = retried = dead = 0
+    sender = connection.settings["address"]
+
+    for row in rows:
+        now = _now()
+        try:
+            connection.send(build_message(sender, row))
+        except Exception as e:
+            # 接続が壊れている可能性があるので、次の行は張り直して送る
+            connection.close()
+            row.attempts += 1
+            row.last_error = f"{type(e).__name__}: {e}"
+            row.claimed_by = None
+            row.claimed_at = None
+            if row.attempts >= MAX_ATTEMPTS:
+                row.status = "dead"
+                dead += 1
+            else:
+                row.status = "pending"
+                row.next_attempt_at = now + backoff_delay(row.attempts)
+                retried += 1
+        else:
+            row.attempts += 1
+            row.status = "sent"
+            row.sent_at = now
+            row.claimed_by = None
+            row.claimed_at = None
+            sent += 1
+        # 1通ごとに確定させ、途中で落ちても送信済みの行を再送しない
+        db.session.commit()
+
+    return sent, retried, dead
+
+
+def run_worker(poll_interval=POLL_INTERVAL, once=False, batch_size=BATCH_SIZE):
+    """
+    アウトボックスを監視して送信し続ける（app_context の中で呼ぶこと）
+    once=True のときは、送信期限の来た行がなくなった時点で終了する
+    """
+    worker_id = uuid.uuid4().hex
+    connection = SmtpConnection()
+    try:
+        while True:
+            sent, retried, dead = deliver_batch(connection, worker_id, batch_size)
+            if sent or retried or dead:
+                print(f"メール送信: 送信 {sent} 件, 再送予定 {retried} 件, 送信不可 {dead} 件")
+                continue
+            if once:
+                return
+            connection.close_if_idle()
+            time.sleep(poll_interval)
+    finally:
+        connection.close()
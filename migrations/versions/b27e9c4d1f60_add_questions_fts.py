@@ -0,0 +1,63 @@
+"""Add questions_fts full-text index with sync triggers
+
+Revision ID: b27e9c4d1f60
+Revises: f1c6b84d2e95
+Create Date: 2026-10-18 17:12:44.906318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b27e9c4d1f60'
+down_revision = 'f1c6b84d2e95'
+branch_labels = None
+depends_on = None
+
+# question_search.SCHEMA_STATEMENTS と同じ内容
+COLUMNS = "question, choice1, choice2, choice3, choice4, rationale, reference"
+NAMES = COLUMNS.split(", ")
+# 各列の末尾に空白を付けた値を索引に入れる（2文字の語の検索で、列の最後の2文字も見つけるため）
+NEW_VALUES = ", ".join(f"new.{name} || ' '" for name in NAMES)
+OLD_VALUES = ", ".join(f"old.{name} || ' '" for name in NAMES)
+VIEW_COLUMNS = ", ".join(f"{name} || ' ' AS {name}" for name in NAMES)
+
+
+def upgrade():
+    # FTS5 は SQLite だけ（他のDBでは question_search が LIKE で検索する）
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(f"CREATE VIEW IF NOT EXISTS questions_fts_content AS SELECT id, {VIEW_COLUMNS} FROM questions")
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+        f"{COLUMNS}, content='questions_fts_content', content_rowid='id', tokenize='trigram')"
+    )
+    # 索引の語（3文字）の一覧。2文字の語の検索に使う
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts_vocab USING fts5vocab(questions_fts, 'row')")
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN "
+        f"INSERT INTO questions_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN "
+        f"INSERT INTO questions_fts(questions_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE OF {COLUMNS} ON questions BEGIN "
+        f"INSERT INTO questions_fts(questions_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); "
+        f"INSERT INTO questions_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END"
+    )
+    # 既存の問題を索引に入れる
+    op.execute("INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS questions_fts_ai")
+    op.execute("DROP TABLE IF EXISTS questions_fts_vocab")
+    op.execute("DROP TABLE IF EXISTS questions_fts")
+    op.execute("DROP VIEW IF EXISTS questions_fts_content")
@@ -1,3 +1,5 @@
+import hashlib
+
 from database import db
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -19,6 +21,10 @@ class User(db.Model):
 
 class QuizResult(db.Model):
     __tablename__ = "quiz_results"
+    __table_args__ = (
+        db.Index("ix_quiz_results_user_timestamp", "user_id", "timestamp"),
+        db.Index("ix_quiz_results_user_exam_type_timestamp", "user_id", "exam_type", db.text("timestamp DESC")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -28,6 +34,68 @@ class QuizResult(db.Model):
     timestamp = db.Column(db.DateTime, default=db.func.now())
     details = db.Column(db.Text, nullable=True) # JSON string of result details
 
+class QuizAnswer(db.Model):
+    __tablename__ = "quiz_answers"
+    __table_args__ = (
+        db.Index("ix_quiz_answers_user_timestamp", "user_id", "timestamp"),
+        db.Index("ix_quiz_answers_result_id", "result_id"),
+        db.Index("ix_quiz_answers_question_id", "question_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    result_id = db.Column(db.Integer, db.ForeignKey("quiz_results.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    question_id = db.Column(db.Integer, nullable=False) # 削除された問題の履歴も残すため外部キーにしない
+    category = db.Column(db.String(50))
+    is_correct = db.Column(db.Boolean, nullable=False)
+    selected_choice = db.Column(db.SmallInteger, nullable=True) # 選んだ番号（1〜4、未回答は NULL）
+    correct_choice = db.Column(db.SmallInteger, nullable=True) # 出題時の正解の番号
+    timestamp = db.Column(db.DateTime, default=db.func.now())
+
+class UserWeeklyStat(db.Model):
+    __tablename__ = "user_weekly_stats"
+
+    # 週（月曜始まり）ごとの回答数・正解数（/analytics_data の週次推移用）
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    total_questions = db.Column(db.Integer, nullable=False, default=0)
+    correct_answers = db.Column(db.Integer, nullable=False, default=0)
+
+class UserSectionDailyStat(db.Model):
+    __tablename__ = "user_section_daily_stats"
+
+    # 日・章ごとの回答数・正解数（/analytics_data の章別正答率（過去30日）用）
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    section = db.Column(db.Integer, primary_key=True)
+    total_questions = db.Column(db.Integer, nullable=False, default=0)
+    correct_answers = db.Column(db.Integer, nullable=False, default=0)
+
+class LearningState(db.Model):
+    __tablename__ = "learning_states"
+    __table_args__ = (
+        db.Index("ix_learning_states_user_next_due", "user_id", "next_due"),
+    )
+
+    # ユーザー × 問題の復習の予定（spaced_repetition.py）。回答を採点するたびに更新する
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True) # 削除された問題の行は、復習の出題時に消す
+    ease = db.Column(db.Float, nullable=False) # 正解したときに間隔を何倍にするか
+    interval_days = db.Column(db.Integer, nullable=False) # 前回の間隔（日）。間違えたら 0
+    streak = db.Column(db.Integer, nullable=False) # 連続正解数
+    next_due = db.Column(db.DateTime, nullable=False) # 次に復習する日時（UTC）
+    last_reviewed = db.Column(db.DateTime, nullable=False)
+
+class ScoreHistogram(db.Model):
+    __tablename__ = "score_histograms"
+
+    # 試験の種類 × 正答率の区間（0〜100%）ごとの受験回数（結果画面・/analytics_data のパーセンタイル順位用）
+    exam_type = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.SmallInteger, primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct_answers = db.Column(db.Integer, nullable=False, default=0)
+    total_questions = db.Column(db.Integer, nullable=False, default=0)
+
 class Question(db.Model):
     __tablename__ = "questions"
 
@@ -38,8 +106,86 @@ class Question(db.Model):
     choice3 = db.Column(db.String(200))
     choice4 = db.Column(db.String(200))
     correct = db.Column(db.Integer)
-    category = db.Column(db.String(50))
+    category = db.Column(db.String(50), index=True)
     rationale = db.Column(db.Text)
     reference = db.Column(db.String(300))
     total_count = db.Column(db.Integer, nullable=False, default=0)
-    correct_count = db.Column(db.Integer, nullable=False, default=0)
\ No newline at end of file
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    # 問題文と選択肢から作るハッシュ。インポート時に既存の問題と突き合わせるのに使う
+    content_hash = db.Column(db.String(64), index=True)
+
+    def update_content_hash(self):
+        self.content_hash = question_content_hash(
+            self.question, [self.choice1, self.choice2, self.choice3, self.choice4]
+        )
+
+def question_content_hash(question, choices):
+    """
+    問題文と4つの選択肢のハッシュ（正解・分野・解説が変わっても同じ問題として扱う）
+    """
+    parts = [(question or "").strip()] + [(c or "").strip() for c in choices]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class QuestionSignature(db.Model):
+    __tablename__ = "question_signatures"
+
+    # 似ている問題の検出用の署名（near_duplicates.py）。content_hash が変わったら作り直す
+    question_id = db.Column(db.Integer, primary_key=True) # 削除した問題の分は near_duplicates が消す
+    content_hash = db.Column(db.String(64))
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+class QuestionLshBucket(db.Model):
+    __tablename__ = "question_lsh_buckets"
+    __table_args__ = (
+        db.Index("ix_question_lsh_buckets_question_id", "question_id"),
+    )
+
+    # 署名のバンドごとのハッシュ（上位にバンドの番号を入れる）。同じ bucket に入った問題が似ている問題の候補になる
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    question_id = db.Column(db.Integer, primary_key=True)
+
+class QuestionBankVersion(db.Model):
+    __tablename__ = "question_bank_version"
+
+    # 1行だけのテーブル。問題データが変わるたびに version を +1 する
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(120), nullable=False)
+    reply_to = db.Column(db.String(120), nullable=True)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending") # pending / sending / sent / dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class ExamInstance(db.Model):
+    """
+    出題した試験（問題の並びと、出題時点の正解表）。提出されたら削除する
+    """
+    __tablename__ = "exam_instances"
+    __table_args__ = (
+        db.Index("ix_exam_instances_expires_at", "expires_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    exam_type = db.Column(db.String(50), nullable=False)
+    bank_version = db.Column(db.Integer, nullable=False) # 出題時の question_bank_version
+    question_ids = db.Column(db.Text, nullable=False) # 出題順のIDをカンマ区切りで
+    answer_key = db.Column(db.LargeBinary, nullable=False) # 正解番号（1問1バイト）
+    categories = db.Column(db.Text, nullable=False) # 分野の JSON 配列
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,306 @@
+"""
+似ている問題（ほぼ同じ問題）の検出（MinHash / LSH）
+
+取り込みや追加を繰り返すと、語尾や記号だけが違う問題が増え、弱点の統計が分かれてしまう。
+すべての組を比べると問題数の2乗になるので、問題ごとに短い署名を作り、
+署名の一部（バンド）が一致する問題どうしだけを比べる。
+
+・署名: 問題文と選択肢を正規化（NFKC・小文字・空白を除く）し、3文字ずつの集合から作る MinHash。
+  1回のハッシュで SIGNATURE_SIZE 個の最小値を求める one permutation hashing
+  （空の枠は右隣の値で埋める）なので、作る時間は文字数に比例する
+・署名は question_signatures に、バンドごとのハッシュは question_lsh_buckets に保存する。
+  content_hash が変わった問題と、署名のない問題だけを計算し直す（sync_signatures）
+・同じバケットに入った問題どうしを署名で比べ、推定した類似度（Jaccard 係数）が
+  SIMILARITY_THRESHOLD 以上の組をつないでグループにする（find_groups）
+・署名は問題の追加・編集・削除と取り込みのときに作り直し、問題バンクのバージョンを上げる。
+  /admin/duplicates は全体のグループ分けをバージョンごとに1回だけ行う（duplicate_groups）
+
+    python find_duplicates.py   # 署名を更新し、似ている問題のグループを表示する
+"""
+import operator
+import struct
+import threading
+import unicodedata
+import zlib
+
+from sqlalchemy import delete, func, insert, select
+
+from database import db
+from model import Question, QuestionLshBucket, QuestionSignature
+from question_cache import current_version
+
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS
+# 類似度 0.8 の組は 99.9% 以上、0.5 の組は約 64%、0.3 の組は約 12% が候補になる（候補は署名で確かめる）
+SIMILARITY_THRESHOLD = 0.8
+# これより多くの問題が入ったバケットは、すべての組ではなく先頭の問題とだけ比べる
+MAX_BUCKET_PAIRS = 16
+BATCH_SIZE = 1000
+
+# 3文字ずつの CRC32（32ビット）の上位6ビットで枠を選び、下位26ビットの最小値をその枠の値にする
+_INDEX_SHIFT = 26
+_VALUE_MASK = (1 << _INDEX_SHIFT) - 1
+_SIGNATURE_FORMAT = f"<{SIGNATURE_SIZE}I"
+_BAND_FORMAT = f"<{ROWS_PER_BAND}I"
+
+
+def normalize(question, choices):
+    """
+    比べる文字列（全角・半角、大文字・小文字、空白の違いを無視する）
+    """
+    parts = [question or ""] + [c or "" for c in choices]
+    text = unicodedata.normalize("NFKC", "\x1f".join(parts)).casefold()
+    return "".join(text.split())
+
+
+def signature(question, choices):
+    """
+    SIGNATURE_SIZE 個の整数（32ビット未満）の署名
+    """
+    text = normalize(question, choices)
+    if len(text) < SHINGLE_SIZE:
+        text = text.ljust(SHINGLE_SIZE, "\x1f")
+    crc32 = zlib.crc32
+    bins = [None] * SIGNATURE_SIZE
+    for i in range(len(text) - SHINGLE_SIZE + 1):
+        h = crc32(text[i:i + SHINGLE_SIZE].encode("utf-8"))
+        index = h >> _INDEX_SHIFT
+        value = h & _VALUE_MASK
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+
+    # 空の枠は、右隣（末尾の次は先頭）の空でない枠の値に距離を足して埋める
+    if None in bins:
+        filled = list(bins)
+        for i in range(SIGNATURE_SIZE):
+            if filled[i] is None:
+                for distance in range(1, SIGNATURE_SIZE):
+                    value = bins[(i + distance) % SIGNATURE_SIZE]
+                    if value is not None:
+                        filled[i] = value + (distance << _INDEX_SHIFT)
+                        break
+        bins = filled
+    return bins
+
+
+def pack(sig):
+    return struct.pack(_SIGNATURE_FORMAT, *sig)
+
+
+def unpack(data):
+    return struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+def band_buckets(sig):
+    """
+    バンドごとのバケット番号（上位にバンドの番号、下位32ビットにそのバンドの値の CRC32）
+    """
+    return [
+        (band << 32) | zlib.crc32(struct.pack(_BAND_FORMAT, *sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]))
+        for band in range(BANDS)
+    ]
+
+
+def similarity(sig_a, sig_b):
+    """
+    2つの署名から推定した類似度（一致する枠の割合）
+    """
+    return sum(map(operator.eq, sig_a, sig_b)) / SIGNATURE_SIZE
+
+
+def forget(ids):
+    """
+    問題の署名とバケットを削除する（問題を削除したとき）
+    """
+    ids = list(ids)
+    for i in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[i:i + BATCH_SIZE]
+        db.session.execute(delete(QuestionLshBucket).where(QuestionLshBucket.question_id.in_(chunk)))
+        db.session.execute(delete(QuestionSignature).where(QuestionSignature.question_id.in_(chunk)))
+
+
+def sync_signatures(ids=None):
+    """
+    署名がない問題と、content_hash が変わった問題の署名を作り直す（ids を渡すとその問題だけ）。
+    作り直した問題の ID を返す。ids を渡さないときは、削除された問題の署名も消す
+    """
+    q = Question.__table__
+    s = QuestionSignature.__table__
+    query = (
+        select(q.c.id, s.c.question_id)
+        .select_from(q.outerjoin(s, s.c.question_id == q.c.id))
+        .where(s.c.question_id.is_(None) | s.c.content_hash.is_not(q.c.content_hash))
+    )
+    targets = []
+    outdated = []
+    for chunk in _chunks(ids):
+        stmt = query if chunk is None else query.where(q.c.id.in_(chunk))
+        for qid, signed_id in db.session.execute(stmt):
+            targets.append(qid)
+            if signed_id is not None:
+                outdated.append(qid)
+    if ids is None:
+        outdated += db.session.scalars(
+            select(s.c.question_id)
+            .select_from(s.outerjoin(q, q.c.id == s.c.question_id))
+            .where(q.c.id.is_(None))
+        ).all()
+    forget(outdated)
+
+    columns = (Question.id, Question.content_hash, Question.question,
+               Question.choice1, Question.choice2, Question.choice3, Question.choice4)
+    for i in range(0, len(targets), BATCH_SIZE):
+        chunk = targets[i:i + BATCH_SIZE]
+        signatures = []
+        buckets = []
+        for row in db.session.execute(select(*columns).where(Question.id.in_(chunk))):
+            sig = signature(row.question, [row.choice1, row.choice2, row.choice3, row.choice4])
+            signatures.append({"question_id": row.id, "content_hash": row.content_hash, "signature": pack(sig)})
+            buckets.extend({"bucket": bucket, "question_id": row.id} for bucket in band_buckets(sig))
+        if signatures:
+            db.session.execute(insert(QuestionSignature.__table__), signatures)
+            db.session.execute(insert(QuestionLshBucket.__table__), buckets)
+    return targets
+
+
+def _chunks(ids):
+    if ids is None:
+        yield None
+        return
+    ids = list(ids)
+    for i in range(0, len(ids), BATCH_SIZE):
+        yield ids[i:i + BATCH_SIZE]
+
+
+class DuplicateGroup:
+    """
+    似ている問題のグループ。members は (問題ID, 先頭の問題との類似度) を ID 順に並べたもの
+    （先頭の問題の類似度は 1.0）
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.ids = [qid for qid, _ in members]
+
+    def __len__(self):
+        return len(self.members)
+
+
+def _shared_buckets(ids):
+    """
+    2問以上が入ったバケットの {バケット: [問題ID, ...]}。
+    ids を渡すと、その問題が入ったバケットだけ（ids が署名のある問題の 1/4 を超えるときは、
+    1問ずつ引くより全体を1回読む方が速いので、すべてのバケットを返す）
+    """
+    b = QuestionLshBucket.__table__
+    if ids is not None and len(ids) * 4 > db.session.scalar(select(func.count()).select_from(QuestionSignature)):
+        ids = None
+    if ids is None:
+        shared = select(b.c.bucket).group_by(b.c.bucket).having(func.count() > 1)
+        queries = [select(b.c.bucket, b.c.question_id).where(b.c.bucket.in_(shared))]
+    else:
+        # 問題IDの索引で問題のバケットを引き、主キー（bucket, question_id）で同じバケットの問題を引く
+        other = b.alias("other")
+        queries = [
+            select(other.c.bucket, other.c.question_id)
+            .distinct()
+            .select_from(b.join(other, other.c.bucket == b.c.bucket))
+            .where(b.c.question_id.in_(chunk))
+            for chunk in _chunks(ids)
+        ]
+
+    buckets = {}
+    for query in queries:
+        for bucket, qid in db.session.execute(query):
+            buckets.setdefault(bucket, set()).add(qid)
+    return {bucket: sorted(members) for bucket, members in buckets.items() if len(members) > 1}
+
+
+def _load_signatures(ids):
+    signatures = {}
+    for chunk in _chunks(ids):
+        rows = db.session.execute(
+            select(QuestionSignature.question_id, QuestionSignature.signature)
+            .where(QuestionSignature.question_id.in_(chunk))
+        )
+        signatures.update((qid, unpack(data)) for qid, data in rows)
+    return signatures
+
+
+def find_groups(ids=None, threshold=SIMILARITY_THRESHOLD):
+    """
+    似ている問題のグループを、大きい順に返す。
+    ids を渡すと、その問題を含むグループだけ（取り込み・追加した問題の確認用）
+    """
+    buckets = _shared_buckets(ids)
+    signatures = _load_signatures({qid for members in buckets.values() for qid in members})
+
+    parent = {}
+
+    def root(qid):
+        parent.setdefault(qid, qid)
+        while parent[qid] != qid:
+            parent[qid] = parent[parent[qid]]
+            qid = parent[qid]
+        return qid
+
+    checked = set()
+    for members in buckets.values():
+        if len(members) <= MAX_BUCKET_PAIRS:
+            pairs = ((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+        else:
+            pairs = ((members[0], b) for b in members[1:])
+        for a, b in pairs:
+            if (a, b) in checked or a not in signatures or b not in signatures:
+                continue
+            checked.add((a, b))
+            if similarity(signatures[a], signatures[b]) >= threshold:
+                ra, rb = root(a), root(b)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+
+    grouped = {}
+    for qid in parent:
+        grouped.setdefault(root(qid), []).append(qid)
+    targets = None if ids is None else set(ids)
+    groups = []
+    for members in grouped.values():
+        if targets is not None and targets.isdisjoint(members):
+            continue
+        members.sort()
+        first_sig = signatures[members[0]]
+        groups.append(DuplicateGroup([(qid, similarity(first_sig, signatures[qid])) for qid in members]))
+    groups.sort(key=lambda group: (-len(group), group.ids[0]))
+    return groups
+
+
+class DuplicateGroupsCache:
+    """
+    全体のグループ分け（find_groups()）の結果を、問題バンクのバージョンごとに持つ
+    """
+
+    def __init__(self):
+        self._version = None
+        self._groups = None
+        self._lock = threading.Lock()
+
+    def groups(self):
+        version = current_version()
+        if self._version == version:
+            return self._groups
+        with self._lock:
+            if self._version != version:
+                self._groups = find_groups()
+                self._version = version
+            return self._groups
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._groups = None
+
+
+duplicate_groups = DuplicateGroupsCache()
@@ -0,0 +1,19 @@
+import time
+
+from app import app
+from template_cache import precompile_templates
+
+def main():
+    cache_dir = app.jinja_env.bytecode_cache.directory if app.jinja_env.bytecode_cache else None
+    if cache_dir is None:
+        print("JINJA_BYTECODE_CACHE_DIR が空のため、バイトコードキャッシュは使われません")
+        return
+    print(f"テンプレートのコンパイル中: {cache_dir}")
+    started = time.perf_counter()
+    names = precompile_templates(app)
+    elapsed = time.perf_counter() - started
+    print(f"{len(names)} テンプレート ({elapsed:.2f} 秒)")
+
+if __name__ == "__main__":
+    # デプロイ時（ワーカーを起動する前）に実行する
+    main()
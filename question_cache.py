@@ -0,0 +1,144 @@
+"""
+問題バンクのプロセス内キャッシュ
+
+/practice や /section_test のたびに questions テーブル全体を読み直さないよう、
+問題を軽量なレコードとカテゴリ別のIDインデックスとして保持する。
+
+複数ワーカー（プロセス）で動かしても古いデータを返さないよう、
+DB の question_bank_version テーブルにバージョン番号を持たせ、
+問題を変更した側が bump_version() で +1 する。
+各プロセスはアクセスのたびにバージョン番号だけを確認し、変わっていれば読み直す。
+"""
+import threading
+from collections import namedtuple
+
+from sqlalchemy import select, update, insert
+
+from database import db
+from model import Question, QuestionBankVersion
+
+# テンプレートからは ORM の Question と同じ属性名で参照できる
+QuestionRecord = namedtuple(
+    "QuestionRecord",
+    [
+        "id", "question",
+        "choice1", "choice2", "choice3", "choice4",
+        "correct", "category", "rationale", "reference",
+    ],
+)
+
+_VERSION_ROW_ID = 1
+
+
+class BankSnapshot:
+    """
+    ある時点の問題バンク（読み取り専用）
+    """
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = records  # {id: QuestionRecord}
+        self.all_ids = tuple(sorted(records))
+
+        by_category = {}
+        for qid in self.all_ids:
+            by_category.setdefault(records[qid].category, []).append(qid)
+        self.by_category = {cat: tuple(ids) for cat, ids in by_category.items()}
+
+        # 章末テスト「すべて」用（category LIKE 'section_%' 相当）
+        self.section_ids = tuple(
+            qid for qid in self.all_ids
+            if (records[qid].category or "").startswith("section_")
+        )
+
+        # 採点用（grading.py）: {id: (フォームの入力名, 正解番号, 分野)}
+        self.answer_entries = {
+            qid: (f"question_{qid}", _answer_byte(q.correct), q.category)
+            for qid, q in records.items()
+        }
+
+    def get(self, qid):
+        return self.records.get(qid)
+
+    def ids_for_category(self, category):
+        if category == "all":
+            return self.section_ids
+        return self.by_category.get(category, ())
+
+    def questions(self, ids):
+        """
+        ID の並び順を保ったまま、存在するレコードだけを返す
+        """
+        records = self.records
+        return [records[qid] for qid in ids if qid in records]
+
+
+def _answer_byte(correct):
+    # 正解が 1〜4 以外（未設定など）の問題は、どの回答とも一致しない値にする（grading.NO_ANSWER_KEY）
+    return correct if correct in (1, 2, 3, 4) else 255
+
+
+class QuestionBankCache:
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        最新の問題バンクを返す。DBのバージョンが変わっていれば読み直す
+        """
+        version = current_version()
+        snap = self._snapshot
+        if snap is not None and snap.version == version:
+            return snap
+
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.version == version:
+                return snap
+            snap = _load_snapshot(version)
+            self._snapshot = snap
+            return snap
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+
+question_bank = QuestionBankCache()
+
+
+def current_version():
+    version = db.session.execute(
+        select(QuestionBankVersion.version).where(QuestionBankVersion.id == _VERSION_ROW_ID)
+    ).scalar()
+    return version or 0
+
+
+def bump_version():
+    """
+    問題バンクのバージョンを +1 する。
+    問題を変更するトランザクションの中で呼び、同じ commit で確定させること
+    """
+    result = db.session.execute(
+        update(QuestionBankVersion)
+        .where(QuestionBankVersion.id == _VERSION_ROW_ID)
+        .values(version=QuestionBankVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.execute(
+            insert(QuestionBankVersion).values(id=_VERSION_ROW_ID, version=1)
+        )
+
+
+def _load_snapshot(version):
+    rows = db.session.execute(
+        select(
+            Question.id, Question.question,
+            Question.choice1, Question.choice2, Question.choice3, Question.choice4,
+            Question.correct, Question.category, Question.rationale, Question.reference,
+        )
+    ).all()
+    records = {row.id: QuestionRecord(*row) for row in rows}
+    return BankSnapshot(version, records)
@@ -0,0 +1,124 @@
+"""
+問題データのエクスポート（ストリーミング）
+
+問題を yield_per で少しずつ読みながら、JSON / NDJSON / CSV に変換して
+チャンク単位で返すジェネレーター。問題数が増えてもメモリ使用量は一定。
+gzip=True のときは zlib で逐次圧縮する。
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from database import db
+from model import Question
+
+FORMATS = {
+    # format: (mimetype, 拡張子)
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+CSV_HEADER = ["question", "choice1", "choice2", "choice3", "choice4", "correct", "category", "rationale", "reference"]
+
+YIELD_PER = 500
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_questions():
+    rows = db.session.execute(
+        select(
+            Question.question,
+            Question.choice1, Question.choice2, Question.choice3, Question.choice4,
+            Question.correct, Question.category, Question.rationale, Question.reference,
+        )
+        .order_by(Question.id)
+        .execution_options(yield_per=YIELD_PER)
+    )
+    for row in rows:
+        yield {
+            "question": row.question,
+            "choices": [row.choice1, row.choice2, row.choice3, row.choice4],
+            "correct": row.correct,
+            "category": row.category,
+            "rationale": row.rationale,
+            "reference": row.reference,
+        }
+
+
+def _json_pieces(items):
+    # 従来の json.dumps(..., indent=4) と同じ見た目の配列を1問ずつ書き出す
+    yield "["
+    first = True
+    for item in items:
+        body = json.dumps(item, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+        yield ("\n    " if first else ",\n    ") + body
+        first = False
+    yield "]" if first else "\n]"
+
+
+def _ndjson_pieces(items):
+    for item in items:
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def _csv_pieces(items):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for item in items:
+        writer.writerow([item["question"], *item["choices"], item["correct"],
+                         item["category"], item["rationale"], item["reference"]])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+_WRITERS = {"json": _json_pieces, "ndjson": _ndjson_pieces, "csv": _csv_pieces}
+
+
+def export_chunks(fmt, gzip=False):
+    """
+    エクスポートの内容を bytes のチャンクで順に返す
+    """
+    pieces = _WRITERS[fmt](iter_questions())
+    if fmt == "csv":
+        # Excel で開いても文字化けしないよう、CSV の先頭には BOM を付ける
+        pieces = _prepend("\ufeff", pieces)
+    chunks = _batched(pieces)
+    if gzip:
+        chunks = _gzipped(chunks)
+    return chunks
+
+
+def _prepend(head, pieces):
+    yield head
+    yield from pieces
+
+
+def _batched(pieces):
+    # 細かい文字列をまとめて、CHUNK_SIZE 程度の bytes にしてから送る
+    parts = []
+    size = 0
+    for piece in pieces:
+        parts.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+            size = 0
+    if parts:
+        yield "".join(parts).encode("utf-8")
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip 形式
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,122 @@
+"""
+管理画面の問題一覧のページ分け
+
+OFFSET で読み飛ばす代わりに、主キー（Question.id）の範囲で次・前のページを読む（キーセット方式）。
+深いページでも、読む行数は1ページ分だけになる。
+
+・件数とページ番号は、問題バンクのキャッシュ（question_cache）の ID 一覧から求める。
+  問題を追加・編集・削除したルートは bump_version() を呼ぶので、キャッシュも読み直される
+・一覧に表示しない解説（rationale）・参照URL（reference）は読み込まない
+"""
+from bisect import bisect_left
+
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+
+from database import db
+from model import Question
+
+PER_PAGE = 20
+
+# 一覧に表示する列
+_LIST_COLUMNS = (Question.id, Question.question, Question.category)
+
+
+def section_ids(bank, section):
+    """
+    章（"all" または "1"〜"16"）の問題IDを昇順で返す
+    """
+    if section == "all":
+        return bank.all_ids
+    return bank.by_category.get(f"section_{section}", ())
+
+
+def section_counts(bank, sections):
+    """
+    章ごとの問題数 {章: 件数}
+    """
+    return {section: len(section_ids(bank, section)) for section in sections}
+
+
+class QuestionPage:
+    """
+    一覧の1ページ分。items と、前後・番号つきのページへのリンク用の値を持つ
+    """
+
+    def __init__(self, items, ids, start):
+        self.items = items
+        self.ids = ids
+        self.total = len(ids)
+        self.pages = max(1, -(-self.total // PER_PAGE))
+        # 先頭の問題が ID 一覧の何番目かから、ページ番号を決める
+        self.page = min(start // PER_PAGE + 1, self.pages)
+
+    @property
+    def has_prev(self):
+        return bool(self.items) and self.items[0].id != self.ids[0]
+
+    @property
+    def has_next(self):
+        return bool(self.items) and self.items[-1].id != self.ids[-1]
+
+    def prev_args(self):
+        return {"before": self.items[0].id}
+
+    def next_args(self):
+        return {"after": self.items[-1].id}
+
+    def page_args(self, page):
+        """
+        番号つきのページへのリンク用（そのページの直前の問題IDを after に渡す）
+        """
+        if page <= 1:
+            return {}
+        return {"after": self.ids[(page - 1) * PER_PAGE - 1]}
+
+    def iter_pages(self, left_edge=2, left_current=2, right_current=4, right_edge=2):
+        """
+        表示するページ番号（省略する箇所は None）。Flask-SQLAlchemy の Pagination と同じ並び
+        """
+        last = 0
+        for num in range(1, self.pages + 1):
+            if (
+                num <= left_edge
+                or self.page - left_current <= num <= self.page + right_current
+                or num > self.pages - right_edge
+            ):
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+def list_page(bank, section, after=None, before=None, page=None):
+    """
+    after（その ID より後）・before（その ID より前）・page（番号）のどれかで指定したページを返す
+    """
+    ids = section_ids(bank, section)
+    if after is None and before is None and page and page > 1:
+        # 番号だけの指定（以前の ?page= のリンク）は、直前の ID に読み替える
+        index = min(page - 1, max(len(ids) - 1, 0) // PER_PAGE) * PER_PAGE
+        if index:
+            after = ids[index - 1]
+
+    query = select(Question).options(load_only(*_LIST_COLUMNS))
+    if section != "all":
+        query = query.where(Question.category == f"section_{section}")
+
+    if before is not None:
+        rows = db.session.scalars(
+            query.where(Question.id < before).order_by(Question.id.desc()).limit(PER_PAGE)
+        ).all()
+        rows.reverse()
+        if len(rows) < PER_PAGE:
+            # 先頭のページに届いたら、先頭から1ページ分を表示する
+            return list_page(bank, section)
+    else:
+        if after is not None:
+            query = query.where(Question.id > after)
+        rows = db.session.scalars(query.order_by(Question.id).limit(PER_PAGE)).all()
+
+    start = bisect_left(ids, rows[0].id) if rows else 0
+    return QuestionPage(rows, ids, start)
@@ -0,0 +1,256 @@
+"""
+問題の全文検索（SQLite FTS5）
+
+questions の問題文・選択肢・解説・参照URLを、FTS5 の仮想テーブル questions_fts で検索する。
+日本語は単語の区切りがないので、3文字ずつに区切る trigram トークナイザーを使う。
+
+・questions_fts は questions（のビュー）を参照する外部コンテンツのテーブルで、本文を二重には持たない
+・questions への INSERT / DELETE と、本文の列の UPDATE をトリガーで questions_fts に反映する。
+  管理画面の追加・編集・削除も、import_questions.py の取り込みも、そのまま同期される
+  （回答数などの列だけの UPDATE ではトリガーは動かない）。
+  取り込みで大量の行が変わるときは、トリガーを外して最後に索引を作り直す（suspend_sync / resume_sync）
+・db.create_all() で questions を作ったときにも、仮想テーブルとトリガーを作る
+・SQLite 以外のDB（と、questions_fts をまだ作っていないDB）では、LIKE による検索（順位付けなし）になる
+
+検索語は空白で区切って AND で探し、bm25 で順位を付ける（一致が RANK_LIMIT 件を超えるときは ID 順）。
+・3文字以上の語は、そのまま索引で探す
+・2文字の語は trigram の索引に直接は載らないので、その2文字で始まる3文字（索引の語の一覧
+  questions_fts_vocab から探す）のどれかを含むもの、として探す。
+  （列の末尾の2文字も見つかるよう、索引には各列の末尾に空白を付けた値を入れている）。
+  候補の3文字が多すぎるよく使われる語は、LIKE で絞り込む（ページが埋まるまで先頭から順に見る）
+・1文字の語は LIKE で絞り込む。1文字の語だけでは検索しない
+"""
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event, or_, select, text
+
+from database import db
+from model import Question
+
+FTS_TABLE = "questions_fts"
+PER_PAGE = 20
+MAX_QUERY_TERMS = 8
+RANK_LIMIT = 1000  # 一致がこれより多い検索は、関連順ではなく ID 順に並べる
+MAX_PAIR_EXPANSION = 64  # 2文字の語を、その2文字で始まる3文字の OR にするときの上限
+
+# 検索する列と、順位付け（bm25）の重み。問題文に一致したものを上位にする
+SEARCH_COLUMNS = [
+    ("question", 10.0),
+    ("choice1", 2.0),
+    ("choice2", 2.0),
+    ("choice3", 2.0),
+    ("choice4", 2.0),
+    ("rationale", 1.0),
+    ("reference", 0.5),
+]
+
+_COLUMN_NAMES = [name for name, _ in SEARCH_COLUMNS]
+_COLUMN_LIST = ", ".join(_COLUMN_NAMES)
+# 索引に入れる値は、各列の末尾に空白を1つ付けたもの。列の最後の2文字も「その2文字で始まる3文字」として
+# 索引に載り、2文字の語で見つけられるようにする（トリガーと questions_fts_content ビューで同じ式を使う）
+_NEW_VALUES = ", ".join(f"new.{name} || ' '" for name in _COLUMN_NAMES)
+_OLD_VALUES = ", ".join(f"old.{name} || ' '" for name in _COLUMN_NAMES)
+_VIEW_COLUMNS = ", ".join(f"{name} || ' ' AS {name}" for name in _COLUMN_NAMES)
+
+CONTENT_VIEW = f"{FTS_TABLE}_content"
+VOCAB_TABLE = f"{FTS_TABLE}_vocab"
+
+# 仮想テーブルとトリガー（マイグレーション b27e9c4d1f60 と同じ内容）
+SCHEMA_STATEMENTS = [
+    f"CREATE VIEW IF NOT EXISTS {CONTENT_VIEW} AS SELECT id, {_VIEW_COLUMNS} FROM questions",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_COLUMN_LIST}, content='{CONTENT_VIEW}', content_rowid='id', tokenize='trigram')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'row')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON questions BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLUMN_LIST}) VALUES (new.id, {_NEW_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON questions BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMN_LIST}) VALUES ('delete', old.id, {_OLD_VALUES}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_COLUMN_LIST} ON questions BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLUMN_LIST}) VALUES ('delete', old.id, {_OLD_VALUES}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLUMN_LIST}) VALUES (new.id, {_NEW_VALUES}); END",
+]
+
+for _statement in SCHEMA_STATEMENTS:
+    event.listen(Question.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+# snippet() で一致箇所を囲む文字（表示するときに <mark> に置き換える）
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+_SNIPPET_TOKENS = 24
+
+
+_TRIGGER_NAMES = [f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au"]
+
+
+def fts_available():
+    """
+    questions_fts があるか（SQLite で、create_all かマイグレーションで作ってあるか）
+    """
+    if db.engine.dialect.name != "sqlite":
+        return False
+    return db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).scalar() is not None
+
+
+def rebuild_index():
+    """
+    questions の内容から検索用の索引を作り直す（トリガーを作る前からある行も含める）
+    """
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def suspend_sync():
+    """
+    同期用のトリガーを外す（大量の行を書き換える前に呼ぶ）。
+    1行ずつ索引を更新するより、書き換えた後に resume_sync() で作り直す方が速い。
+    同じトランザクションの中で resume_sync() まで呼ぶこと
+    """
+    for name in _TRIGGER_NAMES:
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def resume_sync():
+    """
+    索引を作り直し、同期用のトリガーを戻す
+    """
+    rebuild_index()
+    for statement in SCHEMA_STATEMENTS[3:]:
+        db.session.execute(text(statement))
+
+
+def parse_query(q):
+    """
+    検索語を空白で区切る（重複は除き、MAX_QUERY_TERMS 個まで）
+    """
+    return list(dict.fromkeys((q or "").split()))[:MAX_QUERY_TERMS]
+
+
+def _phrase(term):
+    # 利用者の入力を FTS5 の構文として解釈させないよう、" で囲む
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _pair_trigrams(term):
+    """
+    索引にある3文字のうち、2文字の語で始まるもの。多すぎるときは None
+    """
+    start = term.lower()  # trigram トークナイザーは大文字・小文字を区別しない（索引は小文字）
+    if len(start) != 2:
+        return None
+    return db.session.scalars(
+        text(f"SELECT term FROM {VOCAB_TABLE} WHERE term >= :start AND term < :stop LIMIT :limit"),
+        {"start": start, "stop": start + "\U0010ffff", "limit": MAX_PAIR_EXPANSION + 1},
+    ).all()
+
+
+def _like_pattern(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def highlight(snippet):
+    """
+    snippet() の一致箇所を <mark> で囲んだ HTML にする（それ以外はエスケープする）
+    """
+    if not snippet:
+        return None
+    return Markup(str(escape(snippet)).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"))
+
+
+class SearchPage:
+    """
+    検索結果の1ページ分。hits は (問題ID, 一致箇所の抜粋 or None) のリスト。
+    ranked が False なら、一致が多すぎるため関連順ではなく ID 順に並べている。
+    too_short は1文字の語だけで検索しようとしたとき
+    """
+
+    def __init__(self, query, hits, page, has_next, ranked=True, too_short=False):
+        self.query = query
+        self.hits = hits
+        self.page = page
+        self.has_prev = page > 1
+        self.has_next = has_next
+        self.prev_num = page - 1
+        self.next_num = page + 1
+        self.ranked = ranked
+        self.too_short = too_short
+
+
+def search(q, page=1, per_page=PER_PAGE):
+    """
+    検索語に一致する問題を、関連の高い順に1ページ分返す
+    """
+    page = max(page, 1)
+    terms = parse_query(q)
+    if not terms:
+        return SearchPage(q, [], 1, False)
+    if all(len(term) < 2 for term in terms):
+        return SearchPage(q, [], 1, False, too_short=True)
+
+    offset = (page - 1) * per_page
+    ranked = False
+    if fts_available():
+        rows, ranked = _search_fts(terms, per_page + 1, offset)
+    else:
+        rows = _search_like(terms, per_page + 1, offset)
+    hits = [(qid, highlight(snippet)) for qid, snippet in rows[:per_page]]
+    return SearchPage(q, hits, page, len(rows) > per_page, ranked)
+
+
+def _search_fts(terms, limit, offset):
+    """
+    (行, 関連順に並べたか) を返す
+    """
+    phrases = []
+    likes = []
+    for term in terms:
+        if len(term) >= 3:
+            phrases.append(_phrase(term))
+            continue
+        trigrams = _pair_trigrams(term)
+        if trigrams is None or len(trigrams) > MAX_PAIR_EXPANSION:
+            likes.append(term)
+        elif not trigrams:
+            return [], True  # どの問題にも含まれない2文字
+        else:
+            phrases.append("(" + " OR ".join(map(_phrase, trigrams)) + ")")
+
+    params = {"limit": limit, "offset": offset}
+    where = []
+    ranked = False
+    if phrases:
+        params["match"] = " AND ".join(phrases)
+        where.append(f"{FTS_TABLE} MATCH :match")
+        # bm25 は一致した全件の統計を読むので、一致が多い語（"Python" など）では遅い。
+        # 先に RANK_LIMIT 件を超えるかだけを数え（ID 順に読むので途中で止まる）、
+        # 超えるときは関連順をあきらめて ID 順に、そのページの分だけ読む
+        ranked = db.session.execute(
+            text(f"SELECT count(*) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match LIMIT :probe)"),
+            {"match": params["match"], "probe": RANK_LIMIT + 1},
+        ).scalar() <= RANK_LIMIT
+    for i, term in enumerate(likes):
+        # どれかの列に含まれていればよい
+        where.append("(" + " OR ".join(f"{name} LIKE :like{i} ESCAPE '\\'" for name in _COLUMN_NAMES) + ")")
+        params[f"like{i}"] = _like_pattern(term)
+    where = " AND ".join(where)
+
+    if phrases:
+        columns = f"rowid, snippet({FTS_TABLE}, -1, '{_MARK_START}', '{_MARK_END}', '…', {_SNIPPET_TOKENS})"
+    else:
+        columns = "rowid, NULL"
+    if ranked:
+        weights = ", ".join(str(weight) for _, weight in SEARCH_COLUMNS)
+        order = f" ORDER BY bm25({FTS_TABLE}, {weights}), rowid"
+    else:
+        order = ""  # FTS5 は rowid の昇順に返す
+
+    sql = f"SELECT {columns} FROM {FTS_TABLE} WHERE {where}{order} LIMIT :limit OFFSET :offset"
+    return db.session.execute(text(sql), params).all(), ranked
+
+
+def _search_like(terms, limit, offset):
+    columns = [getattr(Question, name) for name in _COLUMN_NAMES]
+    query = select(Question.id, db.null())
+    for term in terms:
+        pattern = _like_pattern(term)
+        query = query.where(or_(*(column.like(pattern, escape="\\") for column in columns)))
+    return db.session.execute(query.order_by(Question.id).limit(limit).offset(offset)).all()
@@ -0,0 +1,32 @@
+import sys
+import time
+
+from app import app
+from database import db
+from analytics_rollup import rebuild_rollups
+from score_histograms import rebuild_histograms
+from spaced_repetition import rebuild_learning_states
+
+def rebuild(user_id=None):
+    target = f"user_id={user_id}" if user_id is not None else "全ユーザー"
+    print(f"集計テーブル再構築中: {target}")
+    started = time.perf_counter()
+    with app.app_context():
+
+        db.create_all()
+        weekly_count, section_count = rebuild_rollups(user_id)
+        # 得点分布は全ユーザー分なので、ユーザーを指定しないときだけ作り直す
+        histogram_count = rebuild_histograms() if user_id is None else None
+        state_count = rebuild_learning_states(user_id)
+        db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"週次: {weekly_count} 行, 章別(日次): {section_count} 行 ({elapsed:.2f} 秒)")
+    if histogram_count is not None:
+        print(f"得点分布: {histogram_count} 行")
+    print(f"復習の予定: {state_count} 行")
+    print("再構築完了！")
+
+if __name__ == "__main__":
+    # python rebuild_analytics.py [user_id]
+    rebuild(int(sys.argv[1]) if len(sys.argv) > 1 else None)
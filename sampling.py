@@ -0,0 +1,134 @@
+"""
+模擬試験の層別抽出
+
+問題バンクのスナップショットが持つ分野別の ID 配列（by_category）から、
+分野ごとの出題数を決めてそれぞれから抽出する。全問を並べ替えたりシャッフルしたりしないので、
+抽出にかかる時間は出題数 k に比例する。
+
+・分野ごとの出題数は、重み（weights）に比例させるか、固定の問題数（quotas）で指定する。
+  どちらも指定しなければ、各分野の問題数に比例させる
+・exclude に渡した問題（直近の受験で出た問題など）はできるだけ避ける。
+  避けると足りない分野では、避けた問題からも選ぶ
+・rng に random.Random(seed) を渡せば、同じ seed で同じ問題が同じ順に出る（デバッグ用）
+"""
+import random
+
+from sqlalchemy import select
+
+from database import db
+from model import QuizAnswer, QuizResult
+
+
+def allocate(k, capacities, weights=None, quotas=None):
+    """
+    k 問を分野に割り振る。capacities は {分野: 出題できる問題数}。
+    重みに比例した数を最大剰余法で整数にし、問題が足りない分野の不足分は他の分野に回す。
+    quotas（{分野: 問題数}。合計は k）を指定したときは、その数を割り振り、
+    問題が足りない分野の不足分を quotas に比例して他の分野に回す
+    """
+    counts = {cat: 0 for cat in capacities}
+    if quotas is not None:
+        quota_total = sum(int(n) for n in quotas.values())
+        if quota_total != k:
+            raise ValueError(f"分野ごとの出題数の合計（{quota_total}）が出題数（{k}）と一致しません")
+        for cat, cap in capacities.items():
+            counts[cat] = min(int(quotas.get(cat, 0)), cap)
+        weights = quotas
+    elif weights is None:
+        weights = capacities
+
+    remaining = min(k, sum(capacities.values())) - sum(counts.values())
+    open_cats = [cat for cat, cap in capacities.items() if counts[cat] < cap and weights.get(cat, 0) > 0]
+    if quotas is not None and remaining > 0 and not open_cats:
+        # quotas に含まれない分野にしか問題が残っていなければ、問題数に比例して回す
+        weights = capacities
+        open_cats = [cat for cat, cap in capacities.items() if counts[cat] < cap]
+
+    while remaining > 0 and open_cats:
+        total_weight = sum(weights[cat] for cat in open_cats)
+        shares = {cat: remaining * weights[cat] / total_weight for cat in open_cats}
+        given = {cat: int(share) for cat, share in shares.items()}
+        leftover = remaining - sum(given.values())
+        # 端数の大きい分野から1問ずつ足す
+        for cat in sorted(open_cats, key=lambda c: shares[c] - given[c], reverse=True)[:leftover]:
+            given[cat] += 1
+
+        for cat in open_cats:
+            take = min(given[cat], capacities[cat] - counts[cat])
+            counts[cat] += take
+            remaining -= take
+        open_cats = [cat for cat in open_cats if counts[cat] < capacities[cat]]
+
+    return counts
+
+
+def _sample_ids(ids, n, rng, exclude, n_excluded):
+    """
+    ids（分野の ID 配列）から exclude を避けて n 問選ぶ。足りなければ exclude からも選ぶ。
+    n_excluded は ids のうち exclude に含まれる数
+    """
+    if n <= 0:
+        return []
+    if not n_excluded:
+        return rng.sample(ids, n)
+
+    if len(ids) - n_excluded >= 2 * n:
+        # 避ける問題が少なければ、配列を作り直さずに引き直しで選ぶ
+        chosen = []
+        seen = set()
+        while len(chosen) < n:
+            qid = ids[rng.randrange(len(ids))]
+            if qid in seen or qid in exclude:
+                continue
+            seen.add(qid)
+            chosen.append(qid)
+        return chosen
+
+    fresh = [qid for qid in ids if qid not in exclude]
+    if len(fresh) >= n:
+        return rng.sample(fresh, n)
+    stale = [qid for qid in ids if qid in exclude]
+    return fresh + rng.sample(stale, n - len(fresh))
+
+
+def stratified_sample(bank, k, rng=None, weights=None, quotas=None, exclude=frozenset(), categories=None):
+    """
+    分野別に抽出した k 問の ID を、ランダムな出題順で返す
+    """
+    rng = rng or random.Random()
+    if categories is None:
+        categories = sorted(bank.by_category, key=lambda c: (c is None, c or ""))
+    capacities = {cat: len(bank.by_category.get(cat, ())) for cat in categories}
+
+    # 避ける問題が分野ごとに何問あるか（exclude の大きさに比例する手間で数える）
+    excluded_counts = {}
+    for qid in exclude:
+        record = bank.get(qid)
+        if record is not None:
+            excluded_counts[record.category] = excluded_counts.get(record.category, 0) + 1
+
+    counts = allocate(k, capacities, weights, quotas)
+    chosen = []
+    for cat in categories:
+        chosen.extend(_sample_ids(
+            bank.by_category.get(cat, ()), counts[cat], rng, exclude, excluded_counts.get(cat, 0)
+        ))
+    rng.shuffle(chosen)
+    return chosen
+
+
+def recent_question_ids(user_id, attempts):
+    """
+    ユーザーの直近 attempts 回の受験で出た問題の ID
+    """
+    if attempts <= 0:
+        return frozenset()
+    recent_results = (
+        select(QuizResult.id)
+        .where(QuizResult.user_id == user_id)
+        .order_by(QuizResult.timestamp.desc())
+        .limit(attempts)
+    )
+    return frozenset(db.session.execute(
+        select(QuizAnswer.question_id).where(QuizAnswer.result_id.in_(recent_results))
+    ).scalars())
@@ -0,0 +1,150 @@
+"""
+試験の種類ごとの得点分布（ヒストグラム）
+
+受験結果を正答率の区間（0〜100%、1% 刻みの BUCKETS 個）ごとに数えておき、
+結果画面と /analytics_data で「全受験の中での位置（パーセンタイル順位）」と平均正答率を、
+区間の数（最大 BUCKETS 行）だけ読んで求める。quiz_results を数え直さない。
+
+・score_histograms : 試験の種類 × 区間 の受験回数・正解数の合計・問題数の合計
+・結果の保存時（save_quiz_result）に同じトランザクションで加算しておく
+・過去データの取り込みや不整合の修復は rebuild_histograms()（rebuild_analytics.py）で行う
+・母集団は全ユーザーの全受験（同じ人の複数回の受験もそれぞれ数える）。
+  問題数の違う受験（章末テストなど）も正答率で比べる
+"""
+from sqlalchemy import delete, func, select
+
+from database import db, upsert_increment
+from model import QuizResult, ScoreHistogram
+
+BUCKETS = 101        # 正答率 0%〜100%
+MIN_COHORT_SIZE = 10  # 受験回数がこれより少ない試験の種類では、順位を出さない
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def bucket_of(correct, total):
+    """
+    正答率の区間（0〜100。切り捨て）
+    """
+    return min(max(correct * 100 // total, 0), BUCKETS - 1)
+
+
+def record_result(exam_type, total, correct):
+    """
+    保存した結果1件分を得点分布に加算する。呼び出し側のトランザクションで commit すること
+    """
+    if total <= 0:
+        return
+    upsert_increment(
+        ScoreHistogram.__table__,
+        [{
+            "exam_type": exam_type,
+            "bucket": bucket_of(correct, total),
+            "attempts": 1,
+            "correct_answers": correct,
+            "total_questions": total,
+        }],
+        ["exam_type", "bucket"],
+        ["attempts", "correct_answers", "total_questions"],
+    )
+
+
+def load_histograms(exam_types):
+    """
+    試験の種類ごとの得点分布 {exam_type: [(区間, 受験回数, 正解数の合計, 問題数の合計), ...]} を1回のクエリで読む
+    """
+    rows = db.session.execute(
+        select(
+            ScoreHistogram.exam_type, ScoreHistogram.bucket, ScoreHistogram.attempts,
+            ScoreHistogram.correct_answers, ScoreHistogram.total_questions,
+        )
+        .where(ScoreHistogram.exam_type.in_(list(exam_types)))
+    ).all()
+    histograms = {}
+    for exam_type, bucket, attempts, correct, total in rows:
+        histograms.setdefault(exam_type, []).append((bucket, attempts, correct, total))
+    return histograms
+
+
+def standing_in(histogram, total, correct):
+    """
+    得点分布（load_histograms の1種類分）の中での位置。
+    {"percentile": パーセンタイル順位, "top_percent": 上位何%か, "mean_rate": 平均正答率, "attempts": 受験回数}
+    を返す（受験回数が MIN_COHORT_SIZE に満たないときは None）。
+    パーセンタイル順位は「自分より低い区間の回数 + 同じ区間の回数の半分」の割合
+    """
+    if total <= 0:
+        return None
+    attempts = sum(row[1] for row in histogram)
+    if attempts < MIN_COHORT_SIZE:
+        return None
+
+    own = bucket_of(correct, total)
+    below = sum(n for bucket, n, _, _ in histogram if bucket < own)
+    same = sum(n for bucket, n, _, _ in histogram if bucket == own)
+    percentile = (below + same / 2) / attempts * 100
+    total_questions = sum(row[3] for row in histogram)
+    return {
+        "percentile": round(percentile, 1),
+        "top_percent": round(100 - percentile, 1),
+        "mean_rate": round(sum(row[2] for row in histogram) / total_questions * 100, 1),
+        "attempts": attempts,
+    }
+
+
+def standing(exam_type, total, correct):
+    """
+    その試験の種類の全受験の中での位置（standing_in を参照）
+    """
+    if total <= 0:
+        return None
+    return standing_in(load_histograms([exam_type]).get(exam_type, []), total, correct)
+
+
+def total_attempts_column(exam_types):
+    """
+    試験の種類の受験回数の合計を返すスカラー副問い合わせ（キャッシュのキー用。他の人が受験すると順位が変わるため）。
+    他のクエリの SELECT に加えて、往復を増やさずに読む
+    """
+    return (
+        select(func.coalesce(func.sum(ScoreHistogram.attempts), 0))
+        .where(ScoreHistogram.exam_type.in_(list(exam_types)))
+        .scalar_subquery()
+        .label("cohort_attempts")
+    )
+
+
+def rebuild_histograms():
+    """
+    quiz_results から得点分布を作り直す。呼び出し側で commit すること
+    """
+    bucket = (QuizResult.correct_answers * 100) // QuizResult.total_questions
+    rows = db.session.execute(
+        select(
+            QuizResult.exam_type, bucket,
+            func.count(QuizResult.id),
+            func.sum(QuizResult.correct_answers),
+            func.sum(QuizResult.total_questions),
+        )
+        .where(QuizResult.total_questions > 0)
+        .group_by(QuizResult.exam_type, bucket)
+    ).all()
+
+    # 正解数が問題数を超えるような不正な行も、0〜100 の区間にまとめる
+    merged = {}
+    for exam_type, bucket_value, attempts, correct, total in rows:
+        key = (exam_type, min(max(bucket_value, 0), BUCKETS - 1))
+        counts = merged.setdefault(key, [0, 0, 0])
+        counts[0] += attempts
+        counts[1] += correct or 0
+        counts[2] += total or 0
+
+    db.session.execute(delete(ScoreHistogram))
+    histogram_rows = [
+        {"exam_type": exam_type, "bucket": bucket_value,
+         "attempts": attempts, "correct_answers": correct, "total_questions": total}
+        for (exam_type, bucket_value), (attempts, correct, total) in merged.items()
+    ]
+    for start in range(0, len(histogram_rows), REBUILD_BATCH_SIZE):
+        db.session.execute(ScoreHistogram.__table__.insert(), histogram_rows[start:start + REBUILD_BATCH_SIZE])
+    return len(histogram_rows)
@@ -0,0 +1,178 @@
+"""
+ユーザーごとの復習の予定（間隔反復）
+
+苦手克服・特訓講座は全ユーザー合計の正答率（Question.total_count / correct_count）で問題を選ぶので、
+自分の回答履歴は反映されない。そこでユーザー × 問題ごとに learning_states を持ち、
+SM-2 を正誤だけで使えるようにした規則で「次に復習する日時」を決める。
+
+・正解: 連続正解数 +1。間隔は 1日 → 6日 → 前回の間隔 × ease（日）と伸ばし、ease を少し上げる
+・不正解（未回答を含む）: 連続正解数と間隔を 0 に戻し、ease を下げ、RELEARN_DELAY 後に復習する
+・採点結果の保存時（save_quiz_result）に同じトランザクションで、出題した問題の行だけを読んで更新する
+・「復習」モードは (user_id, next_due) の索引を期限の古い順に N 件だけ読む
+・どちらも、問題バンクの大きさや回答履歴の長さによらず、1回の試験の問題数ぶんの行しか読まない
+・過去の回答（quiz_answers）からの作り直しは rebuild_learning_states()（rebuild_analytics.py）で行う
+"""
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+
+from database import db, upsert_replace
+from model import LearningState, QuizAnswer
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+EASE_BONUS = 0.05   # 正解したときに ease に足す値
+EASE_PENALTY = 0.2  # 間違えたときに ease から引く値
+FIRST_INTERVAL_DAYS = 1
+SECOND_INTERVAL_DAYS = 6
+MAX_INTERVAL_DAYS = 365
+RELEARN_DELAY = timedelta(minutes=10)  # 間違えた問題を、すぐに復習できるようになるまでの時間
+
+DUE_COUNT_LIMIT = 100  # 選択画面に表示する「復習する問題の数」の上限（これ以上は数えない）
+DUE_LOOKAHEAD = 20     # 削除された問題の分を見込んで、多めに読む件数
+
+REBUILD_BATCH_SIZE = 1000
+
+_VALUE_COLUMNS = ["ease", "interval_days", "streak", "next_due", "last_reviewed"]
+
+
+def schedule(state, is_correct, now):
+    """
+    (ease, 間隔（日）, 連続正解数) と正誤から、次の (ease, 間隔（日）, 連続正解数, 次に復習する日時) を返す。
+    state が None ならはじめて回答した問題
+    """
+    ease, interval_days, streak = state or (INITIAL_EASE, 0, 0)
+    if not is_correct:
+        return max(ease - EASE_PENALTY, MIN_EASE), 0, 0, now + RELEARN_DELAY
+
+    streak += 1
+    if streak == 1:
+        interval_days = FIRST_INTERVAL_DAYS
+    elif streak == 2:
+        interval_days = SECOND_INTERVAL_DAYS
+    else:
+        interval_days = min(max(round(interval_days * ease), interval_days + 1), MAX_INTERVAL_DAYS)
+    return ease + EASE_BONUS, interval_days, streak, now + timedelta(days=interval_days)
+
+
+def _state_row(user_id, question_id, scheduled, now):
+    ease, interval_days, streak, next_due = scheduled
+    return {
+        "user_id": user_id,
+        "question_id": question_id,
+        "ease": ease,
+        "interval_days": interval_days,
+        "streak": streak,
+        "next_due": next_due,
+        "last_reviewed": now,
+    }
+
+
+def record_answers(user_id, now, answers):
+    """
+    採点した回答で復習の予定を更新する。answers は (question_id, is_correct) の列。
+    呼び出し側のトランザクションで commit すること
+    """
+    answers = dict(answers)  # 同じ問題が2回あれば後の方を使う
+    if not answers:
+        return
+    current = {}
+    ids = list(answers)
+    for start in range(0, len(ids), REBUILD_BATCH_SIZE):
+        rows = db.session.execute(
+            select(LearningState.question_id, LearningState.ease, LearningState.interval_days, LearningState.streak)
+            .where(LearningState.user_id == user_id, LearningState.question_id.in_(ids[start:start + REBUILD_BATCH_SIZE]))
+        )
+        current.update((qid, (ease, interval_days, streak)) for qid, ease, interval_days, streak in rows)
+
+    upsert_replace(
+        LearningState.__table__,
+        [
+            _state_row(user_id, qid, schedule(current.get(qid), is_correct, now), now)
+            for qid, is_correct in answers.items()
+        ],
+        ["user_id", "question_id"],
+        _VALUE_COLUMNS,
+    )
+
+
+def due_question_ids(user_id, now, limit, bank):
+    """
+    期限が来た問題の ID を、期限の古い順に limit 問まで返す（問題バンクにない問題の行は消す）
+    """
+    rows = db.session.scalars(
+        select(LearningState.question_id)
+        .where(LearningState.user_id == user_id, LearningState.next_due <= now)
+        .order_by(LearningState.next_due)
+        .limit(limit + DUE_LOOKAHEAD)
+    ).all()
+    missing = [qid for qid in rows if bank.get(qid) is None]
+    if missing:
+        db.session.execute(
+            delete(LearningState)
+            .where(LearningState.user_id == user_id, LearningState.question_id.in_(missing))
+        )
+    return [qid for qid in rows if bank.get(qid) is not None][:limit]
+
+
+def due_count(user_id, now):
+    """
+    期限が来た問題の数（DUE_COUNT_LIMIT を超えたら DUE_COUNT_LIMIT + 1 を返す）
+    """
+    due = (
+        select(LearningState.question_id)
+        .where(LearningState.user_id == user_id, LearningState.next_due <= now)
+        .limit(DUE_COUNT_LIMIT + 1)
+        .subquery()
+    )
+    return db.session.scalar(select(func.count()).select_from(due))
+
+
+def rebuild_learning_states(user_id=None):
+    """
+    quiz_answers の回答を古い順にたどって、復習の予定を作り直す（user_id 指定時はそのユーザーのみ）。
+    呼び出し側で commit すること
+    """
+    query = (
+        select(QuizAnswer.user_id, QuizAnswer.question_id, QuizAnswer.is_correct, QuizAnswer.timestamp)
+        .where(QuizAnswer.timestamp.isnot(None))
+        .order_by(QuizAnswer.user_id, QuizAnswer.timestamp, QuizAnswer.id)
+        .execution_options(yield_per=REBUILD_BATCH_SIZE)
+    )
+    state_delete = delete(LearningState)
+    if user_id is not None:
+        query = query.where(QuizAnswer.user_id == user_id)
+        state_delete = state_delete.where(LearningState.user_id == user_id)
+
+    # ユーザーごとに {問題ID: (ease, 間隔, 連続正解数, 次に復習する日時, 最後に回答した日時)} を作り、
+    # ユーザーが替わるたびに書き出す
+    states = {}
+    current_user = None
+    count = 0
+    rows = []
+
+    def flush_user():
+        nonlocal count
+        rows.extend(
+            {"user_id": current_user, "question_id": qid, "ease": ease, "interval_days": interval_days,
+             "streak": streak, "next_due": next_due, "last_reviewed": reviewed}
+            for qid, (ease, interval_days, streak, next_due, reviewed) in states.items()
+        )
+        count += len(states)
+        states.clear()
+
+    db.session.execute(state_delete)
+    for uid, qid, is_correct, timestamp in db.session.execute(query):
+        if uid != current_user:
+            flush_user()
+            current_user = uid
+        previous = states.get(qid)
+        scheduled = schedule(previous[:3] if previous else None, is_correct, timestamp)
+        states[qid] = scheduled + (timestamp,)
+        if len(rows) >= REBUILD_BATCH_SIZE:
+            db.session.execute(LearningState.__table__.insert(), rows)
+            rows.clear()
+    flush_user()
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        db.session.execute(LearningState.__table__.insert(), rows[start:start + REBUILD_BATCH_SIZE])
+    return count
@@ -0,0 +1,318 @@
+/*
+ * 試験の画面と結果の画面
+ *
+ * 画面には最初のページだけが埋め込まれている（<script type="application/json">）。
+ * 残りのページは JSON API から読み込み、次のページは表示中に先読みしておく。
+ *
+ * ・試験: 回答はブラウザ側（sessionStorage）に持ち、提出するときに
+ *   question_<問題ID> の hidden input にしてフォームに付ける
+ * ・結果: 「続きを表示」で次のページを追加し、「解説を表示」で解説と参照URLを読み込む
+ */
+(function () {
+    'use strict';
+
+    function readConfig(id) {
+        var element = document.getElementById(id);
+        return element ? JSON.parse(element.textContent) : null;
+    }
+
+    function el(tag, className, text) {
+        var node = document.createElement(tag);
+        if (className) {
+            node.className = className;
+        }
+        if (text !== undefined && text !== null) {
+            node.textContent = text;
+        }
+        return node;
+    }
+
+    function fetchJson(url) {
+        return fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.json();
+            });
+    }
+
+    function pageUrl(base, params) {
+        var query = Object.keys(params).map(function (key) {
+            return encodeURIComponent(key) + '=' + encodeURIComponent(params[key]);
+        }).join('&');
+        return base + (base.indexOf('?') === -1 ? '?' : '&') + query;
+    }
+
+    // ---- 試験 ----
+
+    function initExam(config) {
+        var form = document.getElementById('exam-form');
+        var container = document.getElementById('exam-questions');
+        var prevButton = document.getElementById('exam-prev');
+        var nextButton = document.getElementById('exam-next');
+        var pageLabel = document.getElementById('exam-page-label');
+        var answeredLabel = document.getElementById('exam-answered');
+
+        var pageSize = config.page_size;
+        var pageCount = Math.max(1, Math.ceil(config.total / pageSize));
+        var pages = { 0: Promise.resolve(config.first_page) };
+        var current = 0;
+
+        var storageKey = 'exam_answers:' + config.exam_token;
+        var answers = {};
+        try {
+            answers = JSON.parse(window.sessionStorage.getItem(storageKey)) || {};
+        } catch (e) {
+            answers = {};
+        }
+
+        function saveAnswers() {
+            try {
+                window.sessionStorage.setItem(storageKey, JSON.stringify(answers));
+            } catch (e) {
+                // 保存できなくても、この画面を開いている間は回答を持っている
+            }
+            answeredLabel.textContent = '回答済み ' + Object.keys(answers).length + ' / ' + config.total + ' 問';
+        }
+
+        function loadPage(index) {
+            if (!(index in pages)) {
+                pages[index] = fetchJson(pageUrl(config.questions_url, {
+                    token: config.exam_token, offset: index * pageSize, limit: pageSize
+                })).then(function (data) {
+                    return data.items;
+                }).catch(function (error) {
+                    delete pages[index]; // 次に開いたときに読み込み直す
+                    throw error;
+                });
+            }
+            return pages[index];
+        }
+
+        function renderQuestion(item) {
+            var card = el('div', 'card');
+            var body = el('div', 'card-body');
+            body.appendChild(el('h5', 'card-title', '問題 ' + item.number));
+            body.appendChild(el('p', 'card-text', item.question));
+
+            var choices = el('div', 'mb-3');
+            item.choices.forEach(function (text, i) {
+                var value = String(i + 1);
+                var inputId = 'choice_' + item.id + '_' + value;
+                var wrapper = el('div', 'form-check');
+                var input = el('input', 'form-check-input');
+                input.type = 'radio';
+                input.name = 'answer_' + item.id;
+                input.id = inputId;
+                input.value = value;
+                input.checked = answers[item.id] === value;
+                input.addEventListener('change', function () {
+                    answers[item.id] = value;
+                    saveAnswers();
+                });
+                var label = el('label', 'form-check-label', text);
+                label.htmlFor = inputId;
+                wrapper.appendChild(input);
+                wrapper.appendChild(label);
+                choices.appendChild(wrapper);
+            });
+            body.appendChild(choices);
+            card.appendChild(body);
+            return card;
+        }
+
+        function show(index) {
+            current = index;
+            pageLabel.textContent = (index + 1) + ' / ' + pageCount + ' ページ';
+            prevButton.disabled = index === 0;
+            nextButton.disabled = index >= pageCount - 1;
+
+            loadPage(index).then(function (items) {
+                if (current !== index) {
+                    return;
+                }
+                container.replaceChildren.apply(container, items.map(renderQuestion));
+                if (index + 1 < pageCount) {
+                    loadPage(index + 1).catch(function () {}); // 先読み
+                }
+            }).catch(function () {
+                if (current === index) {
+                    container.replaceChildren(el('div', 'alert alert-danger', '問題を読み込めませんでした。もう一度お試しください。'));
+                }
+            });
+        }
+
+        prevButton.addEventListener('click', function () {
+            if (current > 0) {
+                show(current - 1);
+                window.scrollTo(0, 0);
+            }
+        });
+        nextButton.addEventListener('click', function () {
+            if (current < pageCount - 1) {
+                show(current + 1);
+                window.scrollTo(0, 0);
+            }
+        });
+
+        form.addEventListener('submit', function () {
+            form.querySelectorAll('input.exam-answer').forEach(function (input) {
+                input.remove();
+            });
+            Object.keys(answers).forEach(function (questionId) {
+                var input = el('input', 'exam-answer');
+                input.type = 'hidden';
+                input.name = 'question_' + questionId;
+                input.value = answers[questionId];
+                form.appendChild(input);
+            });
+            try {
+                window.sessionStorage.removeItem(storageKey);
+            } catch (e) {
+                // 何もしない
+            }
+        });
+
+        saveAnswers();
+        show(0);
+    }
+
+    // ---- 結果 ----
+
+    function initReview(config) {
+        var container = document.getElementById('review-items');
+        var moreButton = document.getElementById('review-more');
+        var loaded = 0;
+
+        function renderChoice(item, text, i) {
+            var index = i + 1;
+            var isSelected = index === item.selected;
+            var isCorrectChoice = index === item.correct;
+            var state = '';
+            var icon = null;
+            if (isSelected && item.is_correct) {
+                state = ' correct';
+                icon = el('span', 'status-icon correct', '✔');
+            } else if (isSelected) {
+                state = ' incorrect';
+                icon = el('span', 'status-icon incorrect', '✖');
+            } else if (isCorrectChoice) {
+                state = ' correct';
+                icon = el('span', 'status-icon correct', '✔');
+            }
+            var row = el('div', 'choice-item' + state);
+            var iconContainer = el('div', 'icon-container');
+            if (icon) {
+                iconContainer.appendChild(icon);
+            }
+            row.appendChild(iconContainer);
+            row.appendChild(el('span', 'choice-label', text));
+            return row;
+        }
+
+        function renderExplanation(data) {
+            var fragment = document.createDocumentFragment();
+            if (data.rationale) {
+                var rationale = el('div', 'custom-rationale-bg alert mt-3');
+                rationale.appendChild(el('strong', null, '解説:'));
+                rationale.appendChild(el('br'));
+                rationale.appendChild(document.createTextNode(data.rationale));
+                fragment.appendChild(rationale);
+            }
+            if (data.reference) {
+                var reference = el('div', 'custom-reference-bg alert');
+                reference.appendChild(el('strong', null, '参照URL:'));
+                reference.appendChild(el('br'));
+                if (/^https?:\/\//i.test(data.reference)) {
+                    var link = el('a', null, data.reference);
+                    link.href = data.reference;
+                    link.target = '_blank';
+                    link.rel = 'noopener';
+                    reference.appendChild(link);
+                } else {
+                    reference.appendChild(document.createTextNode(data.reference));
+                }
+                fragment.appendChild(reference);
+            }
+            return fragment;
+        }
+
+        function renderItem(item) {
+            var card = el('div', 'card');
+            var body = el('div', 'card-body');
+            var title = el('h5', 'card-title', '問題 ' + item.number + ' ');
+            title.appendChild(item.is_correct
+                ? el('span', 'badge bg-success', '正解')
+                : el('span', 'badge bg-danger', '不正解'));
+            body.appendChild(title);
+            body.appendChild(el('p', 'card-text', item.question));
+
+            var choices = el('div', 'mb-3');
+            item.choices.forEach(function (text, i) {
+                choices.appendChild(renderChoice(item, text, i));
+            });
+            body.appendChild(choices);
+
+            if (item.has_explanation && config.explanation_url) {
+                var button = el('button', 'btn btn-outline-secondary btn-sm', '解説を表示');
+                button.type = 'button';
+                button.addEventListener('click', function () {
+                    button.disabled = true;
+                    fetchJson(config.explanation_url.replace(/\/0$/, '/' + item.id))
+                        .then(function (data) {
+                            button.replaceWith(renderExplanation(data));
+                        })
+                        .catch(function () {
+                            button.disabled = false;
+                            button.textContent = '解説を読み込めませんでした（もう一度表示）';
+                        });
+                });
+                body.appendChild(button);
+            }
+            card.appendChild(body);
+            return card;
+        }
+
+        function append(items) {
+            items.forEach(function (item) {
+                container.appendChild(renderItem(item));
+            });
+            loaded += items.length;
+            var remaining = config.total - loaded;
+            if (remaining > 0 && config.answers_url && items.length > 0) {
+                moreButton.textContent = '続きを表示（残り ' + remaining + ' 問）';
+                moreButton.hidden = false;
+            } else {
+                moreButton.hidden = true;
+            }
+        }
+
+        moreButton.addEventListener('click', function () {
+            moreButton.disabled = true;
+            fetchJson(pageUrl(config.answers_url, { offset: loaded, limit: config.page_size }))
+                .then(function (data) {
+                    append(data.items);
+                })
+                .catch(function () {
+                    moreButton.textContent = '読み込めませんでした（もう一度表示）';
+                })
+                .then(function () {
+                    moreButton.disabled = false;
+                });
+        });
+
+        append(config.first_page);
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var exam = readConfig('exam-config');
+        if (exam) {
+            initExam(exam);
+        }
+        var review = readConfig('review-config');
+        if (review) {
+            initReview(review);
+        }
+    });
+})();
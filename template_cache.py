@@ -0,0 +1,39 @@
+"""
+Jinja テンプレートのバイトコードキャッシュ
+
+テンプレートをコンパイルした結果（Python のバイトコード）をファイルに保存し、
+新しく起動したワーカーでも最初のリクエストからコンパイルせずに済むようにする。
+テンプレートを書き換えた場合は、Jinja がソースのチェックサムで検知してコンパイルし直す。
+
+デプロイ時に precompile_templates.py を実行しておけば、全テンプレートのキャッシュが揃う。
+JINJA_BYTECODE_CACHE_DIR を空にするとキャッシュを使わない。
+"""
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+
+def default_cache_dir(app):
+    return os.path.join(app.instance_path, "jinja_cache")
+
+
+def init_template_cache(app):
+    cache_dir = app.config.get("JINJA_BYTECODE_CACHE_DIR")
+    if cache_dir is None:
+        cache_dir = default_cache_dir(app)
+    if not cache_dir:
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    return cache_dir
+
+
+def precompile_templates(app):
+    """
+    すべてのテンプレートを読み込み、バイトコードキャッシュに書き出す。読み込んだテンプレート名を返す
+    """
+    env = app.jinja_env
+    names = [name for name in env.list_templates() if name.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return names
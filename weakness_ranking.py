@@ -0,0 +1,155 @@
+"""
+正答率の低い順（苦手順）に問題を取り出すためのランキング
+
+リクエストのたびに全問を sorted() する代わりに、
+正答率ごとのバケット（同じ正答率の問題IDのリスト）と、正答率の昇順リストを保持する。
+回答数・正解数が変わったら該当する問題だけを別のバケットへ移す。
+
+苦手な N 問の取り出しは、正答率の低いバケットから順に取り、
+最後のバケットからは random.sample で選ぶので、同じ正答率（未回答など）の問題が
+毎回ID順に並ぶことはない。
+"""
+import bisect
+import random
+import threading
+import time
+
+from database import db
+from model import Question
+
+DEFAULT_RESYNC_INTERVAL = 60.0  # 他ワーカーの書き込みを取り込むため、この秒数ごとにDBと再同期する
+
+
+def accuracy_rate(total, correct):
+    # 未回答は 0.0 として最優先
+    if not total:
+        return 0.0
+    return correct / total
+
+
+class _RateBucket:
+    """
+    同じ正答率の問題ID集合。削除を O(1) にするため位置を覚えておく
+    """
+
+    __slots__ = ("ids", "positions")
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def add(self, qid):
+        self.positions[qid] = len(self.ids)
+        self.ids.append(qid)
+
+    def remove(self, qid):
+        pos = self.positions.pop(qid)
+        last = self.ids.pop()
+        if last != qid:
+            self.ids[pos] = last
+            self.positions[last] = pos
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class WeaknessRanking:
+
+    def __init__(self, resync_interval=DEFAULT_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.version = None
+        self._counts = {}   # {question_id: (total, correct)}
+        self._buckets = {}  # {rate: _RateBucket}
+        self._rates = []    # バケットの正答率（昇順）
+        self._synced_at = None
+        self._lock = threading.RLock()
+
+    def rebuild(self, version, rows):
+        """
+        (id, total_count, correct_count) の列からランキングを作り直す
+        """
+        with self._lock:
+            self._counts = {}
+            self._buckets = {}
+            self._rates = []
+            for qid, total, correct in rows:
+                self._counts[qid] = (total, correct)
+                self._insert(qid, accuracy_rate(total, correct))
+            self.version = version
+            self._synced_at = time.monotonic()
+
+    def apply(self, deltas):
+        """
+        回答数・正解数の差分 {question_id: (total, correct)} を反映する
+        """
+        with self._lock:
+            for qid, (d_total, d_correct) in deltas.items():
+                counts = self._counts.get(qid)
+                if counts is None:
+                    # まだ読み込んでいない（または削除された）問題は次回の再同期に任せる
+                    continue
+                total, correct = counts[0] + d_total, counts[1] + d_correct
+                self._counts[qid] = (total, correct)
+                old_rate = accuracy_rate(*counts)
+                new_rate = accuracy_rate(total, correct)
+                if new_rate != old_rate:
+                    self._discard(qid, old_rate)
+                    self._insert(qid, new_rate)
+
+    def weakest(self, n, rng=random):
+        """
+        正答率の低い順に n 問の問題IDを返す（同じ正答率の中ではランダム）
+        """
+        picked = []
+        with self._lock:
+            for rate in self._rates:
+                remaining = n - len(picked)
+                if remaining <= 0:
+                    break
+                ids = self._buckets[rate].ids
+                if len(ids) <= remaining:
+                    picked.extend(ids)
+                else:
+                    picked.extend(rng.sample(ids, remaining))
+        return picked
+
+    def is_stale(self, version):
+        if self.version != version or self._synced_at is None:
+            return True
+        return time.monotonic() - self._synced_at >= self.resync_interval
+
+    def _insert(self, qid, rate):
+        bucket = self._buckets.get(rate)
+        if bucket is None:
+            bucket = self._buckets[rate] = _RateBucket()
+            bisect.insort(self._rates, rate)
+        bucket.add(qid)
+
+    def _discard(self, qid, rate):
+        bucket = self._buckets[rate]
+        bucket.remove(qid)
+        if not bucket:
+            del self._buckets[rate]
+            del self._rates[bisect.bisect_left(self._rates, rate)]
+
+
+weakness_ranking = WeaknessRanking()
+
+
+def weakest_question_ids(bank, n, rng=random):
+    """
+    問題バンク（question_cache のスナップショット）に対して苦手な n 問のIDを返す。
+    問題バンクが変わったか、再同期の間隔を過ぎていればDBの集計値を読み直す
+    """
+    if weakness_ranking.is_stale(bank.version):
+        rows = db.session.query(Question.id, Question.total_count, Question.correct_count).all()
+        weakness_ranking.rebuild(bank.version, rows)
+    return weakness_ranking.weakest(n, rng)
+
+
+def init_weakness_ranking(app, answer_buffer):
+    weakness_ranking.resync_interval = app.config.get(
+        "WEAKNESS_RANKING_RESYNC_INTERVAL", DEFAULT_RESYNC_INTERVAL
+    )
+    # 自プロセスで書き込んだ差分は再同期を待たずに反映する
+    answer_buffer.add_listener(weakness_ranking.apply)